@@ -30,10 +30,15 @@ class MessageType:  # 接受消息大类
 class NoticeType:  # 通知事件
     friend_recall = "friend_recall"  # 私聊消息撤回
     group_recall = "group_recall"  # 群聊消息撤回
+    group_card = "group_card"  # 群成员名片变更
+    group_increase = "group_increase"  # 群成员增加
+    group_decrease = "group_decrease"  # 群成员减少
+    group_admin = "group_admin"  # 群管理员变动
     notify = "notify"
 
     class Notify:
         poke = "poke"  # 戳一戳
+        group_name = "group_name"  # 群名称变更
 
 
 class RealMessageType:  # 实际消息分类
@@ -0,0 +1,234 @@
+import asyncio
+import base64
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import global_config
+from .logger import logger
+from .utils import image_downloader
+
+
+class ImageCache:
+    """
+    按内容寻址的图片缓存
+
+    图片原始数据以内容的sha256为文件名存放在磁盘上，同一张图片只存一份；
+    URL和文件ID分别映射到内容哈希，复用的表情包无论URL是否变化都能命中。
+    内存中保留最近使用的图片及其检测出的类型和Base64编码，按总字节数淘汰。
+    磁盘读写和淘汰都在线程中进行，不阻塞事件循环。
+    """
+
+    MEMORY_MAX_BYTES = 64 * 1024 * 1024
+    DISK_MAX_BYTES = 512 * 1024 * 1024
+    KEY_INDEX_SIZE = 20000  # 内存中保留的URL/文件ID映射数
+    DISK_CHECK_INTERVAL = 100  # 每写入多少个文件检查一次磁盘占用
+    DISK_BLOCK_SIZE = 4096  # 映射文件很小，按一个磁盘块计算占用
+
+    def __init__(self, detect: Callable[[bytes], int], cache_dir: Optional[str] = None):
+        """
+        Parameters:
+            detect: Callable[[bytes], int]: 通过文件头检测图片类型的函数
+            cache_dir: str: 磁盘缓存目录
+        """
+        self.detect = detect
+        self.cache_dir = cache_dir or os.path.join(global_config.root_path, "data", "image_cache")
+        self._keys: OrderedDict[str, str] = OrderedDict()  # URL/文件ID -> 内容哈希
+        self._memory: OrderedDict[str, list] = OrderedDict()  # 内容哈希 -> [原始数据, 类型, Base64]
+        self._memory_bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}  # 正在读取或下载的图片，以第一个键区分
+        self._writes_since_check = 0
+        self._evict_task: Optional[asyncio.Task] = None
+        os.makedirs(os.path.join(self.cache_dir, "keys"), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, "blobs"), exist_ok=True)
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "keys", hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def _blob_path(self, content_hash: str, image_type: int) -> str:
+        return os.path.join(self.cache_dir, "blobs", f"{content_hash}.{image_type}")
+
+    def _remember_key(self, key: str, content_hash: str) -> None:
+        self._keys[key] = content_hash
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.KEY_INDEX_SIZE:
+            self._keys.popitem(last=False)
+
+    def _remember_image(self, content_hash: str, image_bytes: bytes, image_type: int) -> list:
+        entry = self._memory.get(content_hash)
+        if entry is None:
+            entry = [image_bytes, image_type, None]
+            self._memory[content_hash] = entry
+            self._memory_bytes += len(image_bytes)
+            while self._memory_bytes > self.MEMORY_MAX_BYTES and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted[0])
+        self._memory.move_to_end(content_hash)
+        return entry
+
+    def _read_from_disk(self, key: str) -> Optional[Tuple[str, int, bytes]]:
+        """在线程中调用：读取URL/文件ID映射的图片，并更新映射和图片的修改时间"""
+        key_path = self._key_path(key)
+        try:
+            with open(key_path, "r", encoding="utf-8") as f:
+                content_hash, image_type = f.read().split()
+            image_type = int(image_type)
+            blob_path = self._blob_path(content_hash, image_type)
+            with open(blob_path, "rb") as f:
+                image_bytes = f.read()
+        except (OSError, ValueError):
+            return None
+        self._touch(key_path)
+        self._touch(blob_path)
+        return content_hash, image_type, image_bytes
+
+    def _write_to_disk(self, keys: List[str], content_hash: str, image_type: int, image_bytes: bytes) -> int:
+        """在线程中调用：写入映射和图片，返回写入的文件数"""
+        written = 0
+        try:
+            for key in keys:
+                self._write_file(self._key_path(key), f"{content_hash} {image_type}".encode("utf-8"))
+                written += 1
+            # 图片在映射之后写入或更新时间，保证图片不早于指向它的映射被淘汰
+            blob_path = self._blob_path(content_hash, image_type)
+            if os.path.exists(blob_path):
+                self._touch(blob_path)
+            else:
+                self._write_file(blob_path, image_bytes)
+                written += 1
+        except OSError as e:
+            logger.warning(f"图片缓存写入磁盘失败: {e}")
+        return written
+
+    async def _store(self, keys: List[str], image_bytes: bytes) -> list:
+        """保存新下载的图片，同样内容的图片只检测和写入一次"""
+        content_hash = hashlib.sha256(image_bytes).hexdigest()
+        entry = self._memory.get(content_hash)
+        image_type = entry[1] if entry is not None else self.detect(image_bytes)
+        entry = self._remember_image(content_hash, image_bytes, image_type)
+        for key in keys:
+            self._remember_key(key, content_hash)
+
+        written = await asyncio.to_thread(self._write_to_disk, keys, content_hash, image_type, image_bytes)
+        self._writes_since_check += written
+        if self._writes_since_check >= self.DISK_CHECK_INTERVAL and (
+            self._evict_task is None or self._evict_task.done()
+        ):
+            self._writes_since_check = 0
+            # 淘汰需要扫描整个缓存目录，在后台线程中进行，不推迟本次返回
+            self._evict_task = asyncio.create_task(asyncio.to_thread(self._evict_disk))
+        return entry
+
+    @staticmethod
+    def _write_file(path: str, data: bytes) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _touch_files(cls, *paths: str) -> None:
+        for path in paths:
+            cls._touch(path)
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        """更新文件的修改时间，磁盘淘汰按修改时间进行"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict_disk(self) -> None:
+        """
+        磁盘占用超过上限时按最近使用时间删除图片和映射文件
+
+        图片和映射在写入和命中时都会更新修改时间，映射被使用时也会随后更新其指向的图片，
+        所以映射总是先于其指向的图片被删除，不会留下指向已删除图片的映射。
+        """
+        try:
+            files = {}
+            for sub_dir in ("blobs", "keys"):
+                for entry in os.scandir(os.path.join(self.cache_dir, sub_dir)):
+                    if entry.is_file():
+                        stat = entry.stat()
+                        size = stat.st_size if sub_dir == "blobs" else max(stat.st_size, self.DISK_BLOCK_SIZE)
+                        # 修改时间相同时先删除映射
+                        files[entry.path] = ((stat.st_mtime, sub_dir == "blobs"), size)
+            total = sum(size for _, size in files.values())
+            if total <= self.DISK_MAX_BYTES:
+                return
+            for path, (_, size) in sorted(files.items(), key=lambda item: item[1][0]):
+                if total <= self.DISK_MAX_BYTES * 0.8:
+                    break
+                os.remove(path)
+                total -= size
+        except OSError as e:
+            logger.warning(f"清理图片缓存失败: {e}")
+
+    async def get_image(self, url: str, file_id: Optional[str] = None) -> Tuple[str, int]:
+        """
+        获取图片的Base64和类型，缓存未命中时下载
+        Parameters:
+            url: str: 图片URL
+            file_id: str: 图片的文件ID，可为空
+        Returns:
+            image_base64: str: Base64编码的图片数据
+            image_type: int: 图片子类型 (0=普通图片, 1=表情包/动画图片)
+        """
+        keys = [key for key in (f"file:{file_id}" if file_id else None, f"url:{url}") if key]
+        for key in keys:
+            content_hash = self._keys.get(key)
+            entry = self._memory.get(content_hash) if content_hash is not None else None
+            if entry is not None:
+                logger.debug(f"图片缓存命中: {key}")
+                self._keys.move_to_end(key)
+                self._memory.move_to_end(content_hash)
+                self._remember_keys(keys, content_hash)
+                await asyncio.to_thread(self._touch_files, self._key_path(key), self._blob_path(content_hash, entry[1]))
+                return self._encode(entry), entry[1]
+
+        # 读取磁盘缓存和下载放在独立的任务中，同一张图片的并发请求只执行一次，
+        # 所有请求者（包括第一个）只等待该任务，任何一个请求者被取消都不会影响其他请求者
+        task = self._inflight.get(keys[0])
+        if task is None:
+            task = asyncio.create_task(self._fetch(keys, url))
+            self._inflight[keys[0]] = task
+            task.add_done_callback(lambda done: self._finish_inflight(keys[0], done))
+        entry = await asyncio.shield(task)
+        return self._encode(entry), entry[1]
+
+    async def _fetch(self, keys: List[str], url: str) -> list:
+        """依次查找磁盘缓存，都未命中时下载"""
+        for key in keys:
+            found = await asyncio.to_thread(self._read_from_disk, key)
+            if found is not None:
+                logger.debug(f"图片缓存命中: {key}")
+                content_hash, image_type, image_bytes = found
+                entry = self._remember_image(content_hash, image_bytes, image_type)
+                # 另一个键可能还没有映射
+                self._remember_keys(keys, content_hash)
+                return entry
+
+        logger.debug(f"下载图片: {url}")
+        image_bytes = await image_downloader.download(url)
+        return await self._store(keys, image_bytes)
+
+    def _remember_keys(self, keys: List[str], content_hash: str) -> None:
+        for key in keys:
+            if key not in self._keys:
+                self._remember_key(key, content_hash)
+
+    def _finish_inflight(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有请求者都已取消时取回异常，避免未取回异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def _encode(entry: list) -> str:
+        if entry[2] is None:
+            entry[2] = base64.b64encode(entry[0]).decode("utf-8")
+        return entry[2]
@@ -24,12 +24,14 @@ from maim_message import (
 from .utils import (
     get_group_info,
     get_member_info,
-    get_image_base64,
     get_self_info,
     get_stranger_info,
     get_message_detail,
+    group_info_cache,
+    member_info_cache,
 )
 from .response_pool import get_response
+from .image_cache import ImageCache
 
 
 class RecvHandler:
@@ -38,6 +40,8 @@ class RecvHandler:
     def __init__(self):
         self.server_connection: Server.ServerConnection = None
         self.interval = global_config.napcat_heartbeat_interval
+        # 图片缓存，重复出现的图片和表情包不再下载和检测类型
+        self.image_cache = ImageCache(detect=self.detect_image_type_from_bytes)
 
     def detect_image_type_from_header(self, image_data: str) -> int:
         """
@@ -50,7 +54,20 @@ class RecvHandler:
         try:
             # 解码base64数据
             binary_data = base64.b64decode(image_data)
+        except Exception as e:
+            logger.error(f"检测图片类型时发生错误: {str(e)}")
+            return 0
+        return self.detect_image_type_from_bytes(binary_data)
 
+    def detect_image_type_from_bytes(self, binary_data: bytes) -> int:
+        """
+        通过文件头检测图片类型
+        Parameters:
+            binary_data: bytes: 图片的原始数据
+        Returns:
+            int: 图片子类型 (0=普通图片, 1=表情包/动画图片)
+        """
+        try:
             # 检查文件头魔数
             if len(binary_data) < 12:
                 logger.warning("图片数据太短，无法检测类型")
@@ -341,7 +358,6 @@ class RecvHandler:
         await self.message_process(message_base)
 
     async def handle_real_message(self, raw_message: dict, in_reply: bool = False) -> List[Seg] | None:
-        # sourcery skip: low-code-quality
         """
         处理实际消息
         Parameters:
@@ -352,73 +368,93 @@ class RecvHandler:
         real_message: list = raw_message.get("message")
         if not real_message:
             return None
+        # 各消息段互不依赖，图片下载和引用消息获取并行进行，结果按原顺序拼接
+        results = await asyncio.gather(
+            *(self.handle_sub_message(sub_message, raw_message, in_reply) for sub_message in real_message)
+        )
         seg_message: List[Seg] = []
-        for sub_message in real_message:
-            sub_message: dict
-            sub_message_type = sub_message.get("type")
-            match sub_message_type:
-                case RealMessageType.text:
-                    ret_seg = await self.handle_text_message(sub_message)
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("text处理失败")
-                case RealMessageType.face:
-                    ret_seg = await self.handle_face_message(sub_message)
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("face处理失败或不支持")
-                case RealMessageType.reply:
-                    if not in_reply:
-                        ret_seg = await self.handle_reply_message(sub_message)
-                        if ret_seg:
-                            seg_message += ret_seg
-                        else:
-                            logger.warning("reply处理失败")
-                case RealMessageType.image:
-                    ret_seg = await self.handle_image_message(sub_message)
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("image处理失败")
-                case RealMessageType.record:
-                    logger.warning("不支持语音解析")
-                case RealMessageType.video:
-                    logger.warning("不支持视频解析")
-                case RealMessageType.at:
-                    ret_seg = await self.handle_at_message(
-                        sub_message,
-                        raw_message.get("self_id"),
-                        raw_message.get("group_id"),
-                    )
-                    if ret_seg:
-                        seg_message.append(ret_seg)
-                    else:
-                        logger.warning("at处理失败")
-                case RealMessageType.rps:
-                    logger.warning("暂时不支持猜拳魔法表情解析")
-                case RealMessageType.dice:
-                    logger.warning("暂时不支持骰子表情解析")
-                case RealMessageType.shake:
-                    # 预计等价于戳一戳
-                    logger.warning("暂时不支持窗口抖动解析")
-                case RealMessageType.share:
-                    logger.warning("暂时不支持链接解析")
-                case RealMessageType.forward:
-                    messages = await self.get_forward_message(sub_message)
-                    if not messages:
-                        logger.warning("转发消息内容为空或获取失败")
-                        return None
-                    ret_seg = await self.handle_forward_message(messages)
+        for ret_segs in results:
+            if ret_segs is None:
+                return None
+            seg_message += ret_segs
+        return seg_message
+
+    async def handle_sub_message(self, sub_message: dict, raw_message: dict, in_reply: bool) -> List[Seg] | None:
+        # sourcery skip: low-code-quality
+        """
+        处理单个消息段
+        Parameters:
+            sub_message: dict: 消息段
+            raw_message: dict: 消息段所属的原始消息
+            in_reply: bool: 是否在引用消息中
+        Returns:
+            seg_message: list[Seg]: 处理后的消息段列表，整条消息需要丢弃时返回None
+        """
+        seg_message: List[Seg] = []
+        sub_message_type = sub_message.get("type")
+        match sub_message_type:
+            case RealMessageType.text:
+                ret_seg = await self.handle_text_message(sub_message)
+                if ret_seg:
+                    seg_message.append(ret_seg)
+                else:
+                    logger.warning("text处理失败")
+            case RealMessageType.face:
+                ret_seg = await self.handle_face_message(sub_message)
+                if ret_seg:
+                    seg_message.append(ret_seg)
+                else:
+                    logger.warning("face处理失败或不支持")
+            case RealMessageType.reply:
+                if not in_reply:
+                    ret_seg = await self.handle_reply_message(sub_message)
                     if ret_seg:
-                        seg_message.append(ret_seg)
+                        seg_message += ret_seg
                     else:
-                        logger.warning("转发消息处理失败")
-                case RealMessageType.node:
-                    logger.warning("不支持转发消息节点解析")
-                case _:
-                    logger.warning(f"未知消息类型: {sub_message_type}")
+                        logger.warning("reply处理失败")
+            case RealMessageType.image:
+                ret_seg = await self.handle_image_message(sub_message)
+                if ret_seg:
+                    seg_message.append(ret_seg)
+                else:
+                    logger.warning("image处理失败")
+            case RealMessageType.record:
+                logger.warning("不支持语音解析")
+            case RealMessageType.video:
+                logger.warning("不支持视频解析")
+            case RealMessageType.at:
+                ret_seg = await self.handle_at_message(
+                    sub_message,
+                    raw_message.get("self_id"),
+                    raw_message.get("group_id"),
+                )
+                if ret_seg:
+                    seg_message.append(ret_seg)
+                else:
+                    logger.warning("at处理失败")
+            case RealMessageType.rps:
+                logger.warning("暂时不支持猜拳魔法表情解析")
+            case RealMessageType.dice:
+                logger.warning("暂时不支持骰子表情解析")
+            case RealMessageType.shake:
+                # 预计等价于戳一戳
+                logger.warning("暂时不支持窗口抖动解析")
+            case RealMessageType.share:
+                logger.warning("暂时不支持链接解析")
+            case RealMessageType.forward:
+                messages = await self.get_forward_message(sub_message)
+                if not messages:
+                    logger.warning("转发消息内容为空或获取失败")
+                    return None
+                ret_seg = await self.handle_forward_message(messages)
+                if ret_seg:
+                    seg_message.append(ret_seg)
+                else:
+                    logger.warning("转发消息处理失败")
+            case RealMessageType.node:
+                logger.warning("不支持转发消息节点解析")
+            case _:
+                logger.warning(f"未知消息类型: {sub_message_type}")
         return seg_message
 
     async def handle_text_message(self, raw_message: dict) -> Seg:
@@ -475,7 +511,8 @@ class RecvHandler:
         logger.debug(f"处理图片消息：URL={image_url}, sub_type={image_sub_type}")
 
         try:
-            image_base64 = await get_image_base64(image_url)
+            # 缓存中同时保存了通过文件头检测出的类型
+            image_base64, header_type = await self.image_cache.get_image(image_url, message_data.get("file"))
         except Exception as e:
             logger.error(f"图片消息处理失败: {str(e)}")
             return None
@@ -485,7 +522,7 @@ class RecvHandler:
             logger.warning(f"图片子类型为{image_sub_type}，使用文件头检测图片类型")
 
             # 首先尝试通过文件内容检测
-            detected_type = self.detect_image_type_from_header(image_base64)
+            detected_type = header_type
             if detected_type is not None:
                 image_sub_type = detected_type
                 logger.info(f"通过文件头检测到图片类型：{image_sub_type}")
@@ -505,8 +542,7 @@ class RecvHandler:
         else:
             # 对于其他未知的sub_type，通过文件头重新检测
             logger.warning(f"未知的图片子类型：{image_sub_type}，重新检测")
-            detected_type = self.detect_image_type_from_header(image_base64)
-            if detected_type == 1:
+            if header_type == 1:
                 return Seg(type="emoji", data=image_base64)
             else:
                 return Seg(type="image", data=image_base64)
@@ -605,6 +641,30 @@ class RecvHandler:
         seg_message.append(Seg(type="text", data="]，说："))
         return seg_message
 
+    def invalidate_info_cache(self, raw_message: dict) -> bool:
+        """
+        群信息或群成员信息变更时使对应的缓存失效
+        Parameters:
+            raw_message: dict: 原始notice消息
+        Returns:
+            bool: 是否为仅用于更新缓存的notice
+        """
+        notice_type = raw_message.get("notice_type")
+        group_id = raw_message.get("group_id")
+        user_id = raw_message.get("user_id")
+        match notice_type:
+            case NoticeType.group_card | NoticeType.group_admin:
+                member_info_cache.invalidate((group_id, user_id))
+            case NoticeType.group_increase | NoticeType.group_decrease:
+                member_info_cache.invalidate((group_id, user_id))
+                group_info_cache.invalidate(group_id)  # 群成员数量变化
+            case NoticeType.notify if raw_message.get("sub_type") == NoticeType.Notify.group_name:
+                group_info_cache.invalidate(group_id)
+            case _:
+                return False
+        logger.debug(f"{notice_type}通知，已刷新群{group_id}用户{user_id}的信息缓存")
+        return True
+
     async def handle_notice(self, raw_message: dict) -> None:
         notice_type = raw_message.get("notice_type")
         # message_time: int = raw_message.get("time")
@@ -613,6 +673,9 @@ class RecvHandler:
         group_id = raw_message.get("group_id")
         user_id = raw_message.get("user_id")
 
+        if self.invalidate_info_cache(raw_message):
+            return None
+
         if not self.check_allow_to_chat(user_id, group_id):
             logger.warning("notice消息被丢弃")
             return None
@@ -769,15 +832,15 @@ class RecvHandler:
         # sourcery skip: merge-else-if-into-elif
         if to_image:
             if seg_data.type == "seglist":
-                new_seg_list = []
-                for i_seg in seg_data.data:
-                    parsed_seg = await self._recursive_parse_image_seg(i_seg, to_image)
-                    new_seg_list.append(parsed_seg)
-                return Seg(type="seglist", data=new_seg_list)
+                # 并行下载同一层中的所有图片
+                new_seg_list = await asyncio.gather(
+                    *(self._recursive_parse_image_seg(i_seg, to_image) for i_seg in seg_data.data)
+                )
+                return Seg(type="seglist", data=list(new_seg_list))
             elif seg_data.type == "image":
                 image_url = seg_data.data
                 try:
-                    encoded_image = await get_image_base64(image_url)
+                    encoded_image, _ = await self.image_cache.get_image(image_url)
                 except Exception as e:
                     logger.error(f"图片处理失败: {str(e)}")
                     return Seg(type="text", data="[图片]")
@@ -785,7 +848,7 @@ class RecvHandler:
             elif seg_data.type == "emoji":
                 image_url = seg_data.data
                 try:
-                    encoded_image = await get_image_base64(image_url)
+                    encoded_image, _ = await self.image_cache.get_image(image_url)
                 except Exception as e:
                     logger.error(f"图片处理失败: {str(e)}")
                     return Seg(type="text", data="[表情包]")
@@ -823,6 +886,26 @@ class RecvHandler:
         image_count = 0
         if message_list is None:
             return None, 0
+
+        # 子类型未知的图片需要下载后通过文件头检测，先并行下载检测
+        unknown_type_urls = []
+        for sub_message in message_list:
+            message_of_sub_message_list = sub_message.get("message")
+            if not message_of_sub_message_list:
+                continue
+            message_of_sub_message = message_of_sub_message_list[0]
+            if message_of_sub_message.get("type") == RealMessageType.image:
+                image_data = message_of_sub_message.get("data")
+                if image_data.get("sub_type") in (None, "none"):
+                    unknown_type_urls.append(image_data.get("url"))
+        detected_types = dict(
+            zip(
+                unknown_type_urls,
+                await asyncio.gather(*(self._detect_forward_image_type(url) for url in unknown_type_urls)),
+                strict=True,
+            )
+        )
+
         for sub_message in message_list:
             sub_message: dict
             sender_info: dict = sub_message.get("sender")
@@ -882,18 +965,7 @@ class RecvHandler:
 
                 # 处理sub_type为None或"none"的情况 - 在转发消息中也使用文件头检测
                 if sub_type is None or sub_type == "none":
-                    logger.warning(f"转发消息中图片子类型为{sub_type}，使用文件头检测")
-                    try:
-                        # 获取图片数据进行检测
-                        image_base64 = await get_image_base64(image_url)
-                        detected_type = self.detect_image_type_from_header(image_base64)
-                        sub_type = detected_type
-                        logger.info(f"转发消息中通过文件头检测到图片类型：{sub_type}")
-                    except Exception as e:
-                        logger.error(f"转发消息中图片类型检测失败: {str(e)}")
-                        # 如果检测失败，尝试通过URL检测
-                        sub_type = self.detect_image_type_from_url(image_url)
-                        logger.info(f"转发消息中通过URL检测到图片类型：{sub_type}")
+                    sub_type = detected_types[image_url]
 
                 if sub_type == 0:
                     seg_data = Seg(type="image", data=image_url)
@@ -915,6 +987,20 @@ class RecvHandler:
                 seg_list.append(full_seg_data)
         return Seg(type="seglist", data=seg_list), image_count
 
+    async def _detect_forward_image_type(self, image_url: str) -> int:
+        """下载转发消息中子类型未知的图片，通过文件头检测类型"""
+        logger.warning("转发消息中图片子类型未知，使用文件头检测")
+        try:
+            # 获取图片数据进行检测，检测结果随图片一起缓存
+            _, sub_type = await self.image_cache.get_image(image_url)
+            logger.info(f"转发消息中通过文件头检测到图片类型：{sub_type}")
+        except Exception as e:
+            logger.error(f"转发消息中图片类型检测失败: {str(e)}")
+            # 如果检测失败，尝试通过URL检测
+            sub_type = self.detect_image_type_from_url(image_url)
+            logger.info(f"转发消息中通过URL检测到图片类型：{sub_type}")
+        return sub_type
+
     async def message_process(self, message_base: MessageBase) -> None:
         try:
             await self.maibot_router.send_message(message_base)
@@ -4,41 +4,46 @@ from typing import Dict
 from .config import global_config
 from .logger import logger
 
-response_dict: Dict = {}
-response_time_dict: Dict = {}
+response_futures: Dict[str, asyncio.Future] = {}  # echo -> 等待响应的Future
+unclaimed_time_dict: Dict[str, float] = {}  # 先于 get_response 到达、尚未被取走的响应 echo -> 到达时间
 
 
-async def get_response(request_id: str) -> dict:
-    retry_count = 0
-    max_retries = 50  # 10秒超时
-    while request_id not in response_dict:
-        retry_count += 1
-        if retry_count >= max_retries:
-            raise TimeoutError(f"请求超时，未收到响应，request_id: {request_id}")
-        await asyncio.sleep(0.2)
-    response = response_dict.pop(request_id)
-    _ = response_time_dict.pop(request_id)
-    logger.trace(f"响应信息id: {request_id} 已从响应字典中取出")
+async def get_response(request_id: str, timeout: float = 10) -> dict:
+    future = response_futures.get(request_id)
+    if future is None:
+        future = asyncio.get_running_loop().create_future()
+        response_futures[request_id] = future
+    unclaimed_time_dict.pop(request_id, None)
+    try:
+        response = await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"请求超时，未收到响应，request_id: {request_id}") from None
+    finally:
+        response_futures.pop(request_id, None)
+    logger.trace(f"响应信息id: {request_id} 已取出")
     return response
 
 
 async def put_response(response: dict):
     echo_id = response.get("echo")
-    now_time = time.time()
-    response_dict[echo_id] = response
-    response_time_dict[echo_id] = now_time
-    logger.trace(f"响应信息id: {echo_id} 已存入响应字典")
+    future = response_futures.get(echo_id)
+    if future is None:
+        # 响应可能在请求方调用 get_response 之前到达，先保存等待取走
+        future = asyncio.get_running_loop().create_future()
+        response_futures[echo_id] = future
+        unclaimed_time_dict[echo_id] = time.time()
+        _drop_expired_unclaimed()
+    if not future.done():
+        future.set_result(response)
+    logger.trace(f"响应信息id: {echo_id} 已送达")
 
 
-async def check_timeout_response() -> None:
-    while True:
-        cleaned_message_count: int = 0
-        now_time = time.time()
-        for echo_id, response_time in list(response_time_dict.items()):
-            if now_time - response_time > global_config.napcat_heartbeat_interval:
-                cleaned_message_count += 1
-                response_dict.pop(echo_id)
-                response_time_dict.pop(echo_id)
-                logger.warning(f"响应消息 {echo_id} 超时，已删除")
-        logger.info(f"已删除 {cleaned_message_count} 条超时响应消息")
-        await asyncio.sleep(global_config.napcat_heartbeat_interval)
+def _drop_expired_unclaimed() -> None:
+    """删除长时间无人取走的响应，按到达顺序检查，遇到未过期的即停止"""
+    now_time = time.time()
+    for echo_id, response_time in list(unclaimed_time_dict.items()):
+        if now_time - response_time <= global_config.napcat_heartbeat_interval:
+            break
+        unclaimed_time_dict.pop(echo_id)
+        response_futures.pop(echo_id, None)
+        logger.warning(f"响应消息 {echo_id} 超时，已删除")
@@ -2,31 +2,153 @@ import websockets as Server
 import json
 import base64
 import uuid
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
 from .logger import logger
 from .response_pool import get_response
 
-import urllib3
+import aiohttp
 import ssl
 
 from PIL import Image
 import io
 
 
-class SSLAdapter(urllib3.PoolManager):
-    def __init__(self, *args, **kwargs):
-        context = ssl.create_default_context()
-        context.set_ciphers("DEFAULT@SECLEVEL=1")
-        context.minimum_version = ssl.TLSVersion.TLSv1_2
-        kwargs["ssl_context"] = context
-        super().__init__(*args, **kwargs)
+class ImageDownloader:
+    """
+    异步图片下载器
+
+    所有下载共用一个连接池，同时进行的下载数量有上限，
+    响应按块读入内存，超过大小上限时立即中止。
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_size: int = 20 * 1024 * 1024, timeout: float = 10):
+        self.max_concurrency = max_concurrency
+        self.max_size = max_size
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: aiohttp.ClientSession = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            # QQ的图片服务器需要较低的加密等级
+            context = ssl.create_default_context()
+            context.set_ciphers("DEFAULT@SECLEVEL=1")
+            context.minimum_version = ssl.TLSVersion.TLSv1_2
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ssl=context, limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def download(self, url: str) -> bytes:
+        """
+        下载图片
+        Parameters:
+            url: str: 图片URL
+        Returns:
+            bytes: 图片的原始数据
+        """
+        async with self._semaphore:
+            async with self._get_session().get(url) as response:
+                if response.status != 200:
+                    raise Exception(f"HTTP Error: {response.status}")
+                if response.content_length and response.content_length > self.max_size:
+                    raise Exception(f"图片过大: {response.content_length} 字节")
+                buffer = io.BytesIO()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    if buffer.tell() + len(chunk) > self.max_size:
+                        raise Exception(f"图片超过大小上限 {self.max_size} 字节")
+                    buffer.write(chunk)
+                return buffer.getvalue()
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+image_downloader = ImageDownloader()
+
+
+class InfoCache:
+    """
+    带过期时间的LRU缓存
+
+    同一个键的并发查询共用一次请求，查询失败（返回None）的结果不缓存。
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[Hashable, tuple] = OrderedDict()  # 键 -> (过期时间, 值)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        获取缓存的值，不存在或已过期时调用fetch获取
+        Parameters:
+            key: Hashable: 缓存键
+            fetch: Callable: 获取值的协程函数
+        Returns:
+            Any: 缓存的值或fetch的返回值
+        """
+        cached = self._data.get(key)
+        if cached is not None:
+            expire_time, value = cached
+            if expire_time > time.time():
+                self._data.move_to_end(key)
+                return value
+            del self._data[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+            # 等待期间键可能已被失效，此时结果只返回给本次的请求者，不写入缓存
+            if value is not None and self._inflight.get(key) is future:
+                self._data[key] = (time.time() + self.ttl, value)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+            future.set_result(value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """使一个键失效"""
+        self._data.pop(key, None)
+        self._inflight.pop(key, None)
+
+
+group_info_cache = InfoCache(ttl=600, max_size=2000)  # 群号 -> 群信息
+member_info_cache = InfoCache(ttl=600, max_size=20000)  # (群号, 用户ID) -> 群成员信息
+stranger_info_cache = InfoCache(ttl=600, max_size=5000)  # 用户ID -> 陌生人信息
 
 
 async def get_group_info(websocket: Server.ServerConnection, group_id: int) -> dict:
     """
-    获取群相关信息
+    获取群相关信息，结果会缓存一段时间
 
     返回值需要处理可能为空的情况
     """
+    return await group_info_cache.get(group_id, lambda: _fetch_group_info(websocket, group_id))
+
+
+async def _fetch_group_info(websocket: Server.ServerConnection, group_id: int) -> dict:
     logger.debug("获取群聊信息中")
     request_uuid = str(uuid.uuid4())
     payload = json.dumps({"action": "get_group_info", "params": {"group_id": group_id}, "echo": request_uuid})
@@ -45,10 +167,14 @@ async def get_group_info(websocket: Server.ServerConnection, group_id: int) -> d
 
 async def get_member_info(websocket: Server.ServerConnection, group_id: int, user_id: int) -> dict:
     """
-    获取群成员信息
+    获取群成员信息，结果会缓存一段时间
 
     返回值需要处理可能为空的情况
     """
+    return await member_info_cache.get((group_id, user_id), lambda: _fetch_member_info(websocket, group_id, user_id))
+
+
+async def _fetch_member_info(websocket: Server.ServerConnection, group_id: int, user_id: int) -> dict:
     logger.debug("获取群成员信息中")
     request_uuid = str(uuid.uuid4())
     payload = json.dumps(
@@ -75,12 +201,8 @@ async def get_image_base64(url: str) -> str:
     # sourcery skip: raise-specific-error
     """获取图片/表情包的Base64"""
     logger.debug(f"下载图片: {url}")
-    http = SSLAdapter()
     try:
-        response = http.request("GET", url, timeout=10)
-        if response.status != 200:
-            raise Exception(f"HTTP Error: {response.status}")
-        image_bytes = response.data
+        image_bytes = await image_downloader.download(url)
         return base64.b64encode(image_bytes).decode("utf-8")
     except Exception as e:
         logger.error(f"图片下载失败: {str(e)}")
@@ -146,13 +268,17 @@ def get_image_format(raw_data: str) -> str:
 
 async def get_stranger_info(websocket: Server.ServerConnection, user_id: int) -> dict:
     """
-    获取陌生人信息
+    获取陌生人信息，结果会缓存一段时间
     Parameters:
         websocket: WebSocket连接对象
         user_id: 用户ID
     Returns:
         dict: 返回的陌生人信息
     """
+    return await stranger_info_cache.get(user_id, lambda: _fetch_stranger_info(websocket, user_id))
+
+
+async def _fetch_stranger_info(websocket: Server.ServerConnection, user_id: int) -> dict:
     logger.debug("获取陌生人信息中")
     request_uuid = str(uuid.uuid4())
     payload = json.dumps({"action": "get_stranger_info", "params": {"user_id": user_id}, "echo": request_uuid})
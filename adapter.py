@@ -7,7 +7,8 @@ from Adapter.src.recv_handler import recv_handler
 from Adapter.src.send_handler import send_handler
 from Adapter.src.config import global_config
 from Adapter.src.mmc_com_layer import mmc_start_com, mmc_stop_com, router
-from Adapter.src.response_pool import put_response, check_timeout_response
+from Adapter.src.response_pool import put_response
+from Adapter.src.utils import image_downloader
 
 message_queue = asyncio.Queue()
 
@@ -47,7 +48,7 @@ async def message_process():
 
 async def main():
     recv_handler.maibot_router = router
-    _ = await asyncio.gather(napcat_server(), mmc_start_com(), message_process(), check_timeout_response())
+    _ = await asyncio.gather(napcat_server(), mmc_start_com(), message_process())
 
 
 async def napcat_server():
@@ -61,6 +62,7 @@ async def graceful_shutdown():
     try:
         logger.info("正在关闭adapter...")
         await mmc_stop_com()
+        await image_downloader.close()
         tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
         for task in tasks:
             task.cancel()
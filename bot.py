@@ -13,6 +13,10 @@ from src.common.logger_manager import get_logger
 # from src.common.logger import LogConfig, CONFIRM_STYLE_CONFIG
 from src.common.crash_logger import install_crash_handler
 from src.main import MainSystem
+from src.plugins.models.utils_model import llm_session_pool
+from src.plugins.storage.write_buffer import message_write_buffer
+from src.plugins.person_info.person_info import person_info_manager
+from src.plugins.utils.pipeline import db_write_queue, post_reply_queue
 from rich.traceback import install
 
 from src.manager.async_task_manager import async_task_manager
@@ -126,6 +130,21 @@ async def graceful_shutdown():
         # 停止所有异步任务
         await async_task_manager.stop_and_wait_all_tasks()
 
+        # 等待回复后的收尾工作完成
+        await post_reply_queue.close()
+
+        # 把写缓冲中的消息全部写入数据库
+        await message_write_buffer.close()
+
+        # 把缓存中的个人信息修改写入数据库
+        await person_info_manager.close()
+
+        # 等待后台的数据库写入完成
+        await db_write_queue.close()
+
+        # 关闭模型请求共享的 HTTP 会话
+        await llm_session_pool.close_all()
+
         tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
         for task in tasks:
             task.cancel()
@@ -1,12 +1,84 @@
 import os
-from pymongo import MongoClient
+import threading
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo.database import Database
 
 _client = None
 _db = None
+_async_client = None
+_async_db = None
 
 
-def __create_database_instance():
+class DBLatencyStats(monitoring.CommandListener):
+    """按集合和操作统计数据库请求耗时的直方图
+
+    通过 pymongo 的命令监听获取每条命令的耗时，同步和异步客户端共用同一份统计。
+    """
+
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # (连接, 请求ID) -> (集合, 操作)
+        self._stats = {}  # (集合, 操作) -> {"buckets": [...], "count": 次数, "total_ms": 总耗时, "max_ms": 最大耗时}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        if isinstance(target, str):
+            # 被取消的异步请求不会产生结束事件，避免残留条目无限增长
+            if len(self._pending) > 10000:
+                self._pending.clear()
+            self._pending[(event.connection_id, event.request_id)] = (target, event.command_name)
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        key = self._pending.pop((event.connection_id, event.request_id), None)
+        if key is None:
+            return
+        elapsed_ms = event.duration_micros / 1000
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = {"buckets": [0] * (len(self.BUCKETS_MS) + 1), "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+                self._stats[key] = stat
+            index = next((i for i, bound in enumerate(self.BUCKETS_MS) if elapsed_ms <= bound), len(self.BUCKETS_MS))
+            stat["buckets"][index] += 1
+            stat["count"] += 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+
+    def snapshot(self) -> dict:
+        """返回 {(集合, 操作): 统计} 的副本"""
+        with self._lock:
+            return {key: {**stat, "buckets": list(stat["buckets"])} for key, stat in self._stats.items()}
+
+    def format_report(self) -> str:
+        """按总耗时从高到低生成可读的统计报告"""
+        labels = [f"<={bound}ms" for bound in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        lines = []
+        snapshot = self.snapshot()
+        for (collection, operation), stat in sorted(snapshot.items(), key=lambda item: -item[1]["total_ms"]):
+            histogram = " ".join(f"{label}:{n}" for label, n in zip(labels, stat["buckets"], strict=True) if n)
+            lines.append(
+                f"{collection}.{operation} 次数:{stat['count']} 平均:{stat['total_ms'] / stat['count']:.1f}ms "
+                f"最大:{stat['max_ms']:.1f}ms [{histogram}]"
+            )
+        return "\n".join(lines)
+
+
+# 数据库请求耗时统计
+db_latency = DBLatencyStats()
+
+
+def __create_database_instance(client_class=MongoClient):
     uri = os.getenv("MONGODB_URI")
     host = os.getenv("MONGODB_HOST", "127.0.0.1")
     port = int(os.getenv("MONGODB_PORT", "27017"))
@@ -14,11 +86,12 @@ def __create_database_instance():
     username = os.getenv("MONGODB_USERNAME")
     password = os.getenv("MONGODB_PASSWORD")
     auth_source = os.getenv("MONGODB_AUTH_SOURCE")
+    event_listeners = [db_latency]
 
     if uri:
         # 支持标准mongodb://和mongodb+srv://连接字符串
         if uri.startswith(("mongodb://", "mongodb+srv://")):
-            return MongoClient(uri)
+            return client_class(uri, event_listeners=event_listeners)
         else:
             raise ValueError(
                 "Invalid MongoDB URI format. URI must start with 'mongodb://' or 'mongodb+srv://'. "
@@ -28,10 +101,12 @@ def __create_database_instance():
 
     if username and password:
         # 如果有用户名和密码，使用认证连接
-        return MongoClient(host, port, username=username, password=password, authSource=auth_source)
+        return client_class(
+            host, port, username=username, password=password, authSource=auth_source, event_listeners=event_listeners
+        )
 
     # 否则使用无认证连接
-    return MongoClient(host, port)
+    return client_class(host, port, event_listeners=event_listeners)
 
 
 def get_db():
@@ -43,15 +118,29 @@ def get_db():
     return _db
 
 
+def get_async_db():
+    """获取异步数据库连接实例，延迟初始化。只能在主事件循环中使用。"""
+    global _async_client, _async_db
+    if _async_client is None:
+        _async_client = __create_database_instance(AsyncMongoClient)
+        _async_db = _async_client[os.getenv("DATABASE_NAME", "MegBot")]
+    return _async_db
+
+
 class DBWrapper:
     """数据库代理类，保持接口兼容性同时实现懒加载。"""
 
+    def __init__(self, getter=get_db):
+        self._getter = getter
+
     def __getattr__(self, name):
-        return getattr(get_db(), name)
+        return getattr(self._getter(), name)
 
     def __getitem__(self, key):
-        return get_db()[key]
+        return self._getter()[key]
 
 
 # 全局数据库访问点
 db: Database = DBWrapper()
+# 异步数据库访问点，接口与 db 相同，所有操作需要 await，不会阻塞事件循环
+async_db: AsyncDatabase = DBWrapper(get_async_db)
@@ -1,10 +1,12 @@
 from src.plugins.models.utils_model import LLM_request
 from src.plugins.config.config import global_config
 from src.plugins.chat.chat_stream import ChatStream
-from src.common.database import db
+from src.plugins.storage.recent_messages import recent_message_cache
+import asyncio
 import time
 import json
 from src.common.logger import get_module_logger, TOOL_USE_STYLE_CONFIG, LogConfig
+from src.plugins.utils.timer_calculater import Timer
 from src.do_tool.tool_can_use import get_all_tool_definitions, get_tool_instance
 from src.heart_flow.sub_heartflow import SubHeartflow
 
@@ -17,6 +19,9 @@ logger = get_module_logger("tool_use", config=tool_use_config)
 
 
 class ToolUser:
+    TOOL_CALL_TIMEOUT = 15  # 单个工具调用的超时时间（秒）
+    TOOL_STAGE_TIMEOUT = 25  # 所有工具调用的总时间预算（秒）
+
     def __init__(self):
         self.llm_model_tool = LLM_request(
             model=global_config.llm_tool_use, temperature=0.2, max_tokens=1000, request_type="tool_use"
@@ -41,9 +46,7 @@ class ToolUser:
         else:
             mid_memory_info = ""
 
-        new_messages = list(
-            db.messages.find({"chat_id": chat_stream.stream_id, "time": {"$gt": time.time()}}).sort("time", 1).limit(15)
-        )
+        new_messages = await recent_message_cache.find(chat_stream.stream_id, {"$gt": time.time()}, limit=15)
         new_messages_str = ""
         for msg in new_messages:
             if "detailed_plain_text" in msg:
@@ -89,7 +92,9 @@ class ToolUser:
                 return None
 
             # 执行工具
-            result = await tool_instance.execute(function_args, message_txt)
+            result = await asyncio.wait_for(
+                tool_instance.execute(function_args, message_txt), timeout=self.TOOL_CALL_TIMEOUT
+            )
             if result:
                 # 直接使用 function_name 作为 tool_type
                 tool_type = function_name
@@ -102,10 +107,49 @@ class ToolUser:
                     "content": result["content"],
                 }
             return None
+        except asyncio.TimeoutError:
+            logger.warning(f"工具 {tool_call['function']['name']} 执行超时({self.TOOL_CALL_TIMEOUT}秒)")
+            return None
         except Exception as e:
             logger.error(f"执行工具调用时发生错误: {str(e)}")
             return None
 
+    async def _execute_tool_calls(self, tool_calls: list, message_txt: str):
+        """并发执行所有工具调用，超过总时间预算仍未完成的调用会被取消
+
+        Args:
+            tool_calls: 工具调用对象列表
+            message_txt: 原始消息文本
+
+        Returns:
+            tuple: (与tool_calls顺序一致的结果列表，失败或超时的为None; 工具名称 -> 耗时秒数)
+        """
+        # 同一工具被调用多次时分别记录耗时
+        name_counts = {}
+        keys = []
+        for tool_call in tool_calls:
+            name = tool_call["function"]["name"]
+            name_counts[name] = name_counts.get(name, 0) + 1
+            keys.append(name if name_counts[name] == 1 else f"{name}#{name_counts[name]}")
+
+        timings = {}
+
+        async def timed_call(tool_call, key):
+            with Timer(key, timings):
+                return await self._execute_tool_call(tool_call, message_txt)
+
+        tasks = [
+            asyncio.create_task(timed_call(tool_call, key)) for tool_call, key in zip(tool_calls, keys, strict=True)
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=self.TOOL_STAGE_TIMEOUT)
+        if pending:
+            logger.warning(f"{len(pending)}个工具调用超出总时间预算({self.TOOL_STAGE_TIMEOUT}秒)，已取消")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        results = [task.result() if task in done else None for task in tasks]
+        return results, {key: timings[key] for key in keys if key in timings}
+
     async def use_tool(
         self, message_txt: str, sender_name: str, chat_stream: ChatStream, subheartflow: SubHeartflow = None
     ):
@@ -160,9 +204,12 @@ class ToolUser:
                 tool_results = []
                 structured_info = {}  # 动态生成键
 
-                # 执行所有工具调用
-                for tool_call in tool_calls:
-                    result = await self._execute_tool_call(tool_call, message_txt)
+                # 并发执行所有工具调用，结果保持调用顺序
+                results, tool_timings = await self._execute_tool_calls(tool_calls, message_txt)
+                logger.info(
+                    "工具调用耗时: " + " | ".join(f"{name}: {elapsed:.2f}秒" for name, elapsed in tool_timings.items())
+                )
+                for result in results:
                     if result:
                         tool_results.append(result)
                         # 使用工具名称作为键
@@ -174,7 +221,8 @@ class ToolUser:
                 # 如果有工具结果，返回结构化的信息
                 if structured_info:
                     logger.info(f"工具调用收集到结构化信息: {json.dumps(structured_info, ensure_ascii=False)}")
-                    return {"used_tools": True, "structured_info": structured_info}
+                    return {"used_tools": True, "structured_info": structured_info, "tool_timings": tool_timings}
+                return {"used_tools": False, "tool_timings": tool_timings}
             else:
                 # 没有工具调用
                 content, reasoning_content = response
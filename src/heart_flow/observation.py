@@ -3,7 +3,7 @@
 from datetime import datetime
 from src.plugins.models.utils_model import LLM_request
 from src.plugins.config.config import global_config
-from src.common.database import db
+from src.plugins.storage.recent_messages import recent_message_cache
 from src.common.logger import get_module_logger
 import traceback
 
@@ -72,9 +72,7 @@ class ChattingObservation(Observation):
 
     async def observe(self):
         # 查找新消息
-        new_messages = list(
-            db.messages.find({"chat_id": self.chat_id, "time": {"$gt": self.last_observe_time}}).sort("time", 1)
-        )  # 按时间正序排列
+        new_messages = await recent_message_cache.find(self.chat_id, {"$gt": self.last_observe_time})  # 按时间正序排列
 
         if not new_messages:
             return self.observe_info  # 没有新消息，返回上次观察结果
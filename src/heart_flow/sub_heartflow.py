@@ -192,7 +192,7 @@ class SubHeartflow:
         who_chat_in_group = [
             (chat_stream.user_info.platform, chat_stream.user_info.user_id, chat_stream.user_info.user_nickname)
         ]
-        who_chat_in_group += get_recent_group_speaker(
+        who_chat_in_group += await get_recent_group_speaker(
             chat_stream.stream_id,
             (chat_stream.user_info.platform, chat_stream.user_info.user_id),
             limit=global_config.MAX_CONTEXT_SIZE,
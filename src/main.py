@@ -4,6 +4,7 @@ from .plugins.utils.statistic import LLMStatistics
 from .plugins.moods.moods import MoodManager
 from .plugins.schedule.schedule_generator import bot_schedule
 from .plugins.chat.emoji_manager import emoji_manager
+from .plugins.zhishi.knowledge_index import knowledge_index
 from .plugins.person_info.person_info import person_info_manager
 from .plugins.willing.willing_manager import willing_manager
 from .plugins.chat.chat_stream import chat_manager
@@ -17,6 +18,9 @@ from .common.logger import get_module_logger
 from .plugins.remote import heartbeat_thread  # noqa: F401
 from .individuality.individuality import Individuality
 from .common.server import global_server
+from .common.database import db_latency
+from .plugins.storage.write_buffer import message_write_buffer
+from .plugins.models.embedding_cache import embedding_cache
 
 logger = get_module_logger("main")
 
@@ -55,6 +59,13 @@ class MainSystem:
         emoji_manager.initialize()
         logger.success("表情包管理器初始化成功")
 
+        # 加载知识库向量索引
+        await asyncio.to_thread(
+            knowledge_index.initialize,
+            use_ivf=global_config.knowledge_index_ivf,
+            nprobe=global_config.knowledge_index_nprobe,
+        )
+
         # 启动情绪管理器
         self.mood_manager.start_mood_update(update_interval=global_config.mood_update_interval)
         logger.success("情绪管理器启动成功")
@@ -124,6 +135,8 @@ class MainSystem:
                 self.forget_memory_task(),
                 self.print_mood_task(),
                 self.remove_recalled_message_task(),
+                self.print_db_latency_task(),
+                knowledge_index.start_periodic_sync(),
                 emoji_manager.start_periodic_check_register(),
                 # emoji_manager.start_periodic_register(),
                 self.app.run(),
@@ -152,6 +165,26 @@ class MainSystem:
             self.mood_manager.print_mood_status()
             await asyncio.sleep(30)
 
+    async def print_db_latency_task(self):
+        """定期打印数据库请求耗时统计、消息写缓冲状态和embedding缓存命中率"""
+        while True:
+            await asyncio.sleep(600)
+            report = db_latency.format_report()
+            if report:
+                logger.debug(f"数据库请求耗时统计:\n{report}")
+            stats = message_write_buffer.stats()
+            logger.debug(
+                f"消息写缓冲: 队列{stats['queue_depth']}条(峰值{stats['max_queue_depth']}) "
+                f"已写入{stats['flushed_messages']}条 失败{stats['failed_flushes']}次 "
+                f"写入平均{stats['avg_flush_ms']:.1f}ms 最大{stats['max_flush_ms']:.1f}ms"
+            )
+            if global_config.enable_embedding_cache:
+                stats = embedding_cache.stats()
+                logger.debug(
+                    f"embedding缓存: 内存命中{stats['memory_hits']}次 数据库命中{stats['db_hits']}次 "
+                    f"未命中{stats['misses']}次 命中率{stats['hit_rate']:.1%} 内存中{stats['memory_size']}条"
+                )
+
     async def remove_recalled_message_task(self):
         """删除撤回消息任务"""
         while True:
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any
-from src.common.database import db
+from src.plugins.storage.recent_messages import recent_message_cache
 
 
 class MessageStorage(ABC):
@@ -51,29 +51,22 @@ class MongoDBMessageStorage(MessageStorage):
     """MongoDB消息存储实现"""
 
     def __init__(self):
-        self.db = db
+        self.cache = recent_message_cache
 
     async def get_messages_after(self, chat_id: str, message_time: float) -> List[Dict[str, Any]]:
-        query = {"chat_id": chat_id}
         # print(f"storage_check_message: {message_time}")
 
-        query["time"] = {"$gt": message_time}
-
-        return list(self.db.messages.find(query).sort("time", 1))
+        return await self.cache.find(chat_id, {"$gt": message_time})
 
     async def get_messages_before(self, chat_id: str, time_point: float, limit: int = 5) -> List[Dict[str, Any]]:
-        query = {"chat_id": chat_id, "time": {"$lt": time_point}}
-
-        messages = list(self.db.messages.find(query).sort("time", -1).limit(limit))
+        messages = await self.cache.find(chat_id, {"$lt": time_point}, newest_first=True, limit=limit)
 
         # 将消息按时间正序排列
         messages.reverse()
         return messages
 
     async def has_new_messages(self, chat_id: str, after_time: float) -> bool:
-        query = {"chat_id": chat_id, "time": {"$gt": after_time}}
-
-        return self.db.messages.find_one(query) is not None
+        return bool(await self.cache.find(chat_id, {"$gt": after_time}, {"_id": 1}, limit=1))
 
 
 # # 创建一个内存消息存储实现，用于测试
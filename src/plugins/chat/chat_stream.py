@@ -5,7 +5,7 @@ import copy
 from typing import Dict, Optional
 
 
-from ...common.database import db
+from ...common.database import async_db, db
 from ..message.message_base import GroupInfo, UserInfo
 
 from src.common.logger import get_module_logger
@@ -152,7 +152,7 @@ class ChatManager:
                 return stream
 
             # 检查数据库中是否存在
-            data = db.chat_streams.find_one({"stream_id": stream_id})
+            data = await async_db.chat_streams.find_one({"stream_id": stream_id})
             if data:
                 stream = ChatStream.from_dict(data)
                 # 更新用户信息和群组信息
@@ -191,7 +191,9 @@ class ChatManager:
     async def _save_stream(self, stream: ChatStream):
         """保存聊天流到数据库"""
         if not stream.saved:
-            db.chat_streams.update_one({"stream_id": stream.stream_id}, {"$set": stream.to_dict()}, upsert=True)
+            await async_db.chat_streams.update_one(
+                {"stream_id": stream.stream_id}, {"$set": stream.to_dict()}, upsert=True
+            )
             stream.saved = True
 
     async def _save_all_streams(self):
@@ -201,8 +203,7 @@ class ChatManager:
 
     async def load_all_streams(self):
         """从数据库加载所有聊天流"""
-        all_streams = db.chat_streams.find({})
-        for data in all_streams:
+        async for data in async_db.chat_streams.find({}):
             stream = ChatStream.from_dict(data)
             self.streams[stream.stream_id] = stream
 
@@ -8,10 +8,11 @@ import traceback
 from typing import Optional, Tuple
 from PIL import Image
 import io
+import numpy as np
 
 from ...common.database import db
 from ..config.config import global_config
-from ..chat.utils import get_embedding
+from ..chat.utils import get_embedding, get_embeddings
 from ..chat.utils_image import ImageManager, image_path_to_base64
 from ..models.utils_model import LLM_request
 from src.common.logger import get_module_logger
@@ -22,6 +23,86 @@ logger = get_module_logger("emoji")
 image_manager = ImageManager()
 
 
+class EmojiIndex:
+    """表情包embedding的内存索引
+
+    保存归一化后的 float32 embedding 矩阵以及对应的 _id、路径和描述，
+    查询时一次矩阵向量乘法即可得到所有表情包的余弦相似度。被拉黑的表情包不进入索引。
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.paths = []
+        self.descriptions = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rebuild(self, emojis):
+        """用给定的表情包记录整体重建索引"""
+        self.ids, self.paths, self.descriptions = [], [], []
+        rows = []
+        for emoji in emojis:
+            embedding = emoji.get("embedding")
+            if "blacklist" in emoji or "path" not in emoji or not embedding:
+                continue
+            if rows and len(embedding) != len(rows[0]):
+                logger.warning(f"[索引] 表情包embedding维度不一致，跳过: {emoji['_id']}")
+                continue
+            self.ids.append(emoji["_id"])
+            self.paths.append(emoji["path"])
+            self.descriptions.append(emoji.get("description", "无描述"))
+            rows.append(embedding)
+        self.matrix = self._normalize(np.asarray(rows, dtype=np.float32)) if rows else np.zeros((0, 0), np.float32)
+        self.loaded = True
+
+    def load(self):
+        """从数据库加载全部表情包"""
+        self.rebuild(db.emoji.find({}, {"_id": 1, "path": 1, "embedding": 1, "description": 1, "blacklist": 1}))
+        logger.debug(f"[索引] 已加载 {len(self)} 个表情包")
+
+    def add(self, emoji_id, path: str, description: str, embedding: list):
+        if not self.loaded:
+            return
+        if len(self) and len(embedding) != self.matrix.shape[1]:
+            logger.warning(f"[索引] 表情包embedding维度不一致，跳过: {emoji_id}")
+            return
+        row = self._normalize(np.asarray([embedding], dtype=np.float32))
+        self.matrix = np.vstack([self.matrix, row]) if len(self) else row
+        self.ids.append(emoji_id)
+        self.paths.append(path)
+        self.descriptions.append(description)
+
+    def remove(self, emoji_id):
+        if not self.loaded or emoji_id not in self.ids:
+            return
+        i = self.ids.index(emoji_id)
+        self.matrix = np.delete(self.matrix, i, axis=0)
+        del self.ids[i], self.paths[i], self.descriptions[i]
+
+    def top_k(self, embedding: list, k: int) -> list:
+        """返回与 embedding 最相似的 k 个表情包，格式为 [(下标, 相似度)]，按相似度降序"""
+        if not len(self) or len(embedding) != self.matrix.shape[1]:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self.matrix @ (query / norm)
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+
 class EmojiManager:
     _instance = None
     EMOJI_DIR = os.path.join("data", "emoji")  # 表情包存储目录
@@ -42,6 +123,7 @@ class EmojiManager:
         self.emoji_num = 0
         self.emoji_num_max = global_config.max_emoji_num
         self.emoji_num_max_reach_deletion = global_config.max_reach_deletion
+        self.emoji_index = EmojiIndex()
 
         logger.info("启动表情包管理器")
 
@@ -133,55 +215,30 @@ class EmojiManager:
                 return None
 
             try:
-                # 获取所有表情包
-                all_emojis = [
-                    e
-                    for e in db.emoji.find({}, {"_id": 1, "path": 1, "embedding": 1, "description": 1, "blacklist": 1})
-                    if "blacklist" not in e
-                ]
-
-                if not all_emojis:
+                if not self.emoji_index.loaded:
+                    self.emoji_index.load()
+                if not len(self.emoji_index):
                     logger.warning("数据库中没有任何表情包")
                     return None
 
-                # 计算余弦相似度并排序
-                def cosine_similarity(v1, v2):
-                    if not v1 or not v2:
-                        return 0
-                    dot_product = sum(a * b for a, b in zip(v1, v2))
-                    norm_v1 = sum(a * a for a in v1) ** 0.5
-                    norm_v2 = sum(b * b for b in v2) ** 0.5
-                    if norm_v1 == 0 or norm_v2 == 0:
-                        return 0
-                    return dot_product / (norm_v1 * norm_v2)
-
-                # 计算所有表情包与输入文本的相似度
-                emoji_similarities = [
-                    (emoji, cosine_similarity(text_embedding, emoji.get("embedding", []))) for emoji in all_emojis
-                ]
-
-                # 按相似度降序排序
-                emoji_similarities.sort(key=lambda x: x[1], reverse=True)
-
-                # 获取前3个最相似的表情包
-                top_10_emojis = emoji_similarities[: 10 if len(emoji_similarities) > 10 else len(emoji_similarities)]
+                # 获取前10个最相似的表情包
+                top_10_emojis = self.emoji_index.top_k(text_embedding, 10)
 
                 if not top_10_emojis:
                     logger.warning("未找到匹配的表情包")
                     return None
 
-                # 从前3个中随机选择一个
-                selected_emoji, similarity = random.choice(top_10_emojis)
+                # 从前10个中随机选择一个
+                index, similarity = random.choice(top_10_emojis)
+                emoji_id = self.emoji_index.ids[index]
+                description = self.emoji_index.descriptions[index]
 
-                if selected_emoji and "path" in selected_emoji:
-                    # 更新使用次数
-                    db.emoji.update_one({"_id": selected_emoji["_id"]}, {"$inc": {"usage_count": 1}})
+                # 更新使用次数
+                db.emoji.update_one({"_id": emoji_id}, {"$inc": {"usage_count": 1}})
 
-                    logger.info(
-                        f"[匹配] 找到表情包: {selected_emoji.get('description', '无描述')} (相似度: {similarity:.4f})"
-                    )
-                    # 稍微改一下文本描述，不然容易产生幻觉，描述已经包含 表情包 了
-                    return selected_emoji["path"], "[ %s ]" % selected_emoji.get("description", "无描述")
+                logger.info(f"[匹配] 找到表情包: {description} (相似度: {similarity:.4f})")
+                # 稍微改一下文本描述，不然容易产生幻觉，描述已经包含 表情包 了
+                return self.emoji_index.paths[index], "[ %s ]" % description
 
             except Exception as search_error:
                 logger.error(f"[错误] 搜索表情包失败: {str(search_error)}")
@@ -259,9 +316,12 @@ class EmojiManager:
             remaining_slots = self.emoji_num_max - self.emoji_num
             logger.info(f"[注册] 还可以注册 {remaining_slots} 个表情包")
 
+            # 通过检查、等待注册的表情包，循环结束后批量获取embedding再写入数据库
+            pending_emojis = []
+
             for filename in files_to_process:
                 # 如果已经达到上限，停止注册
-                if self.emoji_num >= self.emoji_num_max:
+                if self.emoji_num + len(pending_emojis) >= self.emoji_num_max:
                     logger.warning(f"[警告] 表情包数量已达到上限({self.emoji_num}/{self.emoji_num_max})，停止注册")
                     break
 
@@ -283,17 +343,21 @@ class EmojiManager:
                     if existing_emoji_by_path["_id"] != existing_emoji_by_hash["_id"]:
                         logger.error(f"[错误] 表情包已存在但记录不一致: {filename}")
                         db.emoji.delete_one({"_id": existing_emoji_by_path["_id"]})
+                        self.emoji_index.remove(existing_emoji_by_path["_id"])
                         db.emoji.delete_one({"_id": existing_emoji_by_hash["_id"]})
+                        self.emoji_index.remove(existing_emoji_by_hash["_id"])
                         existing_emoji = None
                     else:
                         existing_emoji = existing_emoji_by_hash
                 elif existing_emoji_by_hash:
                     logger.error(f"[错误] 表情包hash已存在但path不存在: {filename}")
                     db.emoji.delete_one({"_id": existing_emoji_by_hash["_id"]})
+                    self.emoji_index.remove(existing_emoji_by_hash["_id"])
                     existing_emoji = None
                 elif existing_emoji_by_path:
                     logger.error(f"[错误] 表情包path已存在但hash不存在: {filename}")
                     db.emoji.delete_one({"_id": existing_emoji_by_path["_id"]})
+                    self.emoji_index.remove(existing_emoji_by_path["_id"])
                     existing_emoji = None
                 else:
                     existing_emoji = None
@@ -316,12 +380,12 @@ class EmojiManager:
                         }
                         db.images.update_one({"hash": image_hash}, {"$set": image_doc}, upsert=True)
                         # 保存描述到image_descriptions集合
-                        image_manager._save_description_to_db(image_hash, description, "emoji")
+                        await image_manager._save_description_to_db(image_hash, description, "emoji")
                         logger.success(f"[同步] 已同步表情包到images集合: {filename}")
                     continue
 
                 # 检查是否在images集合中已有描述
-                existing_description = image_manager._get_description_from_db(image_hash, "emoji")
+                existing_description = await image_manager._get_description_from_db(image_hash, "emoji")
 
                 if existing_description:
                     description = existing_description
@@ -339,47 +403,60 @@ class EmojiManager:
                     logger.info(f"[检查] 表情包检查通过: {check}")
 
                 if description is not None:
-                    embedding = await get_embedding(description, request_type="emoji")
-                    if not embedding:
-                        logger.error("获取消息嵌入向量失败")
-                        raise ValueError("获取消息嵌入向量失败")
-                    # 准备数据库记录
-                    emoji_record = {
-                        "filename": filename,
-                        "path": image_path,
-                        "embedding": embedding,
-                        "description": description,
-                        "hash": image_hash,
-                        "timestamp": int(time.time()),
-                    }
-
-                    # 保存到emoji数据库
-                    db["emoji"].insert_one(emoji_record)
-                    logger.success(f"[注册] 新表情包: {filename}")
-                    logger.info(f"[描述] {description}")
-
-                    # 更新当前表情包数量
-                    self.emoji_num += 1
-                    logger.info(f"[统计] 当前表情包数量: {self.emoji_num}/{self.emoji_num_max}")
-
-                    # 保存到images数据库
-                    image_doc = {
-                        "hash": image_hash,
-                        "path": image_path,
-                        "type": "emoji",
-                        "description": description,
-                        "timestamp": int(time.time()),
-                    }
-                    db.images.update_one({"hash": image_hash}, {"$set": image_doc}, upsert=True)
-                    # 保存描述到image_descriptions集合
-                    image_manager._save_description_to_db(image_hash, description, "emoji")
-                    logger.success(f"[同步] 已保存到images集合: {filename}")
+                    pending_emojis.append((filename, image_path, image_hash, description))
                 else:
                     logger.warning(f"[跳过] 表情包: {filename}")
 
+            if pending_emojis:
+                embeddings = await get_embeddings(
+                    [description for _, _, _, description in pending_emojis], request_type="emoji"
+                )
+                for (filename, image_path, image_hash, description), embedding in zip(
+                    pending_emojis, embeddings, strict=True
+                ):
+                    if not embedding:
+                        logger.error(f"[错误] 获取表情包嵌入向量失败，跳过注册: {filename}")
+                        continue
+                    await self._register_emoji(filename, image_path, image_hash, description, embedding)
+
         except Exception:
             logger.exception("[错误] 扫描表情包失败")
 
+    async def _register_emoji(self, filename: str, image_path: str, image_hash: str, description: str, embedding: list):
+        """将新表情包写入emoji集合，并同步到images集合"""
+        # 准备数据库记录
+        emoji_record = {
+            "filename": filename,
+            "path": image_path,
+            "embedding": embedding,
+            "description": description,
+            "hash": image_hash,
+            "timestamp": int(time.time()),
+        }
+
+        # 保存到emoji数据库
+        result = db["emoji"].insert_one(emoji_record)
+        self.emoji_index.add(result.inserted_id, image_path, description, embedding)
+        logger.success(f"[注册] 新表情包: {filename}")
+        logger.info(f"[描述] {description}")
+
+        # 更新当前表情包数量
+        self.emoji_num += 1
+        logger.info(f"[统计] 当前表情包数量: {self.emoji_num}/{self.emoji_num_max}")
+
+        # 保存到images数据库
+        image_doc = {
+            "hash": image_hash,
+            "path": image_path,
+            "type": "emoji",
+            "description": description,
+            "timestamp": int(time.time()),
+        }
+        db.images.update_one({"hash": image_hash}, {"$set": image_doc}, upsert=True)
+        # 保存描述到image_descriptions集合
+        await image_manager._save_description_to_db(image_hash, description, "emoji")
+        logger.success(f"[同步] 已保存到images集合: {filename}")
+
     def check_emoji_file_integrity(self):
         """检查表情包文件完整性
         如果文件已被删除，则从数据库中移除对应记录
@@ -389,6 +466,7 @@ class EmojiManager:
             # 获取所有表情包记录
             all_emojis = list(db.emoji.find())
             removed_count = 0
+            removed_ids = set()
             total_count = len(all_emojis)
 
             for emoji in all_emojis:
@@ -397,12 +475,14 @@ class EmojiManager:
                         logger.warning(f"[检查] 发现无效记录（缺少path字段），ID: {emoji.get('_id', 'unknown')}")
                         db.emoji.delete_one({"_id": emoji["_id"]})
                         removed_count += 1
+                        removed_ids.add(emoji["_id"])
                         continue
 
                     if "embedding" not in emoji:
                         logger.warning(f"[检查] 发现过时记录（缺少embedding字段），ID: {emoji.get('_id', 'unknown')}")
                         db.emoji.delete_one({"_id": emoji["_id"]})
                         removed_count += 1
+                        removed_ids.add(emoji["_id"])
                         continue
 
                     # 检查文件是否存在
@@ -413,6 +493,7 @@ class EmojiManager:
                         if result.deleted_count > 0:
                             logger.debug(f"[清理] 成功删除数据库记录: {emoji['_id']}")
                             removed_count += 1
+                            removed_ids.add(emoji["_id"])
                         else:
                             logger.error(f"[错误] 删除数据库记录失败: {emoji['_id']}")
                         continue
@@ -427,10 +508,12 @@ class EmojiManager:
                             logger.warning(f"[检查] 表情包文件hash不匹配，ID: {emoji.get('_id', 'unknown')}")
                             db.emoji.delete_one({"_id": emoji["_id"]})
                             removed_count += 1
+                            removed_ids.add(emoji["_id"])
 
                     # 修复拼写错误
                     if "discription" in emoji:
                         desc = emoji["discription"]
+                        emoji["description"] = desc
                         db.emoji.update_one(
                             {"_id": emoji["_id"]}, {"$unset": {"discription": ""}, "$set": {"description": desc}}
                         )
@@ -439,6 +522,9 @@ class EmojiManager:
                     logger.error(f"[错误] 处理表情包记录时出错: {str(item_error)}")
                     continue
 
+            # 用本次读取的记录刷新表情包索引
+            self.emoji_index.rebuild(emoji for emoji in all_emojis if emoji["_id"] not in removed_ids)
+
             # 验证清理结果
             remaining_count = db.emoji.count_documents({})
             if removed_count > 0:
@@ -517,6 +603,7 @@ class EmojiManager:
 
                     # 删除数据库记录
                     db.emoji.delete_one({"_id": emoji["_id"]})
+                    self.emoji_index.remove(emoji["_id"])
                     deleted_count += 1
 
                     # 同时从images集合中删除
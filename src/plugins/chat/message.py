@@ -1,3 +1,4 @@
+import asyncio
 import time
 from dataclasses import dataclass
 from typing import Dict, List, Optional
@@ -15,6 +16,8 @@ logger = get_module_logger("chat_message")
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+SEGMENT_CONCURRENCY = 4  # 同一条消息中同时处理（如识别图片）的消息段数
+
 # 这个类是消息数据类，用于存储和管理消息数据。
 # 它定义了消息的属性，包括群组ID、用户ID、消息ID、原始消息内容、纯文本内容和时间戳。
 # 它还定义了两个辅助属性：keywords用于提取消息的关键词，is_plain_text用于判断消息是否为纯文本。
@@ -91,26 +94,30 @@ class MessageRecv(Message):
         self.processed_plain_text = await self._process_message_segments(self.message_segment)
         self.detailed_plain_text = self._generate_detailed_text()
 
-    async def _process_message_segments(self, segment: Seg) -> str:
+    async def _process_message_segments(self, segment: Seg, semaphore: Optional[asyncio.Semaphore] = None) -> str:
         """递归处理消息段，转换为文字描述
 
+        seglist 中的消息段并发处理，同一条消息最多同时处理 SEGMENT_CONCURRENCY 个，结果按原顺序拼接
+
         Args:
             segment: 要处理的消息段
+            semaphore: 限制同一条消息并发数的信号量，递归调用时传入
 
         Returns:
             str: 处理后的文本
         """
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(SEGMENT_CONCURRENCY)
         if segment.type == "seglist":
             # 处理消息段列表
-            segments_text = []
-            for seg in segment.data:
-                processed = await self._process_message_segments(seg)
-                if processed:
-                    segments_text.append(processed)
-            return " ".join(segments_text)
+            processed_list = await asyncio.gather(
+                *(self._process_message_segments(seg, semaphore) for seg in segment.data)
+            )
+            return " ".join(processed for processed in processed_list if processed)
         else:
-            # 处理单个消息段
-            return await self._process_single_segment(segment)
+            # 处理单个消息段，只在叶子节点占用信号量，避免嵌套的seglist互相等待
+            async with semaphore:
+                return await self._process_single_segment(segment)
 
     async def _process_single_segment(self, seg: Seg) -> str:
         """处理单个消息段
@@ -184,26 +191,30 @@ class MessageProcessBase(Message):
         self.thinking_time = round(time.time() - self.thinking_start_time, 2)
         return self.thinking_time
 
-    async def _process_message_segments(self, segment: Seg) -> str:
+    async def _process_message_segments(self, segment: Seg, semaphore: Optional[asyncio.Semaphore] = None) -> str:
         """递归处理消息段，转换为文字描述
 
+        seglist 中的消息段并发处理，同一条消息最多同时处理 SEGMENT_CONCURRENCY 个，结果按原顺序拼接
+
         Args:
             segment: 要处理的消息段
+            semaphore: 限制同一条消息并发数的信号量，递归调用时传入
 
         Returns:
             str: 处理后的文本
         """
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(SEGMENT_CONCURRENCY)
         if segment.type == "seglist":
             # 处理消息段列表
-            segments_text = []
-            for seg in segment.data:
-                processed = await self._process_message_segments(seg)
-                if processed:
-                    segments_text.append(processed)
-            return " ".join(segments_text)
+            processed_list = await asyncio.gather(
+                *(self._process_message_segments(seg, semaphore) for seg in segment.data)
+            )
+            return " ".join(processed for processed in processed_list if processed)
         else:
-            # 处理单个消息段
-            return await self._process_single_segment(segment)
+            # 处理单个消息段，只在叶子节点占用信号量，避免嵌套的seglist互相等待
+            async with semaphore:
+                return await self._process_single_segment(segment)
 
     async def _process_single_segment(self, seg: Seg) -> str:
         """处理单个消息段
@@ -168,20 +168,14 @@ class MessageBuffer:
             return False
 
     async def save_message_interval(self, person_id: str, message: BaseMessageInfo):
-        message_interval_list = await person_info_manager.get_value(person_id, "msg_interval_list")
         now_time_ms = int(round(time.time() * 1000))
-        if len(message_interval_list) < 1000:
-            message_interval_list.append(now_time_ms)
-        else:
-            message_interval_list.pop(0)
-            message_interval_list.append(now_time_ms)
         data = {
             "platform": message.platform,
             "user_id": message.user_info.user_id,
             "nickname": message.user_info.user_nickname,
             "konw_time": int(time.time()),
         }
-        await person_info_manager.update_one_field(person_id, "msg_interval_list", message_interval_list, data)
+        await person_info_manager.append_to_list_field(person_id, "msg_interval_list", now_time_ms, 1000, data)
 
 
 message_buffer = MessageBuffer()
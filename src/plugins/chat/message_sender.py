@@ -3,7 +3,7 @@ import time
 from typing import Dict, List, Optional, Union
 
 from src.common.logger import get_module_logger
-from ...common.database import db
+from ...common.database import async_db
 from ..message.api import global_api
 from .message import MessageSending, MessageThinking, MessageSet
 
@@ -35,11 +35,11 @@ class Message_Sender:
         """设置当前bot实例"""
         pass
 
-    def get_recalled_messages(self, stream_id: str) -> list:
+    async def get_recalled_messages(self, stream_id: str) -> list:
         """获取所有撤回的消息"""
         recalled_messages = []
 
-        recalled_messages = list(db.recalled_messages.find({"stream_id": stream_id}, {"message_id": 1}))
+        recalled_messages = await async_db.recalled_messages.find({"stream_id": stream_id}, {"message_id": 1}).to_list()
         # 按thinking_start_time排序，时间早的在前面
         return recalled_messages
 
@@ -56,7 +56,7 @@ class Message_Sender:
         """发送消息"""
 
         if isinstance(message, MessageSending):
-            recalled_messages = self.get_recalled_messages(message.chat_stream.stream_id)
+            recalled_messages = await self.get_recalled_messages(message.chat_stream.stream_id)
             is_recalled = False
             for recalled_message in recalled_messages:
                 if message.reply_to_message_id == recalled_message["message_id"]:
@@ -104,6 +104,7 @@ class MessageContainer:
         self.messages = []
         self.last_send_time = 0
         self.thinking_wait_timeout = 20  # 思考等待超时时间（秒）
+        self.wakeup = asyncio.Event()  # 有新消息加入时唤醒该聊天流的处理任务
 
     def get_timeout_messages(self) -> List[MessageSending]:
         """获取所有超时的Message_Sending对象（思考时间超过20秒），按thinking_start_time排序"""
@@ -133,6 +134,16 @@ class MessageContainer:
                 earliest_message = msg
         return earliest_message
 
+    def get_next_deadline(self) -> Optional[float]:
+        """返回下一次需要检查超时的时间点，没有消息时返回None"""
+        deadlines = []
+        for msg in self.messages:
+            if isinstance(msg, MessageThinking):
+                deadlines.append(msg.thinking_start_time + global_config.thinking_timeout)
+            else:
+                deadlines.append(msg.thinking_start_time + self.thinking_wait_timeout)
+        return min(deadlines, default=None)
+
     def add_message(self, message: Union[MessageThinking, MessageSending]) -> None:
         """添加消息到队列"""
         if isinstance(message, MessageSet):
@@ -140,6 +151,7 @@ class MessageContainer:
                 self.messages.append(single_message)
         else:
             self.messages.append(message)
+        self.wakeup.set()
 
     def remove_message(self, message: Union[MessageThinking, MessageSending]) -> bool:
         """移除消息，如果消息存在则返回True，否则返回False"""
@@ -167,7 +179,8 @@ class MessageManager:
     def __init__(self):
         self.containers: Dict[str, MessageContainer] = {}  # chat_id -> MessageContainer
         self.storage = MessageStorage()
-        self._running = True
+        self._running = False
+        self._workers: Dict[str, asyncio.Task] = {}  # chat_id -> 正在处理该聊天流的任务
 
     def get_container(self, chat_id: str) -> MessageContainer:
         """获取或创建聊天流的消息容器"""
@@ -181,10 +194,48 @@ class MessageManager:
             raise ValueError("无法找到对应的聊天流")
         container = self.get_container(chat_stream.stream_id)
         container.add_message(message)
-
-    async def process_chat_messages(self, chat_id: str):
-        """处理聊天流消息"""
+        self._ensure_worker(chat_stream.stream_id)
+
+    def _ensure_worker(self, chat_id: str):
+        """聊天流没有处理任务时创建一个，空闲的聊天流不占用任何任务"""
+        if not self._running:
+            return
+        worker = self._workers.get(chat_id)
+        if worker is None or worker.done():
+            self._workers[chat_id] = asyncio.create_task(self._run_container(chat_id))
+
+    async def _run_container(self, chat_id: str):
+        """处理一个聊天流直到容器为空：有可发送的消息时立即处理，否则等待新消息或下一个超时时间点"""
         container = self.get_container(chat_id)
+        try:
+            while self._running and container.has_messages():
+                container.wakeup.clear()
+                try:
+                    progressed = await self.process_chat_messages(chat_id)
+                except Exception:
+                    logger.exception(f"处理聊天流{chat_id}的消息时发生错误")
+                    progressed = False
+                if progressed or not container.has_messages():
+                    continue
+
+                timeout = container.get_next_deadline() - time.time()
+                if timeout > 0:
+                    timeout += 0.01  # 略晚于到期时间唤醒，保证超时判断成立
+                else:
+                    # 已到期却没能处理（例如发送失败）的消息，每秒重试一次
+                    timeout = 1.0
+                try:
+                    await asyncio.wait_for(container.wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self._workers.get(chat_id) is asyncio.current_task():
+                del self._workers[chat_id]
+
+    async def process_chat_messages(self, chat_id: str) -> bool:
+        """处理聊天流消息，返回是否有消息被发送或移除"""
+        container = self.get_container(chat_id)
+        progressed = False
         if container.has_messages():
             # print(f"处理有message的容器chat_id: {chat_id}")
             message_earliest = container.get_earliest_message()
@@ -204,13 +255,14 @@ class MessageManager:
                 if thinking_time > global_config.thinking_timeout:
                     logger.warning(f"消息思考超时({thinking_time}秒)，移除该消息")
                     container.remove_message(message_earliest)
+                    progressed = True
 
             else:
                 """取得了发送消息"""
                 thinking_time = message_earliest.update_thinking_time()
                 thinking_start_time = message_earliest.thinking_start_time
                 now_time = time.time()
-                thinking_messages_count, thinking_messages_length = count_messages_between(
+                thinking_messages_count, thinking_messages_length = await count_messages_between(
                     start_time=thinking_start_time, end_time=now_time, stream_id=message_earliest.chat_stream.stream_id
                 )
                 # print(thinking_time)
@@ -234,6 +286,7 @@ class MessageManager:
                 await self.storage.store_message(message_earliest, message_earliest.chat_stream)
 
                 container.remove_message(message_earliest)
+                progressed = True
 
             message_timeout = container.get_timeout_messages()
             if message_timeout:
@@ -246,7 +299,7 @@ class MessageManager:
                         thinking_time = msg.update_thinking_time()
                         thinking_start_time = msg.thinking_start_time
                         now_time = time.time()
-                        thinking_messages_count, thinking_messages_length = count_messages_between(
+                        thinking_messages_count, thinking_messages_length = await count_messages_between(
                             start_time=thinking_start_time, end_time=now_time, stream_id=msg.chat_stream.stream_id
                         )
                         # print(thinking_time)
@@ -268,19 +321,18 @@ class MessageManager:
 
                         if not container.remove_message(msg):
                             logger.warning("尝试删除不存在的消息")
+                        progressed = True
                     except Exception:
                         logger.exception("处理超时消息时发生错误")
                         continue
+        return progressed
 
     async def start_processor(self):
-        """启动消息处理器"""
-        while self._running:
-            await asyncio.sleep(1)
-            tasks = []
-            for chat_id in self.containers.keys():
-                tasks.append(self.process_chat_messages(chat_id))
-
-            await asyncio.gather(*tasks)
+        """启动消息处理器，之后每个聊天流在有消息加入时由各自的任务处理"""
+        self._running = True
+        for chat_id, container in list(self.containers.items()):
+            if container.has_messages():
+                self._ensure_worker(chat_id)
 
 
 # 创建全局消息管理器实例
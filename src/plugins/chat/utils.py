@@ -15,7 +15,7 @@ from .message import MessageRecv, Message
 from ..message.message_base import UserInfo
 from .chat_stream import ChatStream
 from ..moods.moods import MoodManager
-from ...common.database import db
+from ..storage.recent_messages import recent_message_cache
 
 
 logger = get_module_logger("chat_utils")
@@ -87,6 +87,17 @@ async def get_embedding(text, request_type="embedding"):
     return embedding
 
 
+async def get_embeddings(texts: List[str], request_type="embedding") -> List[list]:
+    """批量获取多条文本的embedding向量，返回值与texts一一对应，失败的位置为None"""
+    llm = LLM_request(model=global_config.embedding, request_type=request_type)
+    try:
+        embeddings = await llm.get_embeddings(texts)
+    except Exception as e:
+        logger.error(f"批量获取embedding失败: {str(e)}")
+        embeddings = [None] * len(texts)
+    return embeddings
+
+
 async def get_recent_group_messages(chat_id: str, limit: int = 12) -> list:
     """从数据库获取群组最近的消息记录
 
@@ -99,13 +110,7 @@ async def get_recent_group_messages(chat_id: str, limit: int = 12) -> list:
     """
 
     # 从数据库获取最近消息
-    recent_messages = list(
-        db.messages.find(
-            {"chat_id": chat_id},
-        )
-        .sort("time", -1)
-        .limit(limit)
-    )
+    recent_messages = await recent_message_cache.find(chat_id, newest_first=True, limit=limit)
 
     if not recent_messages:
         return []
@@ -136,21 +141,19 @@ async def get_recent_group_messages(chat_id: str, limit: int = 12) -> list:
     return message_objects
 
 
-def get_recent_group_detailed_plain_text(chat_stream_id: int, limit: int = 12, combine=False):
-    recent_messages = list(
-        db.messages.find(
-            {"chat_id": chat_stream_id},
-            {
-                "time": 1,  # 返回时间字段
-                "chat_id": 1,
-                "chat_info": 1,
-                "user_info": 1,
-                "message_id": 1,  # 返回消息ID字段
-                "detailed_plain_text": 1,  # 返回处理后的文本字段
-            },
-        )
-        .sort("time", -1)
-        .limit(limit)
+async def get_recent_group_detailed_plain_text(chat_stream_id: int, limit: int = 12, combine=False):
+    recent_messages = await recent_message_cache.find(
+        chat_stream_id,
+        projection={
+            "time": 1,  # 返回时间字段
+            "chat_id": 1,
+            "chat_info": 1,
+            "user_info": 1,
+            "message_id": 1,  # 返回消息ID字段
+            "detailed_plain_text": 1,  # 返回处理后的文本字段
+        },
+        newest_first=True,
+        limit=limit,
     )
 
     if not recent_messages:
@@ -172,17 +175,15 @@ def get_recent_group_detailed_plain_text(chat_stream_id: int, limit: int = 12, c
         return message_detailed_plain_text_list
 
 
-def get_recent_group_speaker(chat_stream_id: int, sender, limit: int = 12) -> list:
+async def get_recent_group_speaker(chat_stream_id: int, sender, limit: int = 12) -> list:
     # 获取当前群聊记录内发言的人
-    recent_messages = list(
-        db.messages.find(
-            {"chat_id": chat_stream_id},
-            {
-                "user_info": 1,
-            },
-        )
-        .sort("time", -1)
-        .limit(limit)
+    recent_messages = await recent_message_cache.find(
+        chat_stream_id,
+        projection={
+            "user_info": 1,
+        },
+        newest_first=True,
+        limit=limit,
     )
 
     if not recent_messages:
@@ -574,7 +575,7 @@ def is_western_paragraph(paragraph):
     return all(is_western_char(char) for char in paragraph if char.isalnum())
 
 
-def count_messages_between(start_time: float, end_time: float, stream_id: str) -> tuple[int, int]:
+async def count_messages_between(start_time: float, end_time: float, stream_id: str) -> tuple[int, int]:
     """计算两个时间点之间的消息数量和文本总长度
 
     Args:
@@ -588,20 +589,22 @@ def count_messages_between(start_time: float, end_time: float, stream_id: str) -
         - 文本总长度：所有消息的processed_plain_text长度之和
     """
     try:
+        # 最近消息缓冲中的前缀和可以直接得出结果，缓冲不覆盖起点时再查询消息
+        counted = await recent_message_cache.count_between(stream_id, start_time, end_time)
+        if counted is not None:
+            return counted
+
         # 获取开始时间之前最新的一条消息
-        start_message = db.messages.find_one(
-            {"chat_id": stream_id, "time": {"$lte": start_time}},
-            sort=[("time", -1), ("_id", -1)],  # 按时间倒序，_id倒序（最后插入的在前）
-        )
+        start_messages = await recent_message_cache.find(
+            stream_id, {"$lte": start_time}, newest_first=True, limit=1
+        )  # 按时间倒序，_id倒序（最后插入的在前）
+        start_message = start_messages[0] if start_messages else None
 
         # 获取结束时间最近的一条消息
         # 先找到结束时间点的所有消息
-        end_time_messages = list(
-            db.messages.find(
-                {"chat_id": stream_id, "time": {"$lte": end_time}},
-                sort=[("time", -1)],  # 先按时间倒序
-            ).limit(10)
-        )  # 限制查询数量，避免性能问题
+        end_time_messages = await recent_message_cache.find(
+            stream_id, {"$lte": end_time}, newest_first=True, limit=10
+        )  # 先按时间倒序，限制查询数量，避免性能问题
 
         if not end_time_messages:
             logger.warning(f"未找到结束时间 {end_time} 之前的消息")
@@ -638,12 +641,11 @@ def count_messages_between(start_time: float, end_time: float, stream_id: str) -
 
         # 获取并打印这个时间范围内的所有消息
         # print("\n=== 时间范围内的所有消息 ===")
-        all_messages = list(
-            db.messages.find(
-                {"chat_id": stream_id, "time": {"$gte": start_message["time"], "$lte": end_message["time"]}},
-                sort=[("time", 1), ("_id", 1)],  # 按时间正序，_id正序
-            )
-        )
+        all_messages = await recent_message_cache.find(
+            stream_id,
+            {"$gte": start_message["time"], "$lte": end_message["time"]},
+            {"processed_plain_text": 1},
+        )  # 按时间正序，_id正序
 
         count = 0
         total_length = 0
@@ -1,13 +1,15 @@
+import asyncio
 import base64
 import os
 import time
 import hashlib
-from typing import Optional
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 from PIL import Image
 import io
 
 
-from ...common.database import db
+from ...common.database import async_db, db
 from ..config.config import global_config
 from ..models.utils_model import LLM_request
 
@@ -19,6 +21,7 @@ logger = get_module_logger("chat_image")
 class ImageManager:
     _instance = None
     IMAGE_DIR = "data"  # 图像存储根目录
+    DESCRIPTION_CACHE_SIZE = 2000  # 内存中缓存的图片描述数量
 
     def __new__(cls):
         if cls._instance is None:
@@ -31,6 +34,8 @@ class ImageManager:
             self._ensure_image_collection()
             self._ensure_description_collection()
             self._ensure_image_dir()
+            self._description_cache: OrderedDict[Tuple[str, str], str] = OrderedDict()  # (类型, 哈希) -> 描述
+            self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}  # 正在获取描述的图片
             self._initialized = True
             self._llm = LLM_request(model=global_config.vlm, temperature=0.4, max_tokens=300, request_type="image")
 
@@ -60,7 +65,7 @@ class ImageManager:
         # 创建新的复合索引
         db.image_descriptions.create_index([("hash", 1), ("type", 1)], unique=True)
 
-    def _get_description_from_db(self, image_hash: str, description_type: str) -> Optional[str]:
+    async def _get_description_from_db(self, image_hash: str, description_type: str) -> Optional[str]:
         """从数据库获取图片描述
 
         Args:
@@ -70,10 +75,10 @@ class ImageManager:
         Returns:
             Optional[str]: 描述文本，如果不存在则返回None
         """
-        result = db.image_descriptions.find_one({"hash": image_hash, "type": description_type})
+        result = await async_db.image_descriptions.find_one({"hash": image_hash, "type": description_type})
         return result["description"] if result else None
 
-    def _save_description_to_db(self, image_hash: str, description: str, description_type: str) -> None:
+    async def _save_description_to_db(self, image_hash: str, description: str, description_type: str) -> None:
         """保存图片描述到数据库
 
         Args:
@@ -81,8 +86,10 @@ class ImageManager:
             description: 描述文本
             description_type: 描述类型 ('emoji' 或 'image')
         """
+        # 同步更新内存缓存，其他模块直接保存的描述也能立即生效
+        self._remember_description((description_type, image_hash), description)
         try:
-            db.image_descriptions.update_one(
+            await async_db.image_descriptions.update_one(
                 {"hash": image_hash, "type": description_type},
                 {
                     "$set": {
@@ -97,6 +104,64 @@ class ImageManager:
         except Exception as e:
             logger.error(f"保存描述到数据库失败: {str(e)}")
 
+    def _remember_description(self, key: Tuple[str, str], description: str) -> None:
+        self._description_cache[key] = description
+        self._description_cache.move_to_end(key)
+        while len(self._description_cache) > self.DESCRIPTION_CACHE_SIZE:
+            self._description_cache.popitem(last=False)
+
+    async def _get_description(
+        self, image_hash: str, description_type: str, generate: Callable[[], Awaitable[Optional[str]]]
+    ) -> Optional[str]:
+        """按 内存缓存 -> 数据库 -> 生成 的顺序获取图片描述，同一张图片的并发请求只生成一次
+
+        Args:
+            image_hash: 图片哈希值
+            description_type: 描述类型 ('emoji' 或 'image')
+            generate: 缓存未命中时生成并保存描述的协程函数
+
+        Returns:
+            Optional[str]: 描述文本，生成失败时返回None
+        """
+        key = (description_type, image_hash)
+        description = self._description_cache.get(key)
+        if description:
+            self._description_cache.move_to_end(key)
+            logger.debug(f"内存缓存的{description_type}描述: {description}")
+            return description
+
+        # 查询数据库和生成描述都放在独立的任务中，所有请求者（包括第一个）只等待该任务，
+        # 任何一个请求者被取消都不会影响其他请求者和生成本身
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load_description(key, generate))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish_inflight(key, done))
+        else:
+            logger.debug(f"{description_type}描述正在生成中，等待结果: {image_hash}")
+        return await asyncio.shield(task)
+
+    async def _load_description(
+        self, key: Tuple[str, str], generate: Callable[[], Awaitable[Optional[str]]]
+    ) -> Optional[str]:
+        """缓存未命中时先查数据库，没有再生成描述"""
+        description_type, image_hash = key
+        description = await self._get_description_from_db(image_hash, description_type)
+        if description:
+            logger.debug(f"数据库缓存的{description_type}描述: {description}")
+        else:
+            description = await generate()
+        if description:
+            self._remember_description(key, description)
+        return description
+
+    def _finish_inflight(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有请求者都已取消时取回异常，避免未取回异常的警告
+        if not task.cancelled():
+            task.exception()
+
     async def get_emoji_description(self, image_base64: str) -> str:
         """获取表情包描述，带查重和保存功能"""
         try:
@@ -105,61 +170,66 @@ class ImageManager:
             image_hash = hashlib.md5(image_bytes).hexdigest()
             image_format = Image.open(io.BytesIO(image_bytes)).format.lower()
 
-            # 查询缓存的描述
-            cached_description = self._get_description_from_db(image_hash, "emoji")
-            if cached_description:
-                logger.debug(f"缓存表情包描述: {cached_description}")
-                return f"[表情包：{cached_description}]"
-
-            # 调用AI获取描述
-            if image_format == "gif" or image_format == "GIF":
-                image_base64 = self.transform_gif(image_base64)
-                prompt = "这是一个动态图表情包，每一张图代表了动态图的某一帧，黑色背景代表透明，使用中文简洁的描述一下表情包的内容和表达的情感，简短一些"
-                description, _ = await self._llm.generate_response_for_image(prompt, image_base64, "jpg")
-            else:
-                prompt = "这是一个表情包，使用中文简洁的描述一下表情包的内容和表情包所表达的情感"
-                description, _ = await self._llm.generate_response_for_image(prompt, image_base64, image_format)
-
-            cached_description = self._get_description_from_db(image_hash, "emoji")
-            if cached_description:
-                logger.warning(f"虽然生成了描述，但是找到缓存表情包描述: {cached_description}")
-                return f"[表情包：{cached_description}]"
-
-            # 根据配置决定是否保存图片
-            if global_config.EMOJI_SAVE:
-                # 生成文件名和路径
-                timestamp = int(time.time())
-                filename = f"{timestamp}_{image_hash[:8]}.{image_format}"
-                if not os.path.exists(os.path.join(self.IMAGE_DIR, "emoji")):
-                    os.makedirs(os.path.join(self.IMAGE_DIR, "emoji"))
-                file_path = os.path.join(self.IMAGE_DIR, "emoji", filename)
-
-                try:
-                    # 保存文件
-                    with open(file_path, "wb") as f:
-                        f.write(image_bytes)
-
-                    # 保存到数据库
-                    image_doc = {
-                        "hash": image_hash,
-                        "path": file_path,
-                        "type": "emoji",
-                        "description": description,
-                        "timestamp": timestamp,
-                    }
-                    db.images.update_one({"hash": image_hash}, {"$set": image_doc}, upsert=True)
-                    logger.success(f"保存表情包: {file_path}")
-                except Exception as e:
-                    logger.error(f"保存表情包文件失败: {str(e)}")
-
-            # 保存描述到数据库
-            self._save_description_to_db(image_hash, description, "emoji")
-
+            description = await self._get_description(
+                image_hash,
+                "emoji",
+                lambda: self._generate_emoji_description(image_base64, image_bytes, image_hash, image_format),
+            )
             return f"[表情包：{description}]"
         except Exception as e:
             logger.error(f"获取表情包描述失败: {str(e)}")
             return "[表情包]"
 
+    async def _generate_emoji_description(
+        self, image_base64: str, image_bytes: bytes, image_hash: str, image_format: str
+    ) -> Optional[str]:
+        """调用AI生成表情包描述并保存"""
+        # 调用AI获取描述
+        if image_format == "gif" or image_format == "GIF":
+            image_base64 = self.transform_gif(image_base64)
+            prompt = "这是一个动态图表情包，每一张图代表了动态图的某一帧，黑色背景代表透明，使用中文简洁的描述一下表情包的内容和表达的情感，简短一些"
+            description, _ = await self._llm.generate_response_for_image(prompt, image_base64, "jpg")
+        else:
+            prompt = "这是一个表情包，使用中文简洁的描述一下表情包的内容和表情包所表达的情感"
+            description, _ = await self._llm.generate_response_for_image(prompt, image_base64, image_format)
+
+        cached_description = await self._get_description_from_db(image_hash, "emoji")
+        if cached_description:
+            logger.warning(f"虽然生成了描述，但是找到缓存表情包描述: {cached_description}")
+            return cached_description
+
+        # 根据配置决定是否保存图片
+        if global_config.EMOJI_SAVE:
+            # 生成文件名和路径
+            timestamp = int(time.time())
+            filename = f"{timestamp}_{image_hash[:8]}.{image_format}"
+            if not os.path.exists(os.path.join(self.IMAGE_DIR, "emoji")):
+                os.makedirs(os.path.join(self.IMAGE_DIR, "emoji"))
+            file_path = os.path.join(self.IMAGE_DIR, "emoji", filename)
+
+            try:
+                # 保存文件
+                with open(file_path, "wb") as f:
+                    f.write(image_bytes)
+
+                # 保存到数据库
+                image_doc = {
+                    "hash": image_hash,
+                    "path": file_path,
+                    "type": "emoji",
+                    "description": description,
+                    "timestamp": timestamp,
+                }
+                await async_db.images.update_one({"hash": image_hash}, {"$set": image_doc}, upsert=True)
+                logger.success(f"保存表情包: {file_path}")
+            except Exception as e:
+                logger.error(f"保存表情包文件失败: {str(e)}")
+
+        # 保存描述到数据库
+        await self._save_description_to_db(image_hash, description, "emoji")
+
+        return description
+
     async def get_image_description(self, image_base64: str) -> str:
         """获取普通图片描述，带查重和保存功能"""
         try:
@@ -168,63 +238,68 @@ class ImageManager:
             image_hash = hashlib.md5(image_bytes).hexdigest()
             image_format = Image.open(io.BytesIO(image_bytes)).format.lower()
 
-            # 查询缓存的描述
-            cached_description = self._get_description_from_db(image_hash, "image")
-            if cached_description:
-                logger.debug(f"图片描述缓存中 {cached_description}")
-                return f"[图片：{cached_description}]"
-
-            # 调用AI获取描述
-            prompt = (
-                "请用中文描述这张图片的内容。如果有文字，请把文字都描述出来。并尝试猜测这个图片的含义。最多100个字。"
+            description = await self._get_description(
+                image_hash,
+                "image",
+                lambda: self._generate_image_description(image_base64, image_bytes, image_hash, image_format),
             )
-            description, _ = await self._llm.generate_response_for_image(prompt, image_base64, image_format)
+            if not description:
+                return "[图片]"
+            return f"[图片：{description}]"
+        except Exception as e:
+            logger.error(f"获取图片描述失败: {str(e)}")
+            return "[图片]"
 
-            cached_description = self._get_description_from_db(image_hash, "image")
-            if cached_description:
-                logger.warning(f"虽然生成了描述，但是找到缓存图片描述 {cached_description}")
-                return f"[图片：{cached_description}]"
+    async def _generate_image_description(
+        self, image_base64: str, image_bytes: bytes, image_hash: str, image_format: str
+    ) -> Optional[str]:
+        """调用AI生成图片描述并保存"""
+        # 调用AI获取描述
+        prompt = "请用中文描述这张图片的内容。如果有文字，请把文字都描述出来。并尝试猜测这个图片的含义。最多100个字。"
+        description, _ = await self._llm.generate_response_for_image(prompt, image_base64, image_format)
 
-            logger.debug(f"描述是{description}")
+        cached_description = await self._get_description_from_db(image_hash, "image")
+        if cached_description:
+            logger.warning(f"虽然生成了描述，但是找到缓存图片描述 {cached_description}")
+            return cached_description
 
-            if description is None:
-                logger.warning("AI未能生成图片描述")
-                return "[图片]"
+        logger.debug(f"描述是{description}")
 
-            # 根据配置决定是否保存图片
-            if global_config.EMOJI_SAVE:
-                # 生成文件名和路径
-                timestamp = int(time.time())
-                filename = f"{timestamp}_{image_hash[:8]}.{image_format}"
-                if not os.path.exists(os.path.join(self.IMAGE_DIR, "image")):
-                    os.makedirs(os.path.join(self.IMAGE_DIR, "image"))
-                file_path = os.path.join(self.IMAGE_DIR, "image", filename)
-
-                try:
-                    # 保存文件
-                    with open(file_path, "wb") as f:
-                        f.write(image_bytes)
-
-                    # 保存到数据库
-                    image_doc = {
-                        "hash": image_hash,
-                        "path": file_path,
-                        "type": "image",
-                        "description": description,
-                        "timestamp": timestamp,
-                    }
-                    db.images.update_one({"hash": image_hash}, {"$set": image_doc}, upsert=True)
-                    logger.success(f"保存图片: {file_path}")
-                except Exception as e:
-                    logger.error(f"保存图片文件失败: {str(e)}")
+        if description is None:
+            logger.warning("AI未能生成图片描述")
+            return None
 
-            # 保存描述到数据库
-            self._save_description_to_db(image_hash, description, "image")
+        # 根据配置决定是否保存图片
+        if global_config.EMOJI_SAVE:
+            # 生成文件名和路径
+            timestamp = int(time.time())
+            filename = f"{timestamp}_{image_hash[:8]}.{image_format}"
+            if not os.path.exists(os.path.join(self.IMAGE_DIR, "image")):
+                os.makedirs(os.path.join(self.IMAGE_DIR, "image"))
+            file_path = os.path.join(self.IMAGE_DIR, "image", filename)
 
-            return f"[图片：{description}]"
-        except Exception as e:
-            logger.error(f"获取图片描述失败: {str(e)}")
-            return "[图片]"
+            try:
+                # 保存文件
+                with open(file_path, "wb") as f:
+                    f.write(image_bytes)
+
+                # 保存到数据库
+                image_doc = {
+                    "hash": image_hash,
+                    "path": file_path,
+                    "type": "image",
+                    "description": description,
+                    "timestamp": timestamp,
+                }
+                await async_db.images.update_one({"hash": image_hash}, {"$set": image_doc}, upsert=True)
+                logger.success(f"保存图片: {file_path}")
+            except Exception as e:
+                logger.error(f"保存图片文件失败: {str(e)}")
+
+        # 保存描述到数据库
+        await self._save_description_to_db(image_hash, description, "image")
+
+        return description
 
     def transform_gif(self, gif_base64: str) -> str:
         """将GIF转换为水平拼接的静态图像
@@ -233,7 +233,7 @@ class ReasoningChat:
             logger.debug(f"创建捕捉器，thinking_id:{thinking_id}")
 
             info_catcher = info_catcher_manager.get_info_catcher(thinking_id)
-            info_catcher.catch_decide_to_response(message)
+            await info_catcher.catch_decide_to_response(message)
 
             # 生成回复
             try:
@@ -253,9 +253,9 @@ class ReasoningChat:
             with Timer("发送消息", timing_results):
                 first_bot_msg = await self._send_response_messages(message, chat, response_set, thinking_id)
 
-            info_catcher.catch_after_response(timing_results["发送消息"], response_set, first_bot_msg)
+            await info_catcher.catch_after_response(timing_results["发送消息"], response_set, first_bot_msg)
 
-            info_catcher.done_catch()
+            await info_catcher.done_catch()
 
             # 处理表情包
             with Timer("处理表情包", timing_results):
@@ -2,8 +2,13 @@ import random
 import time
 from typing import Optional, Union
 
-from ....common.database import db
-from ...chat.utils import get_embedding, get_recent_group_detailed_plain_text, get_recent_group_speaker
+from ...zhishi.knowledge_index import knowledge_index
+from ...chat.utils import (
+    get_embedding,
+    get_embeddings,
+    get_recent_group_detailed_plain_text,
+    get_recent_group_speaker,
+)
 from ...chat.chat_stream import chat_manager
 from ...moods.moods import MoodManager
 from ....individuality.individuality import Individuality
@@ -76,7 +81,7 @@ class PromptBuilder:
         who_chat_in_group = [
             (chat_stream.user_info.platform, chat_stream.user_info.user_id, chat_stream.user_info.user_nickname)
         ]
-        who_chat_in_group += get_recent_group_speaker(
+        who_chat_in_group += await get_recent_group_speaker(
             stream_id,
             (chat_stream.user_info.platform, chat_stream.user_info.user_id),
             limit=global_config.MAX_CONTEXT_SIZE,
@@ -122,7 +127,7 @@ class PromptBuilder:
         chat_in_group = True
         chat_talking_prompt = ""
         if stream_id:
-            chat_talking_prompt = get_recent_group_detailed_plain_text(
+            chat_talking_prompt = await get_recent_group_detailed_plain_text(
                 stream_id, limit=global_config.MAX_CONTEXT_SIZE, combine=True
             )
             chat_stream = chat_manager.get_stream(stream_id)
@@ -313,18 +318,13 @@ class PromptBuilder:
 
         # 批量获取嵌入向量
         embed_start_time = time.time()
-        for text in topics_batch:
-            if not text or len(text.strip()) == 0:
-                continue
-
-            try:
-                embedding = await get_embedding(text, request_type="prompt_build")
-                if embedding:
-                    embeddings[text] = embedding
-                else:
-                    logger.warning(f"获取'{text}'的嵌入向量失败")
-            except Exception as e:
-                logger.error(f"获取'{text}'的嵌入向量时发生错误: {str(e)}")
+        topics_batch = [text for text in topics_batch if text and len(text.strip()) > 0]
+        batch_embeddings = await get_embeddings(topics_batch, request_type="prompt_build")
+        for text, embedding in zip(topics_batch, batch_embeddings, strict=True):
+            if embedding:
+                embeddings[text] = embedding
+            else:
+                logger.warning(f"获取'{text}'的嵌入向量失败")
 
         logger.info(f"批量获取嵌入向量完成，耗时: {time.time() - embed_start_time:.3f}秒")
 
@@ -414,59 +414,8 @@ class PromptBuilder:
     ) -> Union[str, list]:
         if not query_embedding:
             return "" if not return_raw else []
-        # 使用余弦相似度计算
-        pipeline = [
-            {
-                "$addFields": {
-                    "dotProduct": {
-                        "$reduce": {
-                            "input": {"$range": [0, {"$size": "$embedding"}]},
-                            "initialValue": 0,
-                            "in": {
-                                "$add": [
-                                    "$$value",
-                                    {
-                                        "$multiply": [
-                                            {"$arrayElemAt": ["$embedding", "$$this"]},
-                                            {"$arrayElemAt": [query_embedding, "$$this"]},
-                                        ]
-                                    },
-                                ]
-                            },
-                        }
-                    },
-                    "magnitude1": {
-                        "$sqrt": {
-                            "$reduce": {
-                                "input": "$embedding",
-                                "initialValue": 0,
-                                "in": {"$add": ["$$value", {"$multiply": ["$$this", "$$this"]}]},
-                            }
-                        }
-                    },
-                    "magnitude2": {
-                        "$sqrt": {
-                            "$reduce": {
-                                "input": query_embedding,
-                                "initialValue": 0,
-                                "in": {"$add": ["$$value", {"$multiply": ["$$this", "$$this"]}]},
-                            }
-                        }
-                    },
-                }
-            },
-            {"$addFields": {"similarity": {"$divide": ["$dotProduct", {"$multiply": ["$magnitude1", "$magnitude2"]}]}}},
-            {
-                "$match": {
-                    "similarity": {"$gte": threshold}  # 只保留相似度大于等于阈值的结果
-                }
-            },
-            {"$sort": {"similarity": -1}},
-            {"$limit": limit},
-            {"$project": {"content": 1, "similarity": 1}},
-        ]
-
-        results = list(db.knowledges.aggregate(pipeline))
+        # 使用本地向量索引计算余弦相似度
+        results = knowledge_index.search(query_embedding, limit=limit, threshold=threshold)
         logger.debug(f"知识库查询结果数量: {len(results)}")
 
         if not results:
@@ -21,6 +21,7 @@ from ...person_info.relationship_manager import relationship_manager
 from ...chat.message_buffer import message_buffer
 from src.plugins.respon_info_catcher.info_catcher import info_catcher_manager
 from ...utils.timer_calculater import Timer
+from ...utils.pipeline import StageGraph, post_reply_queue
 from src.do_tool.tool_use import ToolUser
 
 # 定义日志配置
@@ -147,6 +148,129 @@ class ThinkFlowChat:
         )
         self.mood_manager.update_mood_from_emotion(emotion, global_config.mood_intensity_factor)
 
+    async def _observe(self, subheartflow):
+        """观察"""
+        try:
+            await subheartflow.do_observe()
+        except Exception as e:
+            logger.error(f"心流观察失败: {e}")
+            traceback.print_exc()
+
+    async def _use_tools_before_thinking(self, message: MessageRecv, chat, subheartflow, timing_results: dict) -> dict:
+        """思考前使用工具，返回解析后的工具结果"""
+        tool_info = {
+            "tool_result_info": {},
+            "get_mid_memory_id": [],
+            "update_relationship": "",
+            "send_emoji": "",
+        }
+        try:
+            tool_result = await self.tool_user.use_tool(
+                message.processed_plain_text,
+                message.message_info.user_info.user_nickname,
+                chat,
+                subheartflow,
+            )
+            for tool_name, elapsed in tool_result.get("tool_timings", {}).items():
+                timing_results[f"工具{tool_name}"] = elapsed
+            # 如果工具被使用且获得了结果，将收集到的信息合并到思考中
+            if tool_result.get("used_tools", False) and "structured_info" in tool_result:
+                tool_result_info = tool_result["structured_info"]
+                tool_info["tool_result_info"] = tool_result_info
+
+                # 动态解析工具结果
+                for tool_name, tool_data in tool_result_info.items():
+                    # 特殊判定：mid_chat_mem
+                    if tool_name == "mid_chat_mem":
+                        for mid_memory in tool_data:
+                            tool_info["get_mid_memory_id"].append(mid_memory["content"])
+
+                    # 特殊判定：change_mood
+                    if tool_name == "change_mood":
+                        for mood in tool_data:
+                            self.mood_manager.update_mood_from_emotion(
+                                mood["content"], global_config.mood_intensity_factor
+                            )
+
+                    # 特殊判定：change_relationship
+                    if tool_name == "change_relationship":
+                        tool_info["update_relationship"] = tool_data[0]["content"]
+
+                    if tool_name == "send_emoji":
+                        tool_info["send_emoji"] = tool_data[0]["content"]
+
+        except Exception as e:
+            logger.error(f"思考前工具调用失败: {e}")
+            logger.error(traceback.format_exc())
+        return tool_info
+
+    async def _update_relationship_from_tool(self, message: MessageRecv, update_relationship: str):
+        """根据工具给出的关系变化更新关系"""
+        if not update_relationship:
+            return
+        try:
+            stance, emotion = await self.gpt._get_emotion_tags_with_reason(
+                "你还没有回复", message.processed_plain_text, update_relationship
+            )
+            await relationship_manager.calculate_update_relationship_value(
+                chat_stream=message.chat_stream, label=emotion, stance=stance
+            )
+        except Exception as e:
+            logger.error(f"心流关系更新失败: {e}")
+
+    async def _think_before_reply(self, message: MessageRecv, chat, subheartflow, tool_info: dict):
+        """思考前脑内状态，返回 (current_mind, past_mind)，失败时返回None"""
+        try:
+            return await subheartflow.do_thinking_before_reply(
+                message_txt=message.processed_plain_text,
+                sender_name=message.message_info.user_info.user_nickname,
+                chat_stream=chat,
+                obs_id=tool_info["get_mid_memory_id"],
+                extra_info=tool_info["tool_result_info"],
+            )
+        except Exception as e:
+            logger.error(f"心流思考前脑内状态失败: {e}")
+            return None
+
+    async def _after_reply(self, message: MessageRecv, chat, response_set, tool_info: dict, info_catcher):
+        """回复后的收尾工作：记录思考日志、处理表情包、更新回复后脑内状态"""
+        timing_results = {}
+
+        with Timer("记录思考日志", timing_results):
+            await info_catcher.done_catch()
+
+        # 处理表情包
+        send_emoji = tool_info["send_emoji"]
+        try:
+            with Timer("处理表情包", timing_results):
+                if global_config.emoji_chance == 1:
+                    if send_emoji:
+                        logger.info(f"麦麦决定发送表情包{send_emoji}")
+                        await self._handle_emoji(message, chat, response_set, send_emoji)
+                else:
+                    if random() < global_config.emoji_chance:
+                        await self._handle_emoji(message, chat, response_set)
+        except Exception as e:
+            logger.error(f"心流处理表情包失败: {e}")
+
+        try:
+            with Timer("思考后脑内状态更新", timing_results):
+                stream_id = message.chat_stream.stream_id
+                chat_talking_prompt = ""
+                if stream_id:
+                    chat_talking_prompt = await get_recent_group_detailed_plain_text(
+                        stream_id, limit=global_config.MAX_CONTEXT_SIZE, combine=True
+                    )
+
+                await heartflow.get_subheartflow(stream_id).do_thinking_after_reply(
+                    response_set, chat_talking_prompt, tool_info["tool_result_info"]
+                )
+        except Exception as e:
+            logger.error(f"心流思考后脑内状态更新失败: {e}")
+
+        timing_str = " | ".join([f"{step}: {duration:.2f}秒" for step, duration in timing_results.items()])
+        logger.debug(f"回复后处理完成 | 性能计时: {timing_str}")
+
     async def process_message(self, message_data: str) -> None:
         """处理消息并生成回复"""
         timing_results = {}
@@ -250,94 +374,36 @@ class ThinkFlowChat:
                 logger.trace(f"创建捕捉器，thinking_id:{thinking_id}")
 
                 info_catcher = info_catcher_manager.get_info_catcher(thinking_id)
-                info_catcher.catch_decide_to_response(message)
-
-                # 观察
-                try:
-                    with Timer("观察", timing_results):
-                        await heartflow.get_subheartflow(chat.stream_id).do_observe()
-                except Exception as e:
-                    logger.error(f"心流观察失败: {e}")
-                    traceback.print_exc()
+                await info_catcher.catch_decide_to_response(message)
 
-                info_catcher.catch_after_observe(timing_results["观察"])
-
-                # 思考前使用工具
-                update_relationship = ""
-                get_mid_memory_id = []
-                tool_result_info = {}
-                send_emoji = ""
-                try:
-                    with Timer("思考前使用工具", timing_results):
-                        tool_result = await self.tool_user.use_tool(
-                            message.processed_plain_text,
-                            message.message_info.user_info.user_nickname,
-                            chat,
-                            heartflow.get_subheartflow(chat.stream_id),
-                        )
-                        # 如果工具被使用且获得了结果，将收集到的信息合并到思考中
-                        # collected_info = ""
-                        if tool_result.get("used_tools", False):
-                            if "structured_info" in tool_result:
-                                tool_result_info = tool_result["structured_info"]
-                                # collected_info = ""
-                                get_mid_memory_id = []
-                                update_relationship = ""
-
-                                # 动态解析工具结果
-                                for tool_name, tool_data in tool_result_info.items():
-                                    # tool_result_info += f"\n{tool_name} 相关信息:\n"
-                                    # for item in tool_data:
-                                    # tool_result_info += f"- {item['name']}: {item['content']}\n"
-
-                                    # 特殊判定：mid_chat_mem
-                                    if tool_name == "mid_chat_mem":
-                                        for mid_memory in tool_data:
-                                            get_mid_memory_id.append(mid_memory["content"])
-
-                                    # 特殊判定：change_mood
-                                    if tool_name == "change_mood":
-                                        for mood in tool_data:
-                                            self.mood_manager.update_mood_from_emotion(
-                                                mood["content"], global_config.mood_intensity_factor
-                                            )
-
-                                    # 特殊判定：change_relationship
-                                    if tool_name == "change_relationship":
-                                        update_relationship = tool_data[0]["content"]
-
-                                    if tool_name == "send_emoji":
-                                        send_emoji = tool_data[0]["content"]
-
-                except Exception as e:
-                    logger.error(f"思考前工具调用失败: {e}")
-                    logger.error(traceback.format_exc())
-
-                # 处理关系更新
-                if update_relationship:
-                    stance, emotion = await self.gpt._get_emotion_tags_with_reason(
-                        "你还没有回复", message.processed_plain_text, update_relationship
-                    )
-                    await relationship_manager.calculate_update_relationship_value(
-                        chat_stream=message.chat_stream, label=emotion, stance=stance
-                    )
+                subheartflow = heartflow.get_subheartflow(chat.stream_id)
 
-                # 思考前脑内状态
-                try:
-                    with Timer("思考前脑内状态", timing_results):
-                        current_mind, past_mind = await heartflow.get_subheartflow(
-                            chat.stream_id
-                        ).do_thinking_before_reply(
-                            message_txt=message.processed_plain_text,
-                            sender_name=message.message_info.user_info.user_nickname,
-                            chat_stream=chat,
-                            obs_id=get_mid_memory_id,
-                            extra_info=tool_result_info,
-                        )
-                except Exception as e:
-                    logger.error(f"心流思考前脑内状态失败: {e}")
+                # 观察和思考前使用工具互不依赖，同时进行；关系更新依赖工具结果，思考前脑内状态依赖以上全部
+                pipeline = StageGraph(timing_results)
+                pipeline.add("观察", lambda: self._observe(subheartflow))
+                pipeline.add(
+                    "思考前使用工具",
+                    lambda: self._use_tools_before_thinking(message, chat, subheartflow, timing_results),
+                )
+                pipeline.add(
+                    "关系更新",
+                    lambda tool_info: self._update_relationship_from_tool(message, tool_info["update_relationship"]),
+                    requires=("思考前使用工具",),
+                )
+                pipeline.add(
+                    "思考前脑内状态",
+                    lambda _observed, tool_info, _relationship_updated: self._think_before_reply(
+                        message, chat, subheartflow, tool_info
+                    ),
+                    requires=("观察", "思考前使用工具", "关系更新"),
+                )
+                stage_results = await pipeline.run()
+                tool_info = stage_results["思考前使用工具"]
 
-                info_catcher.catch_afer_shf_step(timing_results["思考前脑内状态"], past_mind, current_mind)
+                info_catcher.catch_after_observe(timing_results["观察"])
+                if stage_results["思考前脑内状态"]:
+                    current_mind, past_mind = stage_results["思考前脑内状态"]
+                    info_catcher.catch_afer_shf_step(timing_results["思考前脑内状态"], past_mind, current_mind)
 
                 # 生成回复
                 with Timer("生成回复", timing_results):
@@ -356,37 +422,13 @@ class ThinkFlowChat:
                 except Exception as e:
                     logger.error(f"心流发送消息失败: {e}")
 
-                info_catcher.catch_after_response(timing_results["发送消息"], response_set, first_bot_msg)
-
-                info_catcher.done_catch()
-
-                # 处理表情包
-                try:
-                    with Timer("处理表情包", timing_results):
-                        if global_config.emoji_chance == 1:
-                            if send_emoji:
-                                logger.info(f"麦麦决定发送表情包{send_emoji}")
-                                await self._handle_emoji(message, chat, response_set, send_emoji)
-                        else:
-                            if random() < global_config.emoji_chance:
-                                await self._handle_emoji(message, chat, response_set)
-                except Exception as e:
-                    logger.error(f"心流处理表情包失败: {e}")
+                await info_catcher.catch_after_response(timing_results["发送消息"], response_set, first_bot_msg)
 
-                try:
-                    with Timer("思考后脑内状态更新", timing_results):
-                        stream_id = message.chat_stream.stream_id
-                        chat_talking_prompt = ""
-                        if stream_id:
-                            chat_talking_prompt = get_recent_group_detailed_plain_text(
-                                stream_id, limit=global_config.MAX_CONTEXT_SIZE, combine=True
-                            )
-
-                        await heartflow.get_subheartflow(stream_id).do_thinking_after_reply(
-                            response_set, chat_talking_prompt, tool_result_info
-                        )
-                except Exception as e:
-                    logger.error(f"心流思考后脑内状态更新失败: {e}")
+                # 回复后的收尾工作不影响本次回复，转入后台按聊天流依次执行
+                post_reply_queue.submit(
+                    chat.stream_id,
+                    lambda: self._after_reply(message, chat, response_set, tool_info, info_catcher),
+                )
 
                 # 回复后处理
                 await willing_manager.after_generate_reply_handle(message.message_info.message_id)
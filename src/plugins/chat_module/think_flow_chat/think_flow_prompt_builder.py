@@ -78,7 +78,7 @@ class PromptBuilder:
         chat_in_group = True
         chat_talking_prompt = ""
         if stream_id:
-            chat_talking_prompt = get_recent_group_detailed_plain_text(
+            chat_talking_prompt = await get_recent_group_detailed_plain_text(
                 stream_id, limit=global_config.MAX_CONTEXT_SIZE, combine=True
             )
             chat_stream = chat_manager.get_stream(stream_id)
@@ -179,7 +179,7 @@ class PromptBuilder:
         chat_in_group = True
         chat_talking_prompt = ""
         if stream_id:
-            chat_talking_prompt = get_recent_group_detailed_plain_text(
+            chat_talking_prompt = await get_recent_group_detailed_plain_text(
                 stream_id, limit=global_config.MAX_CONTEXT_SIZE, combine=True
             )
             chat_stream = chat_manager.get_stream(stream_id)
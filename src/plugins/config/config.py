@@ -280,6 +280,25 @@ class BotConfig:
     # remote
     remote_enable: bool = True  # 是否启用远程控制
 
+    # llm_connection
+    llm_connection_pool_size: int = 100  # LLM 请求连接池的最大连接数
+    llm_connection_limit_per_host: int = 20  # 对同一服务商的最大并发连接数，0 为不限制
+    llm_keepalive_timeout: float = 30  # 空闲连接的保活时间（秒）
+    llm_dns_cache_ttl: int = 300  # DNS 解析结果缓存时间（秒）
+
+    # llm_scheduler
+    llm_default_max_concurrency: int = 16  # 未单独配置的服务商的最大并发请求数，0 为不限制
+    llm_rate_limits: List[Dict] = field(default_factory=list)  # 按服务商或模型配置的并发数与 RPM/TPM 限制
+
+    # embedding_cache
+    enable_embedding_cache: bool = True  # 是否缓存文本的embedding向量
+    embedding_cache_memory_size: int = 4096  # 进程内缓存的最大条目数
+    embedding_cache_db_size: int = 200000  # 数据库中缓存的最大条目数
+
+    # knowledge_index
+    knowledge_index_ivf: bool = False  # 知识库向量索引是否使用 IVF 近似检索
+    knowledge_index_nprobe: int = 8  # IVF 近似检索时查询的聚类数
+
     # experimental
     enable_friend_chat: bool = False  # 是否启用好友聊天
     # enable_think_flow: bool = False  # 是否启用思考流程
@@ -577,6 +596,10 @@ class BotConfig:
                             # 如果没有temp参数，就删除默认值
                             cfg_target.pop("temp", None)
 
+                        # 嵌入模型可以配置单次请求的最大文本条数
+                        if "batch_size" in cfg_item:
+                            cfg_target["batch_size"] = cfg_item["batch_size"]
+
                         provider = cfg_item.get("provider")
                         if provider is None:
                             logger.error(f"provider 字段在模型配置 {item} 中不存在，请检查")
@@ -684,6 +707,35 @@ class BotConfig:
                 for k in platforms_config.keys():
                     config.api_urls[k] = platforms_config[k]
 
+        def llm_connection(parent: dict):
+            llm_connection_config = parent["llm_connection"]
+            config.llm_connection_pool_size = llm_connection_config.get("pool_size", config.llm_connection_pool_size)
+            config.llm_connection_limit_per_host = llm_connection_config.get(
+                "limit_per_host", config.llm_connection_limit_per_host
+            )
+            config.llm_keepalive_timeout = llm_connection_config.get("keepalive_timeout", config.llm_keepalive_timeout)
+            config.llm_dns_cache_ttl = llm_connection_config.get("dns_cache_ttl", config.llm_dns_cache_ttl)
+
+        def llm_scheduler(parent: dict):
+            llm_scheduler_config = parent["llm_scheduler"]
+            config.llm_default_max_concurrency = llm_scheduler_config.get(
+                "default_max_concurrency", config.llm_default_max_concurrency
+            )
+            config.llm_rate_limits = llm_scheduler_config.get("limits", config.llm_rate_limits)
+
+        def embedding_cache(parent: dict):
+            embedding_cache_config = parent["embedding_cache"]
+            config.enable_embedding_cache = embedding_cache_config.get("enable", config.enable_embedding_cache)
+            config.embedding_cache_memory_size = embedding_cache_config.get(
+                "memory_size", config.embedding_cache_memory_size
+            )
+            config.embedding_cache_db_size = embedding_cache_config.get("db_size", config.embedding_cache_db_size)
+
+        def knowledge_index(parent: dict):
+            knowledge_index_config = parent["knowledge_index"]
+            config.knowledge_index_ivf = knowledge_index_config.get("ivf", config.knowledge_index_ivf)
+            config.knowledge_index_nprobe = knowledge_index_config.get("nprobe", config.knowledge_index_nprobe)
+
         def experimental(parent: dict):
             experimental_config = parent["experimental"]
             config.enable_friend_chat = experimental_config.get("enable_friend_chat", config.enable_friend_chat)
@@ -727,6 +779,10 @@ class BotConfig:
             "experimental": {"func": experimental, "support": ">=0.0.11", "necessary": False},
             "heartflow": {"func": heartflow, "support": ">=1.0.2", "necessary": False},
             "network_search": {"func": network_search, "support": ">=1.0.0", "necessary": False},  # 新增配置项
+            "llm_connection": {"func": llm_connection, "support": ">=1.3.1", "necessary": False},
+            "llm_scheduler": {"func": llm_scheduler, "support": ">=1.3.2", "necessary": False},
+            "embedding_cache": {"func": embedding_cache, "support": ">=1.3.3", "necessary": False},
+            "knowledge_index": {"func": knowledge_index, "support": ">=1.3.5", "necessary": False},
         }
 
         # 原地修改，将 字符串版本表达式 转换成 版本对象
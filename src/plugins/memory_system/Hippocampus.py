@@ -8,53 +8,13 @@ import jieba
 import networkx as nx
 import numpy as np
 from collections import Counter
+from pymongo import DeleteMany, UpdateMany, UpdateOne
 from ...common.database import db
 from ...plugins.models.utils_model import LLM_request
 from src.common.logger import get_module_logger, LogConfig, MEMORY_STYLE_CONFIG
 from src.plugins.memory_system.sample_distribution import MemoryBuildScheduler  # 分布生成器
 from .memory_config import MemoryConfig
-
-
-def get_closest_chat_from_db(length: int, timestamp: str):
-    # print(f"获取最接近指定时间戳的聊天记录，长度: {length}, 时间戳: {timestamp}")
-    # print(f"当前时间: {timestamp},转换后时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}")
-    chat_records = []
-    closest_record = db.messages.find_one({"time": {"$lte": timestamp}}, sort=[("time", -1)])
-    # print(f"最接近的记录: {closest_record}")
-    if closest_record:
-        closest_time = closest_record["time"]
-        chat_id = closest_record["chat_id"]  # 获取chat_id
-        # 获取该时间戳之后的length条消息，保持相同的chat_id
-        chat_records = list(
-            db.messages.find(
-                {
-                    "time": {"$gt": closest_time},
-                    "chat_id": chat_id,  # 添加chat_id过滤
-                }
-            )
-            .sort("time", 1)
-            .limit(length)
-        )
-        # print(f"获取到的记录: {chat_records}")
-        length = len(chat_records)
-        # print(f"获取到的记录长度: {length}")
-        # 转换记录格式
-        formatted_records = []
-        for record in chat_records:
-            # 兼容行为，前向兼容老数据
-            formatted_records.append(
-                {
-                    "_id": record["_id"],
-                    "time": record["time"],
-                    "chat_id": record["chat_id"],
-                    "detailed_plain_text": record.get("detailed_plain_text", ""),  # 添加文本内容
-                    "memorized_times": record.get("memorized_times", 0),  # 添加记忆次数
-                }
-            )
-
-        return formatted_records
-
-    return []
+from .compiled_graph import CompiledMemoryGraph
 
 
 def calculate_information_content(text):
@@ -80,6 +40,97 @@ def cosine_similarity(v1, v2):
     return dot_product / (norm1 * norm2)
 
 
+def build_term_vector(text) -> tuple:
+    """对文本分词一次，得到稀疏的 0/1 词向量 (词集合, 模长)"""
+    words = frozenset(jieba.cut(text))
+    return words, math.sqrt(len(words))
+
+
+def term_vector_similarity(v1, v2) -> float:
+    """计算两个稀疏词向量的余弦相似度，结果与对 0/1 稠密向量调用 cosine_similarity 相同"""
+    words1, norm1 = v1
+    words2, norm2 = v2
+    if norm1 == 0 or norm2 == 0:
+        return 0
+    return len(words1 & words2) / (norm1 * norm2)
+
+
+class ConceptIndex:
+    """词 -> 概念 的倒排索引，用于快速查找名称相似的概念
+
+    只有与查询至少共享一个词的概念才可能有非零相似度，
+    因此只需对倒排表命中的候选概念计算精确的余弦相似度。
+    """
+
+    def __init__(self):
+        self.vectors = {}  # 概念 -> 词向量
+        self.order = {}  # 概念 -> 插入序号，与 G.nodes() 的顺序一致
+        self.postings = {}  # 词 -> 包含该词的概念集合
+        self.next_seq = 0
+        self.stale = True
+
+    def invalidate(self):
+        """标记为过期，下次查询前整体重建"""
+        self.stale = True
+
+    def rebuild(self, G):
+        self.vectors = {}
+        self.order = {}
+        self.postings = {}
+        self.next_seq = 0
+        self.stale = False
+        for concept in G.nodes():
+            self.add(concept)
+
+    def ensure(self, G):
+        """保证索引与图一致，必要时重建"""
+        if self.stale or len(self.vectors) != G.number_of_nodes():
+            self.rebuild(G)
+
+    def add(self, concept):
+        if self.stale or concept in self.vectors:
+            return
+        vector = build_term_vector(concept)
+        self.vectors[concept] = vector
+        self.order[concept] = self.next_seq
+        self.next_seq += 1
+        for word in vector[0]:
+            self.postings.setdefault(word, set()).add(concept)
+
+    def remove(self, concept):
+        if self.stale or concept not in self.vectors:
+            return
+        words, _ = self.vectors.pop(concept)
+        del self.order[concept]
+        for word in words:
+            posting = self.postings.get(word)
+            if posting is not None:
+                posting.discard(concept)
+                if not posting:
+                    del self.postings[word]
+
+    def find_similar(self, query_vector, threshold: float) -> list:
+        """查找与查询词向量相似度不低于阈值的概念
+
+        Returns:
+            list: [(概念, 相似度)]，按概念在图中的顺序排列
+        """
+        words, norm = query_vector
+        if norm == 0:
+            return []
+
+        candidates = set()
+        for word in words:
+            candidates.update(self.postings.get(word, ()))
+
+        results = []
+        for concept in sorted(candidates, key=self.order.__getitem__):
+            similarity = term_vector_similarity(query_vector, self.vectors[concept])
+            if similarity >= threshold:
+                results.append((concept, similarity))
+        return results
+
+
 # 定义日志配置
 memory_config = LogConfig(
     # 使用海马体专用样式
@@ -91,9 +142,96 @@ memory_config = LogConfig(
 logger = get_module_logger("memory_system", config=memory_config)
 
 
+def edge_key(concept1, concept2) -> tuple:
+    """无向边的规范化键，与节点顺序无关"""
+    return (concept1, concept2) if concept1 <= concept2 else (concept2, concept1)
+
+
 class Memory_graph:
     def __init__(self):
         self.G = nx.Graph()  # 使用 networkx 的图结构
+        # 变更日志：自上次落库以来新增、修改或删除过的节点和边
+        # 落库时根据图中的当前状态决定是 upsert 还是删除
+        self.changed_nodes = set()
+        self.changed_edges = set()
+        # 用于扩散激活的 CSR 压缩形式，随图的修改增量维护
+        self.compiled = CompiledMemoryGraph()
+        # 概念名称的倒排索引，用于查找相似话题
+        self.concept_index = ConceptIndex()
+
+    def mark_node_changed(self, concept):
+        self.changed_nodes.add(concept)
+
+    def mark_edge_changed(self, concept1, concept2):
+        self.changed_edges.add(edge_key(concept1, concept2))
+
+    def has_changes(self) -> bool:
+        return bool(self.changed_nodes or self.changed_edges)
+
+    def pop_changes(self) -> tuple:
+        """取出并清空变更日志，返回 (changed_nodes, changed_edges)"""
+        changed_nodes, changed_edges = self.changed_nodes, self.changed_edges
+        self.changed_nodes = set()
+        self.changed_edges = set()
+        return changed_nodes, changed_edges
+
+    def restore_changes(self, changed_nodes, changed_edges):
+        """落库失败时将变更放回日志，等待下次重试"""
+        self.changed_nodes |= changed_nodes
+        self.changed_edges |= changed_edges
+
+    def clear(self):
+        """清空图和变更日志"""
+        self.G.clear()
+        self.changed_nodes.clear()
+        self.changed_edges.clear()
+        self.compiled.invalidate()
+        self.concept_index.invalidate()
+
+    def get_compiled(self) -> CompiledMemoryGraph:
+        """获取与当前图一致的 CSR 压缩形式"""
+        self.compiled.ensure(self.G)
+        return self.compiled
+
+    def find_similar_concepts(self, text, threshold: float) -> list:
+        """查找名称与 text 分词后余弦相似度不低于阈值的概念，返回 [(概念, 相似度)]"""
+        self.concept_index.ensure(self.G)
+        return self.concept_index.find_similar(build_term_vector(text), threshold)
+
+    def add_edge(self, concept1, concept2, **attrs):
+        """添加或覆盖一条边，并记录到变更日志"""
+        self.G.add_edge(concept1, concept2, **attrs)
+        self.mark_edge_changed(concept1, concept2)
+        self.compiled.set_edge(concept1, concept2, self.G[concept1][concept2].get("strength", 1))
+        self.concept_index.add(concept1)
+        self.concept_index.add(concept2)
+
+    def update_edge(self, concept1, concept2, **attrs):
+        """更新已有边的属性，并记录到变更日志"""
+        self.G[concept1][concept2].update(attrs)
+        self.mark_edge_changed(concept1, concept2)
+        if "strength" in attrs:
+            self.compiled.set_edge(concept1, concept2, attrs["strength"])
+
+    def remove_edge(self, concept1, concept2):
+        self.G.remove_edge(concept1, concept2)
+        self.mark_edge_changed(concept1, concept2)
+        self.compiled.remove_edge(concept1, concept2)
+
+    def update_node(self, concept, **attrs):
+        """更新已有节点的属性，并记录到变更日志"""
+        self.G.nodes[concept].update(attrs)
+        self.mark_node_changed(concept)
+
+    def remove_node(self, concept):
+        """删除节点，与之相连的边一并记录为删除"""
+        for neighbor in list(self.G.neighbors(concept)):
+            self.mark_edge_changed(concept, neighbor)
+        self.G.remove_node(concept)
+        self.mark_node_changed(concept)
+        # 删除节点会改变下标映射，直接整体重建
+        self.compiled.invalidate()
+        self.concept_index.remove(concept)
 
     def connect_dot(self, concept1, concept2):
         # 避免自连接
@@ -116,19 +254,27 @@ class Memory_graph:
                 created_time=current_time,  # 添加创建时间
                 last_modified=current_time,
             )  # 添加最后修改时间
+        self.mark_edge_changed(concept1, concept2)
+        self.compiled.set_edge(concept1, concept2, self.G[concept1][concept2]["strength"])
+        self.concept_index.add(concept1)
+        self.concept_index.add(concept2)
 
     def add_dot(self, concept, memory):
         current_time = datetime.datetime.now().timestamp()
+        self.mark_node_changed(concept)
+        memory_vector = build_term_vector(memory)
 
         if concept in self.G:
             if "memory_items" in self.G.nodes[concept]:
                 if not isinstance(self.G.nodes[concept]["memory_items"], list):
                     self.G.nodes[concept]["memory_items"] = [self.G.nodes[concept]["memory_items"]]
                 self.G.nodes[concept]["memory_items"].append(memory)
+                self.G.nodes[concept].setdefault("memory_vectors", {})[memory] = memory_vector
                 # 更新最后修改时间
                 self.G.nodes[concept]["last_modified"] = current_time
             else:
                 self.G.nodes[concept]["memory_items"] = [memory]
+                self.G.nodes[concept]["memory_vectors"] = {memory: memory_vector}
                 # 如果节点存在但没有memory_items,说明是第一次添加memory,设置created_time
                 if "created_time" not in self.G.nodes[concept]:
                     self.G.nodes[concept]["created_time"] = current_time
@@ -138,9 +284,27 @@ class Memory_graph:
             self.G.add_node(
                 concept,
                 memory_items=[memory],
+                memory_vectors={memory: memory_vector},
                 created_time=current_time,  # 添加创建时间
                 last_modified=current_time,
             )  # 添加最后修改时间
+            self.compiled.add_node(concept)
+            self.concept_index.add(concept)
+
+    def get_memory_vectors(self, concept) -> dict:
+        """获取节点各条记忆的稀疏词向量 {记忆: 词向量}
+
+        add_dot 写入时已完成分词，从数据库加载的记忆在首次访问时补齐。
+        """
+        node_data = self.G.nodes[concept]
+        memory_items = node_data.get("memory_items", [])
+        if not isinstance(memory_items, list):
+            memory_items = [memory_items] if memory_items else []
+
+        cached = node_data.get("memory_vectors", {})
+        vectors = {memory: cached.get(memory) or build_term_vector(memory) for memory in memory_items}
+        node_data["memory_vectors"] = vectors
+        return vectors
 
     def get_dot(self, concept):
         # 检查节点是否存在于图中
@@ -216,10 +380,10 @@ class Memory_graph:
 
                 # 更新节点的记忆项
                 if memory_items:
-                    self.G.nodes[topic]["memory_items"] = memory_items
+                    self.update_node(topic, memory_items=memory_items)
                 else:
                     # 如果没有记忆项了，删除整个节点
-                    self.G.remove_node(topic)
+                    self.remove_node(topic)
 
                 return removed_item
 
@@ -679,11 +843,11 @@ class EntorhinalCortex:
 
         timestamps = sample_scheduler.get_timestamp_array()
         logger.info(f"回忆往事: {[time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)) for ts in timestamps]}")
+        snippets = self.batch_get_msg_snippets(
+            timestamps, self.config.build_memory_sample_length, max_memorized_time_per_msg
+        )
         chat_samples = []
-        for timestamp in timestamps:
-            messages = self.random_get_msg_snippet(
-                timestamp, self.config.build_memory_sample_length, max_memorized_time_per_msg
-            )
+        for timestamp, messages in zip(timestamps, snippets, strict=True):
             if messages:
                 time_diff = (datetime.datetime.now().timestamp() - timestamp) / 3600
                 logger.debug(f"成功抽取 {time_diff:.1f} 小时前的消息样本，共{len(messages)}条")
@@ -693,121 +857,100 @@ class EntorhinalCortex:
 
         return chat_samples
 
-    def random_get_msg_snippet(self, target_timestamp: float, chat_size: int, max_memorized_time_per_msg: int) -> list:
-        """从数据库中随机获取指定时间戳附近的消息片段"""
-        try_count = 0
-        while try_count < 3:
-            messages = get_closest_chat_from_db(length=chat_size, timestamp=target_timestamp)
-            if messages:
-                for message in messages:
-                    if message["memorized_times"] >= max_memorized_time_per_msg:
-                        messages = None
-                        break
-                if messages:
-                    for message in messages:
-                        db.messages.update_one(
-                            {"_id": message["_id"]}, {"$set": {"memorized_times": message["memorized_times"] + 1}}
-                        )
-                    return messages
-            try_count += 1
-        return None
-
-    async def sync_memory_to_db(self):
-        """将记忆图同步到数据库"""
-        # 获取数据库中所有节点和内存中所有节点
-        db_nodes = list(db.graph_data.nodes.find())
-        memory_nodes = list(self.memory_graph.G.nodes(data=True))
+    def batch_get_msg_snippets(self, timestamps: list, chat_size: int, max_memorized_time_per_msg: int) -> list:
+        """一次性获取多个时间戳附近的消息片段，并批量增加这些消息的记忆次数
 
-        # 转换数据库节点为字典格式,方便查找
-        db_nodes_dict = {node["concept"]: node for node in db_nodes}
+        每个时间戳先找到不晚于它的最近一条消息，再取同一聊天中其后的 chat_size 条消息。
+        所有片段通过一次聚合查询取回，记忆次数达到上限的片段在查询中直接过滤。
 
-        # 检查并更新节点
-        for concept, data in memory_nodes:
-            memory_items = data.get("memory_items", [])
-            if not isinstance(memory_items, list):
-                memory_items = [memory_items] if memory_items else []
-
-            # 计算内存中节点的特征值
-            memory_hash = self.hippocampus.calculate_node_hash(concept, memory_items)
-
-            # 获取时间信息
-            created_time = data.get("created_time", datetime.datetime.now().timestamp())
-            last_modified = data.get("last_modified", datetime.datetime.now().timestamp())
-
-            if concept not in db_nodes_dict:
-                # 数据库中缺少的节点,添加
-                node_data = {
-                    "concept": concept,
-                    "memory_items": memory_items,
-                    "hash": memory_hash,
-                    "created_time": created_time,
-                    "last_modified": last_modified,
-                }
-                db.graph_data.nodes.insert_one(node_data)
-            else:
-                # 获取数据库中节点的特征值
-                db_node = db_nodes_dict[concept]
-                db_hash = db_node.get("hash", None)
-
-                # 如果特征值不同,则更新节点
-                if db_hash != memory_hash:
-                    db.graph_data.nodes.update_one(
-                        {"concept": concept},
+        Returns:
+            list: 与 timestamps 一一对应的消息片段，抽取失败的位置为 None
+        """
+        snippets = [None] * len(timestamps)
+        if not timestamps:
+            return snippets
+
+        # 每个时间戳各自查找锚点消息，用 $unionWith 合并到同一次查询中
+        anchor_pipelines = [
+            [
+                {"$match": {"time": {"$lte": timestamp}}},
+                {"$sort": {"time": -1}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "chat_id": 1, "time": 1, "sample_index": {"$literal": i}}},
+            ]
+            for i, timestamp in enumerate(timestamps)
+        ]
+        pipeline = list(anchor_pipelines[0])
+        for anchor_pipeline in anchor_pipelines[1:]:
+            pipeline.append({"$unionWith": {"coll": "messages", "pipeline": anchor_pipeline}})
+        pipeline += [
+            {
+                "$lookup": {
+                    "from": "messages",
+                    "let": {"chat_id": "$chat_id", "time": "$time"},
+                    "pipeline": [
                         {
-                            "$set": {
-                                "memory_items": memory_items,
-                                "hash": memory_hash,
-                                "created_time": created_time,
-                                "last_modified": last_modified,
+                            "$match": {
+                                "$expr": {"$and": [{"$eq": ["$chat_id", "$$chat_id"]}, {"$gt": ["$time", "$$time"]}]}
                             }
                         },
-                    )
+                        {"$sort": {"time": 1}},
+                        {"$limit": chat_size},
+                        {"$project": {"time": 1, "chat_id": 1, "detailed_plain_text": 1, "memorized_times": 1}},
+                    ],
+                    "as": "messages",
+                }
+            },
+            # 片段为空，或其中任意一条消息已达到记忆次数上限，则放弃该片段
+            {
+                "$match": {
+                    "messages.0": {"$exists": True},
+                    "messages.memorized_times": {"$not": {"$gte": max_memorized_time_per_msg}},
+                }
+            },
+        ]
+
+        try:
+            results = list(db.messages.aggregate(pipeline))
+        except Exception as e:
+            logger.error(f"批量抽取消息样本失败: {e}")
+            return snippets
+
+        seen_anchors = set()
+        memorized_counter = Counter()
+        for result in results:
+            # 多个时间戳落到同一锚点时只保留一个片段
+            anchor = (result["chat_id"], result["time"])
+            if anchor in seen_anchors:
+                continue
+            seen_anchors.add(anchor)
 
-        # 处理边的信息
-        db_edges = list(db.graph_data.edges.find())
-        memory_edges = list(self.memory_graph.G.edges(data=True))
-
-        # 创建边的哈希值字典
-        db_edge_dict = {}
-        for edge in db_edges:
-            edge_hash = self.hippocampus.calculate_edge_hash(edge["source"], edge["target"])
-            db_edge_dict[(edge["source"], edge["target"])] = {"hash": edge_hash, "strength": edge.get("strength", 1)}
-
-        # 检查并更新边
-        for source, target, data in memory_edges:
-            edge_hash = self.hippocampus.calculate_edge_hash(source, target)
-            edge_key = (source, target)
-            strength = data.get("strength", 1)
-
-            # 获取边的时间信息
-            created_time = data.get("created_time", datetime.datetime.now().timestamp())
-            last_modified = data.get("last_modified", datetime.datetime.now().timestamp())
-
-            if edge_key not in db_edge_dict:
-                # 添加新边
-                edge_data = {
-                    "source": source,
-                    "target": target,
-                    "strength": strength,
-                    "hash": edge_hash,
-                    "created_time": created_time,
-                    "last_modified": last_modified,
+            snippets[result["sample_index"]] = [
+                {
+                    "_id": record["_id"],
+                    "time": record["time"],
+                    "chat_id": record["chat_id"],
+                    "detailed_plain_text": record.get("detailed_plain_text", ""),  # 添加文本内容
+                    "memorized_times": record.get("memorized_times", 0),  # 添加记忆次数
                 }
-                db.graph_data.edges.insert_one(edge_data)
-            else:
-                # 检查边的特征值是否变化
-                if db_edge_dict[edge_key]["hash"] != edge_hash:
-                    db.graph_data.edges.update_one(
-                        {"source": source, "target": target},
-                        {
-                            "$set": {
-                                "hash": edge_hash,
-                                "strength": strength,
-                                "created_time": created_time,
-                                "last_modified": last_modified,
-                            }
-                        },
-                    )
+                for record in result["messages"]
+            ]
+            memorized_counter.update(record["_id"] for record in result["messages"])
+
+        # 按增量分组，用尽量少的 update_many 批量增加记忆次数
+        ids_by_increment = {}
+        for message_id, increment in memorized_counter.items():
+            ids_by_increment.setdefault(increment, []).append(message_id)
+        if ids_by_increment:
+            db.messages.bulk_write(
+                [
+                    UpdateMany({"_id": {"$in": ids}}, {"$inc": {"memorized_times": increment}})
+                    for increment, ids in ids_by_increment.items()
+                ],
+                ordered=False,
+            )
+
+        return snippets
 
     def sync_memory_from_db(self):
         """从数据库同步数据到内存中的图结构"""
@@ -815,7 +958,7 @@ class EntorhinalCortex:
         need_update = False
 
         # 清空当前图
-        self.memory_graph.G.clear()
+        self.memory_graph.clear()
 
         # 从数据库加载所有节点
         nodes = list(db.graph_data.nodes.find())
@@ -876,62 +1019,91 @@ class EntorhinalCortex:
                 self.memory_graph.G.add_edge(
                     source, target, strength=strength, created_time=created_time, last_modified=last_modified
                 )
+            else:
+                # 悬空的边记入变更日志，下次落库时从数据库中删除
+                self.memory_graph.mark_edge_changed(source, target)
 
         if need_update:
             logger.success("[数据库] 已为缺失的时间字段进行补充")
 
-    async def resync_memory_to_db(self):
-        """清空数据库并重新同步所有记忆数据"""
+    async def flush_memory_changes(self):
+        """将变更日志中记录的节点和边增量写入数据库
+
+        仍在图中的节点/边使用 upsert 写入，已从图中删除的则从数据库删除，
+        所有操作通过 bulk_write 批量提交。
+        """
+        if not self.memory_graph.has_changes():
+            return
+
         start_time = time.time()
-        logger.info("[数据库] 开始重新同步所有记忆数据...")
-
-        # 清空数据库
-        clear_start = time.time()
-        db.graph_data.nodes.delete_many({})
-        db.graph_data.edges.delete_many({})
-        clear_end = time.time()
-        logger.info(f"[数据库] 清空数据库耗时: {clear_end - clear_start:.2f}秒")
-
-        # 获取所有节点和边
-        memory_nodes = list(self.memory_graph.G.nodes(data=True))
-        memory_edges = list(self.memory_graph.G.edges(data=True))
-
-        # 重新写入节点
-        node_start = time.time()
-        for concept, data in memory_nodes:
-            memory_items = data.get("memory_items", [])
-            if not isinstance(memory_items, list):
-                memory_items = [memory_items] if memory_items else []
+        changed_nodes, changed_edges = self.memory_graph.pop_changes()
+        current_time = datetime.datetime.now().timestamp()
 
-            node_data = {
-                "concept": concept,
-                "memory_items": memory_items,
-                "hash": self.hippocampus.calculate_node_hash(concept, memory_items),
-                "created_time": data.get("created_time", datetime.datetime.now().timestamp()),
-                "last_modified": data.get("last_modified", datetime.datetime.now().timestamp()),
-            }
-            db.graph_data.nodes.insert_one(node_data)
-        node_end = time.time()
-        logger.info(f"[数据库] 写入 {len(memory_nodes)} 个节点耗时: {node_end - node_start:.2f}秒")
-
-        # 重新写入边
-        edge_start = time.time()
-        for source, target, data in memory_edges:
-            edge_data = {
-                "source": source,
-                "target": target,
-                "strength": data.get("strength", 1),
-                "hash": self.hippocampus.calculate_edge_hash(source, target),
-                "created_time": data.get("created_time", datetime.datetime.now().timestamp()),
-                "last_modified": data.get("last_modified", datetime.datetime.now().timestamp()),
-            }
-            db.graph_data.edges.insert_one(edge_data)
-        edge_end = time.time()
-        logger.info(f"[数据库] 写入 {len(memory_edges)} 条边耗时: {edge_end - edge_start:.2f}秒")
+        node_ops = []
+        for concept in changed_nodes:
+            if concept in self.memory_graph.G:
+                data = self.memory_graph.G.nodes[concept]
+                memory_items = data.get("memory_items", [])
+                if not isinstance(memory_items, list):
+                    memory_items = [memory_items] if memory_items else []
+                node_ops.append(
+                    UpdateOne(
+                        {"concept": concept},
+                        {
+                            "$set": {
+                                "concept": concept,
+                                "memory_items": memory_items,
+                                "hash": self.hippocampus.calculate_node_hash(concept, memory_items),
+                                "created_time": data.get("created_time", current_time),
+                                "last_modified": data.get("last_modified", current_time),
+                            }
+                        },
+                        upsert=True,
+                    )
+                )
+            else:
+                node_ops.append(DeleteMany({"concept": concept}))
+
+        edge_ops = []
+        for source, target in changed_edges:
+            # 数据库中的边可能以任意方向存储
+            edge_filter = {"$or": [{"source": source, "target": target}, {"source": target, "target": source}]}
+            if self.memory_graph.G.has_edge(source, target):
+                data = self.memory_graph.G[source][target]
+                edge_ops.append(
+                    UpdateOne(
+                        edge_filter,
+                        {
+                            "$set": {
+                                "source": source,
+                                "target": target,
+                                "strength": data.get("strength", 1),
+                                "hash": self.hippocampus.calculate_edge_hash(source, target),
+                                "created_time": data.get("created_time", current_time),
+                                "last_modified": data.get("last_modified", current_time),
+                            }
+                        },
+                        upsert=True,
+                    )
+                )
+            else:
+                edge_ops.append(DeleteMany(edge_filter))
+
+        try:
+            if node_ops:
+                db.graph_data.nodes.bulk_write(node_ops, ordered=False)
+            if edge_ops:
+                db.graph_data.edges.bulk_write(edge_ops, ordered=False)
+        except Exception as e:
+            # 写入失败时保留变更，下次同步时重试（upsert 与删除均为幂等操作）
+            self.memory_graph.restore_changes(changed_nodes, changed_edges)
+            logger.error(f"[数据库] 增量同步记忆失败: {e}")
+            return
 
         end_time = time.time()
-        logger.success(f"[数据库] 重新同步完成，总耗时: {end_time - start_time:.2f}秒")
-        logger.success(f"[数据库] 同步了 {len(memory_nodes)} 个节点和 {len(memory_edges)} 条边")
+        logger.info(
+            f"[数据库] 增量同步 {len(node_ops)} 个节点和 {len(edge_ops)} 条边，耗时: {end_time - start_time:.2f}秒"
+        )
 
 
 # 海马体
@@ -1014,29 +1186,16 @@ class Hippocampus:
         if not keyword:
             return []
 
-        # 获取所有节点
-        all_nodes = list(self.memory_graph.G.nodes())
         memories = []
 
-        # 计算关键词的词集合
-        keyword_words = set(jieba.cut(keyword))
-
-        # 遍历所有节点，计算相似度
-        for node in all_nodes:
-            node_words = set(jieba.cut(node))
-            all_words = keyword_words | node_words
-            v1 = [1 if word in keyword_words else 0 for word in all_words]
-            v2 = [1 if word in node_words else 0 for word in all_words]
-            similarity = cosine_similarity(v1, v2)
-
-            # 如果相似度超过阈值，获取该节点的记忆
-            if similarity >= 0.3:  # 可以调整这个阈值
-                node_data = self.memory_graph.G.nodes[node]
-                memory_items = node_data.get("memory_items", [])
-                if not isinstance(memory_items, list):
-                    memory_items = [memory_items] if memory_items else []
+        # 通过倒排索引找出相似度超过阈值的节点，获取其记忆
+        for node, similarity in self.memory_graph.find_similar_concepts(keyword, 0.3):  # 可以调整这个阈值
+            node_data = self.memory_graph.G.nodes[node]
+            memory_items = node_data.get("memory_items", [])
+            if not isinstance(memory_items, list):
+                memory_items = [memory_items] if memory_items else []
 
-                memories.append((node, memory_items, similarity))
+            memories.append((node, memory_items, similarity))
 
         # 按相似度降序排序
         memories.sort(key=lambda x: x[2], reverse=True)
@@ -1105,56 +1264,9 @@ class Hippocampus:
 
         logger.info(f"有效的关键词: {', '.join(valid_keywords)}")
 
-        # 从每个关键词获取记忆
-        all_memories = []
-        activate_map = {}  # 存储每个词的累计激活值
-
-        # 对每个关键词进行扩散式检索
-        for keyword in valid_keywords:
-            logger.debug(f"开始以关键词 '{keyword}' 为中心进行扩散检索 (最大深度: {max_depth}):")
-            # 初始化激活值
-            activation_values = {keyword: 1.0}
-            # 记录已访问的节点
-            visited_nodes = {keyword}
-            # 待处理的节点队列，每个元素是(节点, 激活值, 当前深度)
-            nodes_to_process = [(keyword, 1.0, 0)]
-
-            while nodes_to_process:
-                current_node, current_activation, current_depth = nodes_to_process.pop(0)
-
-                # 如果激活值小于0或超过最大深度，停止扩散
-                if current_activation <= 0 or current_depth >= max_depth:
-                    continue
-
-                # 获取当前节点的所有邻居
-                neighbors = list(self.memory_graph.G.neighbors(current_node))
-
-                for neighbor in neighbors:
-                    if neighbor in visited_nodes:
-                        continue
-
-                    # 获取连接强度
-                    edge_data = self.memory_graph.G[current_node][neighbor]
-                    strength = edge_data.get("strength", 1)
-
-                    # 计算新的激活值
-                    new_activation = current_activation - (1 / strength)
-
-                    if new_activation > 0:
-                        activation_values[neighbor] = new_activation
-                        visited_nodes.add(neighbor)
-                        nodes_to_process.append((neighbor, new_activation, current_depth + 1))
-                        logger.trace(
-                            f"节点 '{neighbor}' 被激活，激活值: {new_activation:.2f} (通过 '{current_node}' 连接，强度: {strength}, 深度: {current_depth + 1})"
-                        )  # noqa: E501
-
-            # 更新激活映射
-            for node, activation_value in activation_values.items():
-                if activation_value > 0:
-                    if node in activate_map:
-                        activate_map[node] += activation_value
-                    else:
-                        activate_map[node] = activation_value
+        # 对所有关键词同时进行扩散式检索，得到每个词的累计激活值
+        logger.debug(f"开始以关键词 {valid_keywords} 为中心进行扩散检索 (最大深度: {max_depth})")
+        activate_map = self.memory_graph.get_compiled().spread_activation(valid_keywords, max_depth)
 
         # 输出激活映射
         # logger.info("激活映射统计:")
@@ -1187,6 +1299,8 @@ class Hippocampus:
 
         # 从选中的节点中提取记忆
         all_memories = []
+        # 输入文本只分词一次
+        text_vector = build_term_vector(text)
         # logger.info("开始从选中的节点中提取记忆:")
         for node, activation in remember_map.items():
             logger.debug(f"处理节点 '{node}' (激活值: {activation:.2f}):")
@@ -1197,17 +1311,11 @@ class Hippocampus:
 
             if memory_items:
                 logger.debug(f"节点包含 {len(memory_items)} 条记忆")
-                # 计算每条记忆与输入文本的相似度
-                memory_similarities = []
-                for memory in memory_items:
-                    # 计算与输入文本的相似度
-                    memory_words = set(jieba.cut(memory))
-                    text_words = set(jieba.cut(text))
-                    all_words = memory_words | text_words
-                    v1 = [1 if word in memory_words else 0 for word in all_words]
-                    v2 = [1 if word in text_words else 0 for word in all_words]
-                    similarity = cosine_similarity(v1, v2)
-                    memory_similarities.append((memory, similarity))
+                # 计算每条记忆与输入文本的相似度，记忆的词向量已预先算好
+                memory_vectors = self.memory_graph.get_memory_vectors(node)
+                memory_similarities = [
+                    (memory, term_vector_similarity(memory_vectors[memory], text_vector)) for memory in memory_items
+                ]
 
                 # 按相似度排序
                 memory_similarities.sort(key=lambda x: x[1], reverse=True)
@@ -1296,54 +1404,9 @@ class Hippocampus:
 
         logger.info(f"有效的关键词: {', '.join(valid_keywords)}")
 
-        # 从每个关键词获取记忆
-        activate_map = {}  # 存储每个词的累计激活值
-
-        # 对每个关键词进行扩散式检索
-        for keyword in valid_keywords:
-            logger.trace(f"开始以关键词 '{keyword}' 为中心进行扩散检索 (最大深度: {max_depth}):")
-            # 初始化激活值
-            activation_values = {keyword: 1.0}
-            # 记录已访问的节点
-            visited_nodes = {keyword}
-            # 待处理的节点队列，每个元素是(节点, 激活值, 当前深度)
-            nodes_to_process = [(keyword, 1.0, 0)]
-
-            while nodes_to_process:
-                current_node, current_activation, current_depth = nodes_to_process.pop(0)
-
-                # 如果激活值小于0或超过最大深度，停止扩散
-                if current_activation <= 0 or current_depth >= max_depth:
-                    continue
-
-                # 获取当前节点的所有邻居
-                neighbors = list(self.memory_graph.G.neighbors(current_node))
-
-                for neighbor in neighbors:
-                    if neighbor in visited_nodes:
-                        continue
-
-                    # 获取连接强度
-                    edge_data = self.memory_graph.G[current_node][neighbor]
-                    strength = edge_data.get("strength", 1)
-
-                    # 计算新的激活值
-                    new_activation = current_activation - (1 / strength)
-
-                    if new_activation > 0:
-                        activation_values[neighbor] = new_activation
-                        visited_nodes.add(neighbor)
-                        nodes_to_process.append((neighbor, new_activation, current_depth + 1))
-                        # logger.debug(
-                        # f"节点 '{neighbor}' 被激活，激活值: {new_activation:.2f} (通过 '{current_node}' 连接，强度: {strength}, 深度: {current_depth + 1})")  # noqa: E501
-
-            # 更新激活映射
-            for node, activation_value in activation_values.items():
-                if activation_value > 0:
-                    if node in activate_map:
-                        activate_map[node] += activation_value
-                    else:
-                        activate_map[node] = activation_value
+        # 对所有关键词同时进行扩散式检索，得到每个词的累计激活值
+        logger.trace(f"开始以关键词 {valid_keywords} 为中心进行扩散检索 (最大深度: {max_depth})")
+        activate_map = self.memory_graph.get_compiled().spread_activation(valid_keywords, max_depth)
 
         # 输出激活映射
         # logger.info("激活映射统计:")
@@ -1469,21 +1532,8 @@ class ParahippocampalGyrus:
             if response:
                 compressed_memory.add((topic, response[0]))
 
-                existing_topics = list(self.memory_graph.G.nodes())
-                similar_topics = []
-
-                for existing_topic in existing_topics:
-                    topic_words = set(jieba.cut(topic))
-                    existing_words = set(jieba.cut(existing_topic))
-
-                    all_words = topic_words | existing_words
-                    v1 = [1 if word in topic_words else 0 for word in all_words]
-                    v2 = [1 if word in existing_words else 0 for word in all_words]
-
-                    similarity = cosine_similarity(v1, v2)
-
-                    if similarity >= 0.7:
-                        similar_topics.append((existing_topic, similarity))
+                # 只对与话题共享词语的已有节点计算相似度
+                similar_topics = self.memory_graph.find_similar_concepts(topic, 0.7)
 
                 similar_topics.sort(key=lambda x: x[1], reverse=True)
                 similar_topics = similar_topics[:3]
@@ -1534,7 +1584,7 @@ class ParahippocampalGyrus:
                             all_connected_nodes.append(topic)
                             all_connected_nodes.append(similar_topic)
 
-                            self.memory_graph.G.add_edge(
+                            self.memory_graph.add_edge(
                                 topic,
                                 similar_topic,
                                 strength=strength,
@@ -1552,7 +1602,7 @@ class ParahippocampalGyrus:
         logger.debug(f"强化连接: {', '.join(all_added_edges)}")
         logger.info(f"强化连接节点: {', '.join(all_connected_nodes)}")
 
-        await self.hippocampus.entorhinal_cortex.sync_memory_to_db()
+        await self.hippocampus.entorhinal_cortex.flush_memory_changes()
 
         end_time = time.time()
         logger.success(f"---------------------记忆构建耗时: {end_time - start_time:.2f} 秒---------------------")
@@ -1612,11 +1662,10 @@ class ParahippocampalGyrus:
                 new_strength = current_strength - 1
 
                 if new_strength <= 0:
-                    self.memory_graph.G.remove_edge(source, target)
+                    self.memory_graph.remove_edge(source, target)
                     edge_changes["removed"].append(f"{source} -> {target}")
                 else:
-                    edge_data["strength"] = new_strength
-                    edge_data["last_modified"] = current_time
+                    self.memory_graph.update_edge(source, target, strength=new_strength, last_modified=current_time)
                     edge_changes["weakened"].append(f"{source}-{target} (强度: {current_strength} -> {new_strength})")
         edge_check_end = time.time()
         logger.info(f"[遗忘] 连接检查耗时: {edge_check_end - edge_check_start:.2f}秒")
@@ -1638,11 +1687,10 @@ class ParahippocampalGyrus:
                     memory_items.remove(removed_item)
 
                     if memory_items:
-                        self.memory_graph.G.nodes[node]["memory_items"] = memory_items
-                        self.memory_graph.G.nodes[node]["last_modified"] = current_time
+                        self.memory_graph.update_node(node, memory_items=memory_items, last_modified=current_time)
                         node_changes["reduced"].append(f"{node} (数量: {current_count} -> {len(memory_items)})")
                     else:
-                        self.memory_graph.G.remove_node(node)
+                        self.memory_graph.remove_node(node)
                         node_changes["removed"].append(node)
         node_check_end = time.time()
         logger.info(f"[遗忘] 节点检查耗时: {node_check_end - node_check_start:.2f}秒")
@@ -1650,7 +1698,7 @@ class ParahippocampalGyrus:
         if any(edge_changes.values()) or any(node_changes.values()):
             sync_start = time.time()
 
-            await self.hippocampus.entorhinal_cortex.resync_memory_to_db()
+            await self.hippocampus.entorhinal_cortex.flush_memory_changes()
 
             sync_end = time.time()
             logger.info(f"[遗忘] 数据库同步耗时: {sync_end - sync_start:.2f}秒")
@@ -0,0 +1,170 @@
+import numpy as np
+
+
+class CompiledMemoryGraph:
+    """记忆图的 CSR 压缩形式，用于向量化的扩散激活
+
+    每个节点的邻接表在 indices 中的顺序与 networkx 中 G.neighbors() 的顺序一致，
+    这样按层推进的扩散结果与逐关键词的 BFS 完全相同。
+    """
+
+    def __init__(self):
+        self.node_index = {}  # 节点名 -> 下标
+        self.index_node = []  # 下标 -> 节点名
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.strength = np.zeros(0, dtype=np.float64)
+        self.stale = True
+
+    def invalidate(self):
+        """标记为过期，下次查询前整体重建"""
+        self.stale = True
+
+    def rebuild(self, G):
+        """从 networkx 图整体重建 CSR 数组"""
+        self.index_node = list(G.nodes())
+        self.node_index = {node: i for i, node in enumerate(self.index_node)}
+
+        indptr = np.zeros(len(self.index_node) + 1, dtype=np.int64)
+        indices = []
+        strength = []
+        for i, (_, neighbors) in enumerate(G.adjacency()):
+            for neighbor, data in neighbors.items():
+                indices.append(self.node_index[neighbor])
+                strength.append(data.get("strength", 1))
+            indptr[i + 1] = len(indices)
+
+        self.indptr = indptr
+        self.indices = np.array(indices, dtype=np.int64)
+        self.strength = np.array(strength, dtype=np.float64)
+        self.stale = False
+
+    def ensure(self, G):
+        """保证压缩形式与图一致，必要时重建"""
+        if self.stale or len(self.index_node) != G.number_of_nodes():
+            self.rebuild(G)
+
+    def add_node(self, concept):
+        if self.stale or concept in self.node_index:
+            return
+        self.node_index[concept] = len(self.index_node)
+        self.index_node.append(concept)
+        self.indptr = np.append(self.indptr, self.indptr[-1])
+
+    def _edge_positions(self, i, j):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return start + np.flatnonzero(self.indices[start:end] == j)
+
+    def _insert_half_edge(self, i, j, strength):
+        # networkx 把新邻居追加在邻接表末尾，这里同样插入到行尾
+        pos = self.indptr[i + 1]
+        self.indices = np.insert(self.indices, pos, j)
+        self.strength = np.insert(self.strength, pos, strength)
+        self.indptr[i + 1 :] += 1
+
+    def _delete_half_edge(self, i, j):
+        positions = self._edge_positions(i, j)
+        self.indices = np.delete(self.indices, positions)
+        self.strength = np.delete(self.strength, positions)
+        self.indptr[i + 1 :] -= len(positions)
+
+    def set_edge(self, concept1, concept2, strength):
+        """新增一条边或更新已有边的强度"""
+        if self.stale:
+            return
+        self.add_node(concept1)
+        self.add_node(concept2)
+        i, j = self.node_index[concept1], self.node_index[concept2]
+
+        positions = np.concatenate([self._edge_positions(i, j), self._edge_positions(j, i)])
+        if positions.size:
+            self.strength[positions] = strength
+            return
+
+        self._insert_half_edge(i, j, strength)
+        if i != j:
+            self._insert_half_edge(j, i, strength)
+
+    def remove_edge(self, concept1, concept2):
+        if self.stale:
+            return
+        i, j = self.node_index[concept1], self.node_index[concept2]
+        self._delete_half_edge(i, j)
+        if i != j:
+            self._delete_half_edge(j, i)
+
+    def spread_activation(self, keywords: list, max_depth: int) -> dict:
+        """以多个关键词为中心同时进行扩散激活
+
+        激活值沿边传递时减去 1/strength，只有激活值为正的节点会被激活并继续扩散，
+        每个节点对同一个关键词只会被激活一次（按 BFS 顺序先到先得）。
+
+        Args:
+            keywords (list): 起始关键词，必须都存在于图中
+            max_depth (int): 最大扩散深度
+
+        Returns:
+            dict: {节点: 所有关键词累计的激活值}，顺序与逐关键词 BFS 的累加顺序一致
+        """
+        if not keywords:
+            return {}
+
+        num_keywords = len(keywords)
+        seeds = np.array([self.node_index[keyword] for keyword in keywords], dtype=np.int64)
+        visited = np.zeros((num_keywords, len(self.index_node)), dtype=bool)
+        visited[np.arange(num_keywords), seeds] = True
+
+        # 当前层的前沿：(所属关键词, 节点, 激活值)，每个关键词内部按出队顺序排列
+        frontier_kw = np.arange(num_keywords, dtype=np.int64)
+        frontier_node = seeds
+        frontier_act = np.ones(num_keywords, dtype=np.float64)
+        found_kw, found_node, found_act = [frontier_kw], [frontier_node], [frontier_act]
+
+        for _ in range(max_depth):
+            starts = self.indptr[frontier_node]
+            counts = self.indptr[frontier_node + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+
+            # 按 (前沿顺序, 邻接顺序) 展开前沿的所有边
+            source = np.repeat(np.arange(frontier_node.size), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            positions = np.repeat(starts, counts) + offsets
+            targets = self.indices[positions]
+            edge_kw = frontier_kw[source]
+            new_act = frontier_act[source] - 1 / self.strength[positions]
+
+            candidates = np.flatnonzero((new_act > 0) & ~visited[edge_kw, targets])
+            if candidates.size == 0:
+                break
+
+            # 同一关键词下的同一节点只保留最先到达的那条边
+            keys = edge_kw[candidates] * len(self.index_node) + targets[candidates]
+            _, first = np.unique(keys, return_index=True)
+            chosen = candidates[np.sort(first)]
+
+            frontier_kw = edge_kw[chosen]
+            frontier_node = targets[chosen]
+            frontier_act = new_act[chosen]
+            visited[frontier_kw, frontier_node] = True
+            found_kw.append(frontier_kw)
+            found_node.append(frontier_node)
+            found_act.append(frontier_act)
+
+        all_kw = np.concatenate(found_kw)
+        all_node = np.concatenate(found_node)
+        all_act = np.concatenate(found_act)
+        # 按关键词优先、发现顺序其次排列，保证累加顺序与逐关键词处理时相同
+        order = np.lexsort((np.arange(all_kw.size), all_kw))
+        all_node = all_node[order]
+        all_act = all_act[order]
+
+        unique_nodes, first, inverse = np.unique(all_node, return_index=True, return_inverse=True)
+        totals = np.zeros(unique_nodes.size, dtype=np.float64)
+        np.add.at(totals, inverse, all_act)
+
+        appearance = np.argsort(first, kind="stable")
+        nodes = unique_nodes[appearance].tolist()
+        activations = totals[appearance].tolist()
+        return {self.index_node[node]: activations[k] for k, node in enumerate(nodes)}
@@ -5,7 +5,6 @@ import time
 from pathlib import Path
 import datetime
 from rich.console import Console
-from memory_manual_build import Memory_graph, Hippocampus  # 海马体和记忆图
 
 from dotenv import load_dotenv
 
@@ -31,6 +30,8 @@ sys.path.append(root_path)
 
 from src.common.logger import get_module_logger  # noqa E402
 from src.common.database import db  # noqa E402
+from src.plugins.config.config import global_config  # noqa E402
+from src.plugins.memory_system.Hippocampus import Hippocampus, Memory_graph  # noqa E402
 
 logger = get_module_logger("mem_alter")
 console = Console()
@@ -92,6 +93,7 @@ def add_mem_node(hippocampus: Hippocampus):
         hippocampus.memory_graph.G.add_node(
             concept, memory_items=memory_items, created_time=current_time, last_modified=current_time
         )
+        hippocampus.memory_graph.mark_node_changed(concept)
 
 
 # 删除概念节点（及连接到它的边）
@@ -110,7 +112,7 @@ def remove_mem_node(hippocampus: Hippocampus):
     console.print(f"[yellow]确定要移除名为“{concept}”的节点以及其相关边吗[/yellow]")
     destory = console.input(f"[red]请输入“{concept}”以删除节点 其他输入将被视为取消操作[/red]\n")
     if destory == concept:
-        hippocampus.memory_graph.G.remove_node(concept)
+        hippocampus.memory_graph.remove_node(concept)
     else:
         logger.info("[green]删除操作已取消[/green]")
 
@@ -171,7 +173,7 @@ def remove_mem_edge(hippocampus: Hippocampus):
         else:
             accept = console.input("[orange]请输入“确认”以确认删除操作（其他输入视为取消）[/orange]\n")
             if accept.lower() == "确认":
-                hippocampus.memory_graph.G.remove_edge(source, target)
+                hippocampus.memory_graph.remove_edge(source, target)
                 console.print(f"[green]边“{source} <-> {target}”已删除。[green]")
 
 
@@ -217,7 +219,7 @@ def alter_mem_node(hippocampus: Hippocampus):
                 # 稍微防一下小天才
                 try:
                     if isinstance(node_environment["memory_items"], list):
-                        node["memory_items"] = node_environment["memory_items"]
+                        hippocampus.memory_graph.update_node(concept, memory_items=node_environment["memory_items"])
                     else:
                         raise Exception
 
@@ -289,7 +291,7 @@ def alter_mem_edge(hippocampus: Hippocampus):
                 # 稍微防一下小天才
                 try:
                     if isinstance(edgeEnviroment["strength"][0], int):
-                        edge["strength"] = edgeEnviroment["strength"][0]
+                        hippocampus.memory_graph.update_edge(source, target, strength=edgeEnviroment["strength"][0])
                     else:
                         raise Exception
 
@@ -312,14 +314,10 @@ def alter_mem_edge(hippocampus: Hippocampus):
 async def main():
     start_time = time.time()
 
-    # 创建记忆图
-    memory_graph = Memory_graph()
-
-    # 创建海马体
-    hippocampus = Hippocampus(memory_graph)
-
-    # 从数据库同步数据
-    hippocampus.sync_memory_from_db()
+    # 创建海马体，初始化时从数据库加载记忆图
+    hippocampus = Hippocampus()
+    hippocampus.initialize(global_config=global_config)
+    memory_graph = hippocampus.memory_graph
 
     end_time = time.time()
     logger.info(f"\033[32m[加载海马体耗时: {end_time - start_time:.2f} 秒]\033[0m")
@@ -355,7 +353,8 @@ async def main():
             print("已结束操作")
             break
 
-        hippocampus.sync_memory_to_db()
+        # 只把变更日志中记录的修改写入数据库
+        await hippocampus.entorhinal_cortex.flush_memory_changes()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from bson.binary import Binary
+from pymongo.errors import PyMongoError
+
+from src.common.logger import get_module_logger
+from ...common.database import async_db
+from ..config.config import global_config
+from ..utils.pipeline import db_write_queue
+
+logger = get_module_logger("embedding_cache")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """embedding 向量的两级缓存
+
+    第一级是进程内的 LRU，第二级是数据库中的 embedding_cache 集合，键为 (模型名, 文本sha256)。
+    向量统一以 float32 二进制保存，数据库中的条目按最近使用时间淘汰。
+    写入数据库和淘汰在后台进行，不阻塞获取 embedding 的请求。
+    """
+
+    # 每写入多少条检查一次数据库中的条目数
+    EVICT_CHECK_INTERVAL = 100
+
+    def __init__(self):
+        self._memory: OrderedDict[Tuple[str, str], np.ndarray] = OrderedDict()
+        self._initialized = False
+        self._writes_since_evict = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def _ensure_collection(self):
+        if self._initialized:
+            return
+        await async_db.embedding_cache.create_index([("model", 1), ("hash", 1)], unique=True)
+        await async_db.embedding_cache.create_index([("last_used", 1)])
+        self._initialized = True
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > global_config.embedding_cache_memory_size:
+            self._memory.popitem(last=False)
+
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        """查询缓存，未命中返回None"""
+        key = (model, text_hash(text))
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return vector.tolist()
+
+        try:
+            await self._ensure_collection()
+            doc = await async_db.embedding_cache.find_one_and_update(
+                {"model": model, "hash": key[1]},
+                {"$set": {"last_used": time.time()}},
+                projection={"vector": 1},
+            )
+        except PyMongoError as e:
+            logger.warning(f"读取embedding缓存失败: {e}")
+            doc = None
+
+        if doc is None:
+            self.misses += 1
+            return None
+
+        vector = np.frombuffer(doc["vector"], dtype=np.float32)
+        self._remember(key, vector)
+        self.db_hits += 1
+        return vector.tolist()
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        """写入缓存，数据库在后台写入"""
+        key = (model, text_hash(text))
+        vector = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, vector)
+        db_write_queue.submit("embedding_cache", lambda: self._save(key, vector))
+
+    async def _save(self, key: Tuple[str, str], vector: np.ndarray):
+        try:
+            await self._ensure_collection()
+            await async_db.embedding_cache.update_one(
+                {"model": key[0], "hash": key[1]},
+                {"$set": {"vector": Binary(vector.tobytes()), "dim": int(vector.size), "last_used": time.time()}},
+                upsert=True,
+            )
+        except PyMongoError as e:
+            logger.warning(f"写入embedding缓存失败: {e}")
+            return
+
+        self._writes_since_evict += 1
+        if self._writes_since_evict >= self.EVICT_CHECK_INTERVAL:
+            self._writes_since_evict = 0
+            await self._evict_db()
+
+    async def _evict_db(self):
+        """数据库中的条目超过上限时，删除最久未使用的条目"""
+        max_items = global_config.embedding_cache_db_size
+        try:
+            excess = await async_db.embedding_cache.estimated_document_count() - max_items
+            if excess <= 0:
+                return
+            stale_docs = (
+                await async_db.embedding_cache.find({}, {"_id": 1}).sort("last_used", 1).limit(excess).to_list()
+            )
+            stale_ids = [doc["_id"] for doc in stale_docs]
+            await async_db.embedding_cache.delete_many({"_id": {"$in": stale_ids}})
+            logger.debug(f"淘汰了 {len(stale_ids)} 条embedding缓存")
+        except PyMongoError as e:
+            logger.warning(f"淘汰embedding缓存失败: {e}")
+
+    def stats(self) -> dict:
+        total = self.memory_hits + self.db_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / total if total else 0.0,
+            "memory_size": len(self._memory),
+        }
+
+
+# 全局共享的embedding缓存
+embedding_cache = EmbeddingCache()
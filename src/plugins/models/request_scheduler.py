@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from src.common.logger import get_module_logger
+from ..config.config import global_config
+
+logger = get_module_logger("request_scheduler")
+
+# 请求优先级，数值越小越先被调度
+PRIORITY_HIGH = 0  # 面向用户的回复生成
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # 记忆构建、心流等后台任务
+
+REQUEST_TYPE_PRIORITY = {
+    "response_heartflow": PRIORITY_HIGH,
+    "response_reasoning": PRIORITY_HIGH,
+    "reply_generation": PRIORITY_HIGH,
+    "reply_check": PRIORITY_HIGH,
+    "action_planning": PRIORITY_HIGH,
+    "conversation_goal": PRIORITY_HIGH,
+    "tool_use": PRIORITY_HIGH,
+    "knowledge_fetch": PRIORITY_HIGH,
+    "memory": PRIORITY_LOW,
+    "heart_flow": PRIORITY_LOW,
+    "sub_heart_flow": PRIORITY_LOW,
+    "schedule": PRIORITY_LOW,
+}
+
+
+def get_request_priority(request_type: str) -> int:
+    """根据请求类型获取调度优先级，未列出的类型为普通优先级"""
+    return REQUEST_TYPE_PRIORITY.get(request_type, PRIORITY_NORMAL)
+
+
+def estimate_payload_tokens(payload: dict) -> int:
+    """粗略估计请求的输入token数（按字符数计），用于 TPM 限流，请求结束后用实际用量校正"""
+    texts = []
+    embedding_input = payload.get("input")
+    if isinstance(embedding_input, str):
+        texts.append(embedding_input)
+    elif isinstance(embedding_input, list):
+        texts.extend(item for item in embedding_input if isinstance(item, str))
+
+    for message in payload.get("messages", []):
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(
+                part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text"
+            )
+    return max(1, sum(len(text) for text in texts))
+
+
+class TokenBucket:
+    """令牌桶，容量为每分钟配额，按匀速补充"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """返回获取 amount 个令牌还需要等待的秒数"""
+        self._refill()
+        # 单个请求超过桶容量时按满桶处理，避免永远无法调度
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def adjust(self, amount: float):
+        """按实际用量校正，amount 为正表示多用了令牌，允许透支"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class ProviderLimiter:
+    """单个服务商（或单个模型）的并发与速率限制器
+
+    等待中的请求按 (优先级, 到达顺序) 排队，只有队首请求满足并发、RPM、TPM 限制时才会被放行，
+    因此后台任务无法插队到回复生成之前。
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 0, rpm: int = 0, tpm: int = 0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rpm_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.active = 0
+        self.paused_until = 0.0
+        self.waiters = []  # 堆: (优先级, 序号, future, 预估token数)
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_when = 0.0
+
+    async def acquire(self, priority: int, tokens: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._seq), future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已经分配到名额但调用方被取消，归还名额
+            if future.done() and not future.cancelled():
+                self.release(tokens, None)
+            raise
+
+    def release(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        self.active -= 1
+        if self.tpm_bucket and actual_tokens is not None:
+            self.tpm_bucket.adjust(actual_tokens - estimated_tokens)
+        self._dispatch()
+
+    def pause(self, seconds: float):
+        """收到 429 时暂停调度，让排队中的请求一起退避"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self._dispatch()
+
+    def _delay(self, tokens: int) -> float:
+        delay = self.paused_until - time.monotonic()
+        if self.rpm_bucket:
+            delay = max(delay, self.rpm_bucket.delay(1))
+        if self.tpm_bucket:
+            delay = max(delay, self.tpm_bucket.delay(tokens))
+        return delay
+
+    def _dispatch(self):
+        while self.waiters:
+            _, _, future, tokens = self.waiters[0]
+            if future.done():
+                # 调用方已取消
+                heapq.heappop(self.waiters)
+                continue
+            if self.max_concurrency and self.active >= self.max_concurrency:
+                return
+            delay = self._delay(tokens)
+            if delay > 0:
+                self._schedule(delay)
+                return
+
+            heapq.heappop(self.waiters)
+            self.active += 1
+            if self.rpm_bucket:
+                self.rpm_bucket.consume(1)
+            if self.tpm_bucket:
+                self.tpm_bucket.consume(tokens)
+            future.set_result(None)
+
+    def _schedule(self, delay: float):
+        when = time.monotonic() + delay
+        if self._timer is not None:
+            if self._timer_when <= when:
+                return
+            self._timer.cancel()
+        self._timer_when = when
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+
+class RequestPermit:
+    """调度器发放的请求许可，用于回报实际token用量和触发退避"""
+
+    def __init__(self, limiter: ProviderLimiter, estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+    def report_usage(self, usage: Optional[dict]):
+        if usage and usage.get("total_tokens") is not None:
+            self.actual_tokens = usage["total_tokens"]
+
+    def pause(self, seconds: float):
+        self.limiter.pause(seconds)
+
+
+class LLMRequestScheduler:
+    """所有 LLM_request 共享的请求调度器
+
+    按 bot_config 中 [llm_scheduler] 的配置为每个服务商或模型限制并发数和 RPM/TPM，
+    超出限制的请求按优先级排队。
+    """
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, Optional[str]], ProviderLimiter] = {}
+
+    def _get_limiter(self, provider: str, model_name: str) -> ProviderLimiter:
+        model_rule = None
+        provider_rule = None
+        for rule in global_config.llm_rate_limits:
+            if rule.get("provider") != provider:
+                continue
+            if rule.get("model") == model_name:
+                model_rule = rule
+            elif not rule.get("model"):
+                provider_rule = rule
+
+        # 有单独配置的模型独占一个限制器，其余模型共享服务商的限制器
+        rule = model_rule or provider_rule or {}
+        key = (provider, model_name if model_rule else None)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = ProviderLimiter(
+                name=f"{provider}/{model_name}" if model_rule else provider,
+                max_concurrency=rule.get("max_concurrency", global_config.llm_default_max_concurrency),
+                rpm=rule.get("rpm", 0),
+                tpm=rule.get("tpm", 0),
+            )
+            self._limiters[key] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def acquire(self, provider: str, model_name: str, priority: int, payload: dict):
+        """获取一次请求的许可，退出时归还"""
+        limiter = self._get_limiter(provider, model_name)
+        tokens = estimate_payload_tokens(payload)
+
+        wait_start = time.perf_counter()
+        await limiter.acquire(priority, tokens)
+        wait_time = time.perf_counter() - wait_start
+        if wait_time > 1:
+            logger.debug(f"模型 {model_name} 在 {limiter.name} 的调度队列中等待了 {wait_time:.2f}秒")
+
+        permit = RequestPermit(limiter, tokens)
+        try:
+            yield permit
+        finally:
+            limiter.release(tokens, permit.actual_tokens)
+
+
+# 全局共享的请求调度器
+llm_scheduler = LLMRequestScheduler()
@@ -1,8 +1,10 @@
 import asyncio
 import json
 import re
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import aiohttp
 from src.common.logger import get_module_logger
@@ -10,12 +12,102 @@ import base64
 from PIL import Image
 import io
 import os
-from ...common.database import db
+from ...common.database import async_db, db
 from ..config.config import global_config
+from .embedding_cache import embedding_cache
+from .request_scheduler import get_request_priority, llm_scheduler
+from ..utils.pipeline import db_write_queue
 
 logger = get_module_logger("model_utils")
 
 
+@dataclass
+class RequestTiming:
+    """单次请求的耗时统计（秒），由 aiohttp 的 trace 回调填写"""
+
+    start: float = 0.0
+    connect_start: float = 0.0
+    connect: float = 0.0  # 建立新连接的耗时，复用连接时为 0
+    ttfb: float = 0.0  # 从发出请求到收到响应头的耗时
+    reused: bool = False
+
+
+async def _on_request_start(session, trace_config_ctx, params):
+    timing = trace_config_ctx.trace_request_ctx
+    if isinstance(timing, RequestTiming):
+        timing.start = time.perf_counter()
+
+
+async def _on_connection_create_start(session, trace_config_ctx, params):
+    timing = trace_config_ctx.trace_request_ctx
+    if isinstance(timing, RequestTiming):
+        timing.connect_start = time.perf_counter()
+
+
+async def _on_connection_create_end(session, trace_config_ctx, params):
+    timing = trace_config_ctx.trace_request_ctx
+    if isinstance(timing, RequestTiming):
+        timing.connect = time.perf_counter() - timing.connect_start
+
+
+async def _on_connection_reuseconn(session, trace_config_ctx, params):
+    timing = trace_config_ctx.trace_request_ctx
+    if isinstance(timing, RequestTiming):
+        timing.reused = True
+
+
+async def _on_request_end(session, trace_config_ctx, params):
+    timing = trace_config_ctx.trace_request_ctx
+    if isinstance(timing, RequestTiming):
+        timing.ttfb = time.perf_counter() - timing.start
+
+
+def _build_timing_trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_request_end.append(_on_request_end)
+    return trace_config
+
+
+class ClientSessionPool:
+    """按 base_url 共享的 aiohttp 会话注册表
+
+    同一服务商下的所有模型复用一个会话及其连接池，避免每次请求都重新进行 TCP/TLS 握手。
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def get_session(self, base_url: str) -> aiohttp.ClientSession:
+        """获取 base_url 对应的会话，不存在或已关闭时新建"""
+        session = self._sessions.get(base_url)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=global_config.llm_connection_pool_size,
+                limit_per_host=global_config.llm_connection_limit_per_host,
+                keepalive_timeout=global_config.llm_keepalive_timeout,
+                ttl_dns_cache=global_config.llm_dns_cache_ttl,
+            )
+            session = aiohttp.ClientSession(connector=connector, trace_configs=[_build_timing_trace_config()])
+            self._sessions[base_url] = session
+        return session
+
+    async def close_all(self):
+        """关闭所有会话，在程序退出时调用"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+
+
+# 全局共享的会话注册表
+llm_session_pool = ClientSessionPool()
+
+
 class LLM_request:
     # 定义需要转换的模型列表，作为类变量避免重复
     MODELS_NEEDING_TRANSFORMATION = [
@@ -43,12 +135,17 @@ class LLM_request:
         self.stream = model.get("stream", False)
         self.pri_in = model.get("pri_in", 0)
         self.pri_out = model.get("pri_out", 0)
+        # 嵌入模型单次请求的最大文本条数，超过时分批请求
+        self.batch_size = model.get("batch_size", 32)
 
         # 获取数据库实例
         self._init_database()
 
         # 从 kwargs 中提取 request_type，如果没有提供则默认为 "default"
         self.request_type = kwargs.pop("request_type", "default")
+        # 调度器按服务商限流，按优先级排队；未指定优先级时根据 request_type 推断
+        self.provider = model["base_url"].removesuffix("_BASE_URL")
+        self.priority = kwargs.pop("priority", get_request_priority(self.request_type))
 
     @staticmethod
     def _init_database():
@@ -71,7 +168,7 @@ class LLM_request:
         request_type: str = None,
         endpoint: str = "/chat/completions",
     ):
-        """记录模型使用情况到数据库
+        """记录模型使用情况到数据库，写入在后台进行
         Args:
             prompt_tokens: 输入token数
             completion_tokens: 输出token数
@@ -97,7 +194,7 @@ class LLM_request:
                 "status": "success",
                 "timestamp": datetime.now(),
             }
-            db.llm_usage.insert_one(usage_data)
+            db_write_queue.submit("llm_usage", lambda: self._insert_usage(usage_data))
             logger.trace(
                 f"Token使用情况 - 模型: {self.model_name}, "
                 f"用户: {user_id}, 类型: {request_type}, "
@@ -107,6 +204,13 @@ class LLM_request:
         except Exception as e:
             logger.error(f"记录token使用情况失败: {str(e)}")
 
+    @staticmethod
+    async def _insert_usage(usage_data: dict):
+        try:
+            await async_db.llm_usage.insert_one(usage_data)
+        except Exception as e:
+            logger.error(f"记录token使用情况失败: {str(e)}")
+
     def _calculate_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
         """计算API调用成本
         使用模型的pri_in和pri_out价格计算输入和输出的成本
@@ -192,236 +296,247 @@ class LLM_request:
 
         for retry in range(policy["max_retries"]):
             try:
-                # 使用上下文管理器处理会话
                 headers = await self._build_headers()
                 # 似乎是openai流式必须要的东西,不过阿里云的qwq-plus加了这个没有影响
                 if stream_mode:
                     headers["Accept"] = "text/event-stream"
 
-                async with aiohttp.ClientSession() as session:
-                    try:
-                        async with session.post(api_url, headers=headers, json=payload) as response:
-                            # 处理需要重试的状态码
-                            if response.status in policy["retry_codes"]:
-                                wait_time = policy["base_wait"] * (2**retry)
-                                logger.warning(
-                                    f"模型 {self.model_name} 错误码: {response.status}, 等待 {wait_time}秒后重试"
+                # 复用同一服务商的共享会话和连接池
+                session = llm_session_pool.get_session(self.base_url)
+                timing = RequestTiming()
+                try:
+                    async with (
+                        llm_scheduler.acquire(self.provider, self.model_name, self.priority, payload) as permit,
+                        session.post(api_url, headers=headers, json=payload, trace_request_ctx=timing) as response,
+                    ):
+                        logger.debug(
+                            f"模型 {self.model_name} 请求耗时: 连接 {timing.connect * 1000:.0f}ms"
+                            f"{'(复用)' if timing.reused else ''}, 首字节 {timing.ttfb * 1000:.0f}ms"
+                        )
+                        # 处理需要重试的状态码
+                        if response.status in policy["retry_codes"]:
+                            wait_time = policy["base_wait"] * (2**retry)
+                            logger.warning(
+                                f"模型 {self.model_name} 错误码: {response.status}, 等待 {wait_time}秒后重试"
+                            )
+                            if response.status == 413:
+                                logger.warning("请求体过大，尝试压缩...")
+                                image_base64 = compress_base64_image_by_scale(image_base64)
+                                payload = await self._build_payload(prompt, image_base64, image_format)
+                            elif response.status in [500, 503]:
+                                logger.error(
+                                    f"模型 {self.model_name} 错误码: {response.status} - {error_code_mapping.get(response.status)}"
                                 )
-                                if response.status == 413:
-                                    logger.warning("请求体过大，尝试压缩...")
-                                    image_base64 = compress_base64_image_by_scale(image_base64)
-                                    payload = await self._build_payload(prompt, image_base64, image_format)
-                                elif response.status in [500, 503]:
+                                raise RuntimeError("服务器负载过高，模型恢复失败QAQ")
+                            else:
+                                logger.warning(f"模型 {self.model_name} 请求限制(429)，等待{wait_time}秒后重试...")
+                                # 暂停该服务商的调度，排队中的请求一起退避
+                                permit.pause(wait_time)
+                                continue
+
+                            await asyncio.sleep(wait_time)
+                            continue
+                        elif response.status in policy["abort_codes"]:
+                            logger.error(
+                                f"模型 {self.model_name} 错误码: {response.status} - {error_code_mapping.get(response.status)}"
+                            )
+                            # 尝试获取并记录服务器返回的详细错误信息
+                            try:
+                                error_json = await response.json()
+                                if error_json and isinstance(error_json, list) and len(error_json) > 0:
+                                    for error_item in error_json:
+                                        if "error" in error_item and isinstance(error_item["error"], dict):
+                                            error_obj = error_item["error"]
+                                            error_code = error_obj.get("code")
+                                            error_message = error_obj.get("message")
+                                            error_status = error_obj.get("status")
+                                            logger.error(
+                                                f"服务器错误详情: 代码={error_code}, 状态={error_status}, "
+                                                f"消息={error_message}"
+                                            )
+                                elif isinstance(error_json, dict) and "error" in error_json:
+                                    # 处理单个错误对象的情况
+                                    error_obj = error_json.get("error", {})
+                                    error_code = error_obj.get("code")
+                                    error_message = error_obj.get("message")
+                                    error_status = error_obj.get("status")
                                     logger.error(
-                                        f"模型 {self.model_name} 错误码: {response.status} - {error_code_mapping.get(response.status)}"
+                                        f"服务器错误详情: 代码={error_code}, 状态={error_status}, 消息={error_message}"
                                     )
-                                    raise RuntimeError("服务器负载过高，模型恢复失败QAQ")
                                 else:
-                                    logger.warning(f"模型 {self.model_name} 请求限制(429)，等待{wait_time}秒后重试...")
-
-                                await asyncio.sleep(wait_time)
-                                continue
-                            elif response.status in policy["abort_codes"]:
-                                logger.error(
-                                    f"模型 {self.model_name} 错误码: {response.status} - {error_code_mapping.get(response.status)}"
-                                )
-                                # 尝试获取并记录服务器返回的详细错误信息
+                                    # 记录原始错误响应内容
+                                    logger.error(f"服务器错误响应: {error_json}")
+                            except Exception as e:
+                                logger.warning(f"无法解析服务器错误响应: {str(e)}")
+
+                            if response.status == 403:
+                                # 只针对硅基流动的V3和R1进行降级处理
+                                if (
+                                    self.model_name.startswith("Pro/deepseek-ai")
+                                    and self.base_url == "https://api.siliconflow.cn/v1/"
+                                ):
+                                    old_model_name = self.model_name
+                                    self.model_name = self.model_name[4:]  # 移除"Pro/"前缀
+                                    logger.warning(f"检测到403错误，模型从 {old_model_name} 降级为 {self.model_name}")
+
+                                    # 对全局配置进行更新
+                                    if global_config.llm_normal.get("name") == old_model_name:
+                                        global_config.llm_normal["name"] = self.model_name
+                                        logger.warning(f"将全局配置中的 llm_normal 模型临时降级至{self.model_name}")
+
+                                    if global_config.llm_reasoning.get("name") == old_model_name:
+                                        global_config.llm_reasoning["name"] = self.model_name
+                                        logger.warning(f"将全局配置中的 llm_reasoning 模型临时降级至{self.model_name}")
+
+                                    # 更新payload中的模型名
+                                    if payload and "model" in payload:
+                                        payload["model"] = self.model_name
+
+                                    # 重新尝试请求
+                                    retry -= 1  # 不计入重试次数
+                                    continue
+
+                            raise RuntimeError(f"请求被拒绝: {error_code_mapping.get(response.status)}")
+
+                        response.raise_for_status()
+                        reasoning_content = ""
+
+                        # 将流式输出转化为非流式输出
+                        if stream_mode:
+                            flag_delta_content_finished = False
+                            accumulated_content = ""
+                            usage = None  # 初始化usage变量，避免未定义错误
+
+                            async for line_bytes in response.content:
                                 try:
-                                    error_json = await response.json()
-                                    if error_json and isinstance(error_json, list) and len(error_json) > 0:
-                                        for error_item in error_json:
-                                            if "error" in error_item and isinstance(error_item["error"], dict):
-                                                error_obj = error_item["error"]
-                                                error_code = error_obj.get("code")
-                                                error_message = error_obj.get("message")
-                                                error_status = error_obj.get("status")
-                                                logger.error(
-                                                    f"服务器错误详情: 代码={error_code}, 状态={error_status}, "
-                                                    f"消息={error_message}"
-                                                )
-                                    elif isinstance(error_json, dict) and "error" in error_json:
-                                        # 处理单个错误对象的情况
-                                        error_obj = error_json.get("error", {})
-                                        error_code = error_obj.get("code")
-                                        error_message = error_obj.get("message")
-                                        error_status = error_obj.get("status")
-                                        logger.error(
-                                            f"服务器错误详情: 代码={error_code}, 状态={error_status}, 消息={error_message}"
-                                        )
-                                    else:
-                                        # 记录原始错误响应内容
-                                        logger.error(f"服务器错误响应: {error_json}")
-                                except Exception as e:
-                                    logger.warning(f"无法解析服务器错误响应: {str(e)}")
-
-                                if response.status == 403:
-                                    # 只针对硅基流动的V3和R1进行降级处理
-                                    if (
-                                        self.model_name.startswith("Pro/deepseek-ai")
-                                        and self.base_url == "https://api.siliconflow.cn/v1/"
-                                    ):
-                                        old_model_name = self.model_name
-                                        self.model_name = self.model_name[4:]  # 移除"Pro/"前缀
-                                        logger.warning(
-                                            f"检测到403错误，模型从 {old_model_name} 降级为 {self.model_name}"
-                                        )
-
-                                        # 对全局配置进行更新
-                                        if global_config.llm_normal.get("name") == old_model_name:
-                                            global_config.llm_normal["name"] = self.model_name
-                                            logger.warning(f"将全局配置中的 llm_normal 模型临时降级至{self.model_name}")
-
-                                        if global_config.llm_reasoning.get("name") == old_model_name:
-                                            global_config.llm_reasoning["name"] = self.model_name
-                                            logger.warning(
-                                                f"将全局配置中的 llm_reasoning 模型临时降级至{self.model_name}"
-                                            )
-
-                                        # 更新payload中的模型名
-                                        if payload and "model" in payload:
-                                            payload["model"] = self.model_name
-
-                                        # 重新尝试请求
-                                        retry -= 1  # 不计入重试次数
+                                    line = line_bytes.decode("utf-8").strip()
+                                    if not line:
                                         continue
-
-                                raise RuntimeError(f"请求被拒绝: {error_code_mapping.get(response.status)}")
-
-                            response.raise_for_status()
-                            reasoning_content = ""
-
-                            # 将流式输出转化为非流式输出
-                            if stream_mode:
-                                flag_delta_content_finished = False
-                                accumulated_content = ""
-                                usage = None  # 初始化usage变量，避免未定义错误
-
-                                async for line_bytes in response.content:
-                                    try:
-                                        line = line_bytes.decode("utf-8").strip()
-                                        if not line:
-                                            continue
-                                        if line.startswith("data:"):
-                                            data_str = line[5:].strip()
-                                            if data_str == "[DONE]":
-                                                break
-                                            try:
-                                                chunk = json.loads(data_str)
-                                                if flag_delta_content_finished:
+                                    if line.startswith("data:"):
+                                        data_str = line[5:].strip()
+                                        if data_str == "[DONE]":
+                                            break
+                                        try:
+                                            chunk = json.loads(data_str)
+                                            if flag_delta_content_finished:
+                                                chunk_usage = chunk.get("usage", None)
+                                                if chunk_usage:
+                                                    usage = chunk_usage  # 获取token用量
+                                            else:
+                                                delta = chunk["choices"][0]["delta"]
+                                                delta_content = delta.get("content")
+                                                if delta_content is None:
+                                                    delta_content = ""
+                                                accumulated_content += delta_content
+                                                # 检测流式输出文本是否结束
+                                                finish_reason = chunk["choices"][0].get("finish_reason")
+                                                if delta.get("reasoning_content", None):
+                                                    reasoning_content += delta["reasoning_content"]
+                                                if finish_reason == "stop":
                                                     chunk_usage = chunk.get("usage", None)
                                                     if chunk_usage:
-                                                        usage = chunk_usage  # 获取token用量
-                                                else:
-                                                    delta = chunk["choices"][0]["delta"]
-                                                    delta_content = delta.get("content")
-                                                    if delta_content is None:
-                                                        delta_content = ""
-                                                    accumulated_content += delta_content
-                                                    # 检测流式输出文本是否结束
-                                                    finish_reason = chunk["choices"][0].get("finish_reason")
-                                                    if delta.get("reasoning_content", None):
-                                                        reasoning_content += delta["reasoning_content"]
-                                                    if finish_reason == "stop":
-                                                        chunk_usage = chunk.get("usage", None)
-                                                        if chunk_usage:
-                                                            usage = chunk_usage
-                                                            break
-                                                        # 部分平台在文本输出结束前不会返回token用量，此时需要再获取一次chunk
-                                                        flag_delta_content_finished = True
-
-                                            except Exception as e:
-                                                logger.exception(f"模型 {self.model_name} 解析流式输出错误: {str(e)}")
-                                    except GeneratorExit:
-                                        logger.warning("模型 {self.model_name} 流式输出被中断，正在清理资源...")
-                                        # 确保资源被正确清理
-                                        await response.release()
-                                        # 返回已经累积的内容
-                                        result = {
-                                            "choices": [
-                                                {
-                                                    "message": {
-                                                        "content": accumulated_content,
-                                                        "reasoning_content": reasoning_content,
-                                                        # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
-                                                    }
+                                                        usage = chunk_usage
+                                                        break
+                                                    # 部分平台在文本输出结束前不会返回token用量，此时需要再获取一次chunk
+                                                    flag_delta_content_finished = True
+
+                                        except Exception as e:
+                                            logger.exception(f"模型 {self.model_name} 解析流式输出错误: {str(e)}")
+                                except GeneratorExit:
+                                    logger.warning("模型 {self.model_name} 流式输出被中断，正在清理资源...")
+                                    # 确保资源被正确清理
+                                    await response.release()
+                                    # 返回已经累积的内容
+                                    result = {
+                                        "choices": [
+                                            {
+                                                "message": {
+                                                    "content": accumulated_content,
+                                                    "reasoning_content": reasoning_content,
+                                                    # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
                                                 }
-                                            ],
-                                            "usage": usage,
-                                        }
-                                        return (
-                                            response_handler(result)
-                                            if response_handler
-                                            else self._default_response_handler(result, user_id, request_type, endpoint)
-                                        )
-                                    except Exception as e:
-                                        logger.error(f"模型 {self.model_name} 处理流式输出时发生错误: {str(e)}")
-                                        # 确保在发生错误时也能正确清理资源
-                                        try:
-                                            await response.release()
-                                        except Exception as cleanup_error:
-                                            logger.error(f"清理资源时发生错误: {cleanup_error}")
-                                        # 返回已经累积的内容
-                                        result = {
-                                            "choices": [
-                                                {
-                                                    "message": {
-                                                        "content": accumulated_content,
-                                                        "reasoning_content": reasoning_content,
-                                                        # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
-                                                    }
+                                            }
+                                        ],
+                                        "usage": usage,
+                                    }
+                                    permit.report_usage(usage)
+                                    return (
+                                        response_handler(result)
+                                        if response_handler
+                                        else self._default_response_handler(result, user_id, request_type, endpoint)
+                                    )
+                                except Exception as e:
+                                    logger.error(f"模型 {self.model_name} 处理流式输出时发生错误: {str(e)}")
+                                    # 确保在发生错误时也能正确清理资源
+                                    try:
+                                        await response.release()
+                                    except Exception as cleanup_error:
+                                        logger.error(f"清理资源时发生错误: {cleanup_error}")
+                                    # 返回已经累积的内容
+                                    result = {
+                                        "choices": [
+                                            {
+                                                "message": {
+                                                    "content": accumulated_content,
+                                                    "reasoning_content": reasoning_content,
+                                                    # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
                                                 }
-                                            ],
-                                            "usage": usage,
-                                        }
-                                        return (
-                                            response_handler(result)
-                                            if response_handler
-                                            else self._default_response_handler(result, user_id, request_type, endpoint)
-                                        )
-                                content = accumulated_content
-                                think_match = re.search(r"<think>(.*?)</think>", content, re.DOTALL)
-                                if think_match:
-                                    reasoning_content = think_match.group(1).strip()
-                                content = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL).strip()
-                                # 构造一个伪result以便调用自定义响应处理器或默认处理器
-                                result = {
-                                    "choices": [
-                                        {
-                                            "message": {
-                                                "content": content,
-                                                "reasoning_content": reasoning_content,
-                                                # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
                                             }
+                                        ],
+                                        "usage": usage,
+                                    }
+                                    permit.report_usage(usage)
+                                    return (
+                                        response_handler(result)
+                                        if response_handler
+                                        else self._default_response_handler(result, user_id, request_type, endpoint)
+                                    )
+                            content = accumulated_content
+                            think_match = re.search(r"<think>(.*?)</think>", content, re.DOTALL)
+                            if think_match:
+                                reasoning_content = think_match.group(1).strip()
+                            content = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL).strip()
+                            # 构造一个伪result以便调用自定义响应处理器或默认处理器
+                            result = {
+                                "choices": [
+                                    {
+                                        "message": {
+                                            "content": content,
+                                            "reasoning_content": reasoning_content,
+                                            # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
                                         }
-                                    ],
-                                    "usage": usage,
-                                }
-                                return (
-                                    response_handler(result)
-                                    if response_handler
-                                    else self._default_response_handler(result, user_id, request_type, endpoint)
-                                )
-                            else:
-                                result = await response.json()
-                                # 使用自定义处理器或默认处理
-                                return (
-                                    response_handler(result)
-                                    if response_handler
-                                    else self._default_response_handler(result, user_id, request_type, endpoint)
-                                )
-
-                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                        if retry < policy["max_retries"] - 1:
-                            wait_time = policy["base_wait"] * (2**retry)
-                            logger.error(f"模型 {self.model_name} 网络错误，等待{wait_time}秒后重试... 错误: {str(e)}")
-                            await asyncio.sleep(wait_time)
-                            continue
+                                    }
+                                ],
+                                "usage": usage,
+                            }
+                            permit.report_usage(usage)
+                            return (
+                                response_handler(result)
+                                if response_handler
+                                else self._default_response_handler(result, user_id, request_type, endpoint)
+                            )
                         else:
-                            logger.critical(f"模型 {self.model_name} 网络错误达到最大重试次数: {str(e)}")
-                            raise RuntimeError(f"网络请求失败: {str(e)}") from e
-                    except Exception as e:
-                        logger.critical(f"模型 {self.model_name} 未预期的错误: {str(e)}")
-                        raise RuntimeError(f"请求过程中发生错误: {str(e)}") from e
+                            result = await response.json()
+                            permit.report_usage(result.get("usage"))
+                            # 使用自定义处理器或默认处理
+                            return (
+                                response_handler(result)
+                                if response_handler
+                                else self._default_response_handler(result, user_id, request_type, endpoint)
+                            )
+
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if retry < policy["max_retries"] - 1:
+                        wait_time = policy["base_wait"] * (2**retry)
+                        logger.error(f"模型 {self.model_name} 网络错误，等待{wait_time}秒后重试... 错误: {str(e)}")
+                        await asyncio.sleep(wait_time)
+                        continue
+                    else:
+                        logger.critical(f"模型 {self.model_name} 网络错误达到最大重试次数: {str(e)}")
+                        raise RuntimeError(f"网络请求失败: {str(e)}") from e
+                except Exception as e:
+                    logger.critical(f"模型 {self.model_name} 未预期的错误: {str(e)}")
+                    raise RuntimeError(f"请求过程中发生错误: {str(e)}") from e
 
             except aiohttp.ClientResponseError as e:
                 # 处理aiohttp抛出的响应错误
@@ -675,6 +790,11 @@ class LLM_request:
             logger.debug("该消息没有长度，不再发送获取embedding向量的请求")
             return None
 
+        if global_config.enable_embedding_cache:
+            cached = await embedding_cache.get(self.model_name, text)
+            if cached is not None:
+                return cached
+
         def embedding_handler(result):
             """处理响应"""
             if "data" in result and len(result["data"]) > 0:
@@ -705,8 +825,75 @@ class LLM_request:
             retry_policy={"max_retries": 2, "base_wait": 6},
             response_handler=embedding_handler,
         )
+        if embedding and global_config.enable_embedding_cache:
+            embedding_cache.put(self.model_name, text, embedding)
         return embedding
 
+    async def get_embeddings(self, texts: List[str]) -> List[Optional[list]]:
+        """异步方法：批量获取多条文本的embedding向量
+
+        按模型的 batch_size 分批发送数组形式的 input，相同文本只请求一次，缓存命中的文本不再请求。
+
+        Args:
+            texts: 需要获取embedding的文本列表
+
+        Returns:
+            list: 与 texts 一一对应的embedding向量，获取失败或文本为空的位置为None
+        """
+        embeddings: List[Optional[list]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}  # 待请求的文本 -> 在 texts 中的位置
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            if global_config.enable_embedding_cache:
+                cached = await embedding_cache.get(self.model_name, text)
+                if cached is not None:
+                    embeddings[i] = cached
+                    continue
+            pending.setdefault(text, []).append(i)
+
+        def embeddings_handler(result):
+            """处理响应，按 index 还原顺序"""
+            data = result.get("data", [])
+            usage = result.get("usage", {})
+            if usage:
+                self._record_usage(
+                    prompt_tokens=usage.get("prompt_tokens", 0),
+                    completion_tokens=usage.get("completion_tokens", 0),
+                    total_tokens=usage.get("total_tokens", 0),
+                    user_id="system",
+                    request_type=self.request_type,
+                    endpoint="/embeddings",
+                )
+            return {item.get("index", k): item.get("embedding") for k, item in enumerate(data)}
+
+        pending_texts = list(pending)
+        for start in range(0, len(pending_texts), self.batch_size):
+            batch = pending_texts[start : start + self.batch_size]
+            try:
+                batch_result = await self._execute_request(
+                    endpoint="/embeddings",
+                    prompt=batch[0],
+                    payload={"model": self.model_name, "input": batch, "encoding_format": "float"},
+                    retry_policy={"max_retries": 2, "base_wait": 6},
+                    response_handler=embeddings_handler,
+                )
+            except Exception as e:
+                logger.error(f"模型 {self.model_name} 批量获取embedding失败，共{len(batch)}条文本: {str(e)}")
+                continue
+
+            for k, text in enumerate(batch):
+                embedding = batch_result.get(k)
+                if not embedding:
+                    logger.warning(f"模型 {self.model_name} 未返回文本的embedding: {text[:30]}")
+                    continue
+                if global_config.enable_embedding_cache:
+                    embedding_cache.put(self.model_name, text, embedding)
+                for i in pending[text]:
+                    embeddings[i] = embedding
+
+        return embeddings
+
 
 def compress_base64_image_by_scale(base64_data: str, target_size: int = 0.8 * 1024 * 1024) -> str:
     """压缩base64格式的图片到指定大小
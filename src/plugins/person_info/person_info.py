@@ -1,11 +1,14 @@
 from src.common.logger import get_module_logger
-from ...common.database import db
+from ...common.database import async_db, db
 import copy
 import hashlib
-from typing import Any, Callable, Dict
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set
 import datetime
 import asyncio
 import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 
 import matplotlib
 
@@ -20,12 +23,17 @@ PersonInfoManager 类方法功能摘要：
 1. get_person_id - 根据平台和用户ID生成MD5哈希的唯一person_id
 2. create_person_info - 创建新个人信息文档（自动合并默认值）
 3. update_one_field - 更新单个字段值（若文档不存在则创建）
-4. del_one_document - 删除指定person_id的文档
-5. get_value - 获取单个字段值（返回实际值或默认值）
-6. get_values - 批量获取字段值（任一字段无效则返回空字典）
-7. del_all_undefined_field - 清理全集合中未定义的字段
-8. get_specific_value_list - 根据指定条件，返回person_id,value字典
-9. personal_habit_deduction - 定时推断个人习惯
+4. append_to_list_field - 向列表字段追加一个值并限制长度（若文档不存在则创建）
+5. del_one_document - 删除指定person_id的文档
+6. get_value - 获取单个字段值（返回实际值或默认值）
+7. get_values - 批量获取字段值（任一字段无效则返回空字典）
+8. del_all_undefined_field - 清理全集合中未定义的字段
+9. get_specific_value_list - 根据指定条件，返回person_id,value字典
+10. personal_habit_deduction - 定时推断个人习惯
+11. flush / close - 把缓存中的修改写入数据库
+
+读取和修改都经过内存缓存：修改立即反映在缓存中，并按字段记录，
+每隔 FLUSH_INTERVAL 秒合并为一次 bulk_write 写入数据库。
 """
 
 logger = get_module_logger("person_info")
@@ -47,32 +55,114 @@ person_info_default = {
 
 
 class PersonInfoManager:
+    CACHE_SIZE = 5000  # 内存中保留的个人信息数量，尚未写入的不会被淘汰
+    FLUSH_INTERVAL = 5.0  # 修改后最长多久写入数据库（秒）
+    CLOSE_RETRIES = 3  # 关闭时写入失败的重试次数
+
     def __init__(self):
         if "person_info" not in db.list_collection_names():
             db.create_collection("person_info")
             db.person_info.create_index("person_id", unique=True)
 
+        self._cache: OrderedDict[str, Optional[dict]] = OrderedDict()  # person_id -> 个人信息，数据库中不存在的为None
+        self._dirty: Dict[str, Set[str]] = {}  # person_id -> 需要 $set 的字段
+        self._pushes: Dict[str, Dict[str, dict]] = {}  # person_id -> {字段: {"$each": [...], "$slice": -n}}
+        self._flushing: Set[str] = set()  # 正在写入的 person_id
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._flush_lock = asyncio.Lock()
+        self._timer_task: Optional[asyncio.Task] = None
+
     def get_person_id(self, platform: str, user_id: int):
         """获取唯一id"""
         components = [platform, str(user_id)]
         key = "_".join(components)
         return hashlib.md5(key.encode()).hexdigest()
 
+    @staticmethod
+    def _new_document(person_id: str, data: dict = None) -> dict:
+        """按默认值生成一个项，data中已定义的字段会覆盖默认值"""
+        document = copy.deepcopy(person_info_default)
+        document["person_id"] = person_id
+
+        if data:
+            for key in document:
+                if key != "person_id" and key in data:
+                    document[key] = copy.deepcopy(data[key])
+        return document
+
     async def create_person_info(self, person_id: str, data: dict = None):
         """创建一个项"""
         if not person_id:
             logger.debug("创建失败，personid不存在")
             return
 
-        _person_info_default = copy.deepcopy(person_info_default)
-        _person_info_default["person_id"] = person_id
-
-        if data:
-            for key in _person_info_default:
-                if key != "person_id" and key in data:
-                    _person_info_default[key] = data[key]
-
-        db.person_info.insert_one(_person_info_default)
+        document = self._new_document(person_id, data)
+        await async_db.person_info.insert_one(dict(document))
+        self._cache[person_id] = document
+        self._evict()
+
+    async def _load(self, person_id: str) -> Optional[dict]:
+        """从缓存获取个人信息，未缓存时从数据库读取，同一person_id的并发读取只查询一次"""
+        if person_id in self._cache:
+            self._cache.move_to_end(person_id)
+            return self._cache[person_id]
+
+        task = self._loading.get(person_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(person_id))
+            self._loading[person_id] = task
+            # 读取完成时立即移除，不依赖等待者；等待者全部被取消时也不会留下已完成的任务
+            task.add_done_callback(lambda done: self._finish_loading(person_id, done))
+        return await asyncio.shield(task)
+
+    def _finish_loading(self, person_id: str, task: asyncio.Task) -> None:
+        if self._loading.get(person_id) is task:
+            del self._loading[person_id]
+        # 所有等待者都已取消时取回异常，避免未取回异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, person_id: str) -> Optional[dict]:
+        projection = {field: 1 for field in person_info_default}
+        projection["_id"] = 0
+        document = await async_db.person_info.find_one({"person_id": person_id}, projection)
+        # 读取期间可能已经新建了该项，以内存中的为准
+        if person_id in self._cache:
+            return self._cache[person_id]
+        self._cache[person_id] = document
+        self._evict()
+        return document
+
+    async def _load_or_create(self, person_id: str, Data: dict = None) -> dict:
+        """获取个人信息，不存在时在内存中新建，写入时整项保存"""
+        document = await self._load(person_id)
+        if document is None:
+            document = self._new_document(person_id, Data)
+            self._cache[person_id] = document
+            self._mark_dirty(person_id, document.keys())
+            logger.debug(f"更新时{person_id}不存在，已新建")
+        return document
+
+    def _mark_dirty(self, person_id: str, field_names) -> None:
+        self._dirty.setdefault(person_id, set()).update(field_names)
+        # 整个字段会被 $set 覆盖，之前记录的追加不再需要
+        pushes = self._pushes.get(person_id)
+        if pushes:
+            for field_name in field_names:
+                pushes.pop(field_name, None)
+            if not pushes:
+                del self._pushes[person_id]
+        self._schedule_flush()
+
+    def _evict(self) -> None:
+        """缓存超过上限时淘汰最久未使用且没有未写入修改的项"""
+        if len(self._cache) <= self.CACHE_SIZE:
+            return
+        for person_id in list(self._cache):
+            if len(self._cache) <= self.CACHE_SIZE:
+                break
+            if person_id not in self._dirty and person_id not in self._pushes and person_id not in self._flushing:
+                del self._cache[person_id]
 
     async def update_one_field(self, person_id: str, field_name: str, value, Data: dict = None):
         """更新某一个字段，会补全"""
@@ -80,14 +170,114 @@ class PersonInfoManager:
             logger.debug(f"更新'{field_name}'失败，未定义的字段")
             return
 
-        document = db.person_info.find_one({"person_id": person_id})
+        document = await self._load_or_create(person_id, Data)
+        document[field_name] = copy.deepcopy(value)
+        self._mark_dirty(person_id, [field_name])
 
-        if document:
-            db.person_info.update_one({"person_id": person_id}, {"$set": {field_name: value}})
-        else:
-            Data[field_name] = value
-            logger.debug(f"更新时{person_id}不存在，已新建")
-            await self.create_person_info(person_id, Data)
+    async def append_to_list_field(self, person_id: str, field_name: str, value, max_length: int, Data: dict = None):
+        """向列表字段末尾追加一个值，只保留最后max_length个，会补全
+
+        写入数据库时使用 $push 和 $slice，不需要重写整个列表
+        """
+        if not isinstance(person_info_default.get(field_name), list):
+            logger.debug(f"追加'{field_name}'失败，未定义的列表字段")
+            return
+
+        document = await self._load_or_create(person_id, Data)
+        values = document.get(field_name)
+        if not isinstance(values, list):
+            values = document[field_name] = []
+            self._mark_dirty(person_id, [field_name])
+        values.append(copy.deepcopy(value))
+        del values[:-max_length]
+
+        if field_name not in self._dirty.get(person_id, ()):
+            push = self._pushes.setdefault(person_id, {}).setdefault(field_name, {"$each": [], "$slice": -max_length})
+            push["$each"].append(copy.deepcopy(value))
+            push["$slice"] = -max_length
+            del push["$each"][:-max_length]
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._timer_task is None or self._timer_task.done():
+            self._timer_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        """把缓存中的修改合并为一次 bulk_write 写入数据库，写入失败的修改保留等待下次重试"""
+        async with self._flush_lock:
+            if not self._dirty and not self._pushes:
+                return
+            dirty, pushes = self._dirty, self._pushes
+            self._dirty, self._pushes = {}, {}
+            person_ids: List[str] = []
+            operations = []
+            for person_id in dirty.keys() | pushes.keys():
+                update = {}
+                document = self._cache.get(person_id)
+                if person_id in dirty and document is not None:
+                    update["$set"] = {field: copy.deepcopy(document.get(field)) for field in dirty[person_id]}
+                if person_id in pushes:
+                    update["$push"] = pushes[person_id]
+                if update:
+                    person_ids.append(person_id)
+                    operations.append(UpdateOne({"person_id": person_id}, update, upsert=True))
+            if not operations:
+                return
+
+            self._flushing.update(person_ids)
+            failed = []
+            try:
+                await async_db.person_info.bulk_write(operations, ordered=False)
+            except asyncio.CancelledError:
+                self._restore(person_ids, dirty, pushes)
+                raise
+            except BulkWriteError as e:
+                failed = [person_ids[error["index"]] for error in e.details.get("writeErrors", [])]
+            except PyMongoError as e:
+                logger.error(f"批量写入个人信息失败: {e}")
+                failed = person_ids
+            finally:
+                self._flushing.difference_update(person_ids)
+
+            if failed:
+                self._restore(failed, dirty, pushes)
+            logger.trace(f"写入{len(person_ids) - len(failed)}项个人信息的修改")
+
+    def _restore(self, person_ids: List[str], dirty: Dict[str, Set[str]], pushes: Dict[str, Dict[str, dict]]):
+        """把写入失败的修改放回，排在之后新产生的修改前面"""
+        for person_id in person_ids:
+            if person_id not in self._cache:
+                # 写入期间被删除
+                continue
+            for field_name, push in pushes.get(person_id, {}).items():
+                if field_name in dirty.get(person_id, ()) or field_name in self._dirty.get(person_id, ()):
+                    continue
+                current = self._pushes.setdefault(person_id, {}).setdefault(
+                    field_name, {"$each": [], "$slice": push["$slice"]}
+                )
+                current["$each"][:0] = push["$each"]
+                del current["$each"][: current["$slice"]]
+            if person_id in dirty:
+                self._mark_dirty(person_id, dirty[person_id])
+        self._schedule_flush()
+
+    async def close(self):
+        """关闭前调用，保证缓存中的修改全部写入"""
+        if self._timer_task is not None and self._timer_task is not asyncio.current_task():
+            self._timer_task.cancel()
+        for _ in range(self.CLOSE_RETRIES):
+            await self.flush()
+            if not self._dirty and not self._pushes:
+                break
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+        if self._timer_task is not None and not self._timer_task.done():
+            self._timer_task.cancel()
+        if self._dirty or self._pushes:
+            logger.error(f"关闭时仍有{len(self._dirty.keys() | self._pushes.keys())}项个人信息的修改未能写入数据库")
 
     async def del_one_document(self, person_id: str):
         """删除指定 person_id 的文档"""
@@ -95,7 +285,10 @@ class PersonInfoManager:
             logger.debug("删除失败：person_id 不能为空")
             return
 
-        result = db.person_info.delete_one({"person_id": person_id})
+        self._cache.pop(person_id, None)
+        self._dirty.pop(person_id, None)
+        self._pushes.pop(person_id, None)
+        result = await async_db.person_info.delete_one({"person_id": person_id})
         if result.deleted_count > 0:
             logger.debug(f"删除成功：person_id={person_id}")
         else:
@@ -111,10 +304,10 @@ class PersonInfoManager:
             logger.debug(f"get_value获取失败：字段'{field_name}'未定义")
             return None
 
-        document = db.person_info.find_one({"person_id": person_id}, {field_name: 1})
+        document = await self._load(person_id)
 
         if document and field_name in document:
-            return document[field_name]
+            return copy.deepcopy(document[field_name])
         else:
             default_value = copy.deepcopy(person_info_default[field_name])
             logger.trace(f"获取{person_id}的{field_name}失败，已返回默认值{default_value}")
@@ -132,10 +325,7 @@ class PersonInfoManager:
                 logger.debug(f"get_values获取失败：字段'{field}'未定义")
                 return {}
 
-        # 构建查询投影（所有字段都有效才会执行到这里）
-        projection = {field: 1 for field in field_names}
-
-        document = db.person_info.find_one({"person_id": person_id}, projection)
+        document = await self._load(person_id)
 
         result = {}
         for field in field_names:
@@ -152,13 +342,13 @@ class PersonInfoManager:
 
         try:
             # 遍历集合中的所有文档
-            for document in db.person_info.find({}):
+            async for document in async_db.person_info.find({}):
                 # 找出文档中未定义的字段
                 undefined_fields = set(document.keys()) - defined_fields - {"_id"}
 
                 if undefined_fields:
                     # 构建更新操作，使用$unset删除未定义字段
-                    update_result = db.person_info.update_one(
+                    update_result = await async_db.person_info.update_one(
                         {"_id": document["_id"]}, {"$unset": {field: 1 for field in undefined_fields}}
                     )
 
@@ -197,9 +387,14 @@ class PersonInfoManager:
             logger.error(f"字段检查失败：'{field_name}'未定义")
             return {}
 
+        # 先写入缓存中的修改，保证查询到的是最新的值
+        await self.flush()
+
         try:
             result = {}
-            for doc in db.person_info.find({field_name: {"$exists": True}}, {"person_id": 1, field_name: 1, "_id": 0}):
+            async for doc in async_db.person_info.find(
+                {field_name: {"$exists": True}}, {"person_id": 1, field_name: 1, "_id": 0}
+            ):
                 try:
                     value = doc[field_name]
                     if way(value):
@@ -1,6 +1,7 @@
 from src.plugins.config.config import global_config
 from src.plugins.chat.message import MessageRecv, MessageSending, Message
-from src.common.database import db
+from src.common.database import async_db
+from src.plugins.storage.recent_messages import recent_message_cache
 import time
 import traceback
 from typing import List
@@ -47,7 +48,7 @@ class InfoCatcher:
             "make_response_time": 0,
         }
 
-    def catch_decide_to_response(self, message: MessageRecv):
+    async def catch_decide_to_response(self, message: MessageRecv):
         # 搜集决定回复时的信息
         self.trigger_response_message = message
         self.trigger_response_text = message.detailed_plain_text
@@ -56,7 +57,7 @@ class InfoCatcher:
 
         self.chat_id = message.chat_stream.stream_id
 
-        self.chat_history = self.get_message_from_db_before_msg(message)
+        self.chat_history = await self.get_message_from_db_before_msg(message)
 
     def catch_after_observe(self, obs_duration: float):  # 这里可以有更多信息
         self.timing_results["sub_heartflow_observe_time"] = obs_duration
@@ -88,7 +89,7 @@ class InfoCatcher:
     def catch_after_generate_response(self, response_duration: float):
         self.timing_results["make_response_time"] = response_duration
 
-    def catch_after_response(
+    async def catch_after_response(
         self, response_duration: float, response_message: List[str], first_bot_msg: MessageSending
     ):
         self.timing_results["make_response_time"] = response_duration
@@ -96,11 +97,11 @@ class InfoCatcher:
         for msg in response_message:
             self.response_messages.append(msg)
 
-        self.chat_history_in_thinking = self.get_message_from_db_between_msgs(
+        self.chat_history_in_thinking = await self.get_message_from_db_between_msgs(
             self.trigger_response_message, first_bot_msg
         )
 
-    def get_message_from_db_between_msgs(self, message_start: Message, message_end: Message):
+    async def get_message_from_db_between_msgs(self, message_start: Message, message_end: Message):
         try:
             # 从数据库中获取消息的时间戳
             time_start = message_start.message_info.time
@@ -109,12 +110,9 @@ class InfoCatcher:
 
             print(f"查询参数: time_start={time_start}, time_end={time_end}, chat_id={chat_id}")
 
-            # 查询数据库，获取 chat_id 相同且时间在 start 和 end 之间的数据
-            messages_between = db.messages.find(
-                {"chat_id": chat_id, "time": {"$gt": time_start, "$lt": time_end}}
-            ).sort("time", -1)
-
-            result = list(messages_between)
+            # 获取 chat_id 相同且时间在 start 和 end 之间的数据，缓冲不完整时查询数据库
+            time_range = {"$gt": time_start, "$lt": time_end}
+            result = await recent_message_cache.find(chat_id, time_range, newest_first=True)
             print(f"查询结果数量: {len(result)}")
             if result:
                 print(f"第一条消息时间: {result[0]['time']}")
@@ -124,19 +122,14 @@ class InfoCatcher:
             print(f"获取消息时出错: {str(e)}")
             return []
 
-    def get_message_from_db_before_msg(self, message: MessageRecv):
-        # 从数据库中获取消息
-        message_id = message.message_info.message_id
+    async def get_message_from_db_before_msg(self, message: MessageRecv):
+        # 从最近消息缓冲中获取消息
+        message_time = message.message_info.time
         chat_id = message.chat_stream.stream_id
+        limit = self.context_length * 3  # 获取更多历史信息
 
-        # 查询数据库，获取 chat_id 相同且 message_id 小于当前消息的 30 条数据
-        messages_before = (
-            db.messages.find({"chat_id": chat_id, "message_id": {"$lt": message_id}})
-            .sort("time", -1)
-            .limit(self.context_length * 3)
-        )  # 获取更多历史信息
-
-        return list(messages_before)
+        # 获取 chat_id 相同且早于当前消息的数据，缓冲不完整时查询数据库
+        return await recent_message_cache.find(chat_id, {"$lt": message_time}, newest_first=True, limit=limit)
 
     def message_list_to_dict(self, message_list):
         # 存储简化的聊天记录
@@ -169,7 +162,7 @@ class InfoCatcher:
             # "detailed_plain_text": message.detailed_plain_text
         }
 
-    def done_catch(self):
+    async def done_catch(self):
         """将收集到的信息存储到数据库的 thinking_log 集合中"""
         try:
             # 将消息对象转换为可序列化的字典
@@ -200,7 +193,7 @@ class InfoCatcher:
                 thinking_log_data["mode_specific_data"] = self.reasoning_data
 
             # 将数据插入到 thinking_log 集合中
-            db.thinking_log.insert_one(thinking_log_data)
+            await async_db.thinking_log.insert_one(thinking_log_data)
 
             return True
         except Exception as e:
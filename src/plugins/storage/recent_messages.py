@@ -0,0 +1,154 @@
+import asyncio
+import bisect
+from typing import Dict, List, Optional, Tuple
+
+from .write_buffer import MessageWriteBuffer, match_time, message_write_buffer, project_message
+
+
+def _message_key(row: dict):
+    return row["time"], row["_id"]
+
+
+class RecentMessageCache:
+    """每个聊天流最近消息的内存环形缓冲
+
+    store_message 写入时同步加入，按 (time, _id) 有序保存最近 RING_SIZE 条。
+    _floors 记录每个聊天流被淘汰消息的最新时间，时间大于该值的消息都在缓冲中，
+    查询范围完全落在其中时直接从内存返回；冷启动的聊天流先从数据库预热，更早的历史回退到数据库查询。
+    同时维护时间数组和文本长度的前缀和，两个时间点之间的消息数和文本长度通过二分查找得到。
+    """
+
+    RING_SIZE = 200
+
+    def __init__(self, buffer: MessageWriteBuffer):
+        self._buffer = buffer
+        self._rings: Dict[str, List[dict]] = {}  # 聊天流ID -> 按时间正序的最近消息
+        self._floors: Dict[str, float] = {}  # 聊天流ID -> 覆盖范围的下界（不含），存在即表示已预热
+        self._times: Dict[str, List[float]] = {}  # 聊天流ID -> 与 _rings 对齐的消息时间
+        self._length_sums: Dict[str, List[int]] = {}  # 聊天流ID -> 文本长度前缀和，比 _rings 多一项
+        self._warming: Dict[str, asyncio.Task] = {}
+
+    def add(self, message_data: dict):
+        """加入一条新消息，message_data 需要已经带有 _id"""
+        chat_id = message_data["chat_id"]
+        floor = self._floors.get(chat_id, float("-inf"))
+        if message_data["time"] <= floor:
+            return
+        ring = self._rings.setdefault(chat_id, [])
+        times = self._times.setdefault(chat_id, [])
+        length_sums = self._length_sums.setdefault(chat_id, [0])
+
+        index = bisect.bisect_right(ring, _message_key(message_data), key=_message_key)
+        ring.insert(index, message_data)
+        times.insert(index, message_data["time"])
+        length = len(message_data.get("processed_plain_text") or "")
+        length_sums.insert(index + 1, length_sums[index] + length)
+        # 消息通常按时间顺序到达，只有乱序到达时才需要更新后面的前缀和
+        for i in range(index + 2, len(length_sums)):
+            length_sums[i] += length
+
+        if len(ring) > self.RING_SIZE:
+            evicted = ring.pop(0)
+            times.pop(0)
+            length_sums.pop(0)
+            if chat_id in self._floors:
+                self._floors[chat_id] = max(floor, evicted["time"])
+
+    async def _warm(self, chat_id: str):
+        """用数据库中最近的消息补全冷启动的聊天流，同一聊天流的并发查询只加载一次"""
+        task = self._warming.get(chat_id)
+        if task is None:
+            task = asyncio.create_task(self._load(chat_id))
+            self._warming[chat_id] = task
+        try:
+            await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._warming.pop(chat_id, None)
+
+    async def _load(self, chat_id: str):
+        loaded = await self._buffer.find(chat_id, newest_first=True, limit=self.RING_SIZE)
+        floor = loaded[-1]["time"] if len(loaded) >= self.RING_SIZE else float("-inf")
+        # 加载期间新加入的消息也在 _rings 中，按 _id 去重后合并
+        ring = self._rings.get(chat_id, [])
+        seen = {row["_id"] for row in ring}
+        ring.extend(row for row in loaded if row["_id"] not in seen)
+        ring.sort(key=_message_key)
+        if len(ring) > self.RING_SIZE:
+            floor = max(floor, ring[-self.RING_SIZE - 1]["time"])
+            del ring[: -self.RING_SIZE]
+        self._rings[chat_id] = ring
+        self._floors[chat_id] = floor
+        self._times[chat_id] = [row["time"] for row in ring]
+        length_sums = [0]
+        for row in ring:
+            length_sums.append(length_sums[-1] + len(row.get("processed_plain_text") or ""))
+        self._length_sums[chat_id] = length_sums
+
+    def get_cached(
+        self, chat_id: str, time_range: Optional[dict] = None, newest_first: bool = False, limit: int = 0
+    ) -> Optional[List[dict]]:
+        """只从内存中查询，返回的消息不可修改；缓冲无法保证结果完整时返回None"""
+        floor = self._floors.get(chat_id)
+        if floor is None:
+            return None
+        rows = [
+            row for row in self._rings.get(chat_id, []) if row["time"] > floor and match_time(row["time"], time_range)
+        ]
+        if newest_first:
+            rows.reverse()
+
+        time_range = time_range or {}
+        lower_covered = (
+            floor == float("-inf")
+            or ("$gt" in time_range and time_range["$gt"] >= floor)
+            or ("$gte" in time_range and time_range["$gte"] > floor)
+        )
+        # 没有下界时，倒序取最近的 limit 条也能由缓冲保证完整
+        if not lower_covered and not (newest_first and limit and len(rows) >= limit):
+            return None
+        return rows[:limit] if limit else rows
+
+    async def find(
+        self,
+        chat_id: str,
+        time_range: Optional[dict] = None,
+        projection: Optional[dict] = None,
+        newest_first: bool = False,
+        limit: int = 0,
+    ) -> List[dict]:
+        """查询一个聊天流的消息，参数与 MessageWriteBuffer.find 相同，优先从内存返回"""
+        if chat_id not in self._floors:
+            await self._warm(chat_id)
+        rows = self.get_cached(chat_id, time_range, newest_first, limit)
+        if rows is None:
+            return await self._buffer.find(chat_id, time_range, projection, newest_first, limit)
+        return [project_message(row, projection) for row in rows]
+
+    async def count_between(self, chat_id: str, start_time: float, end_time: float) -> Optional[Tuple[int, int]]:
+        """按 count_messages_between 的规则统计两个时间点之间的消息数量和文本总长度
+
+        以 start_time 前最新的一条消息为起点、end_time 前最新的一条消息为终点，
+        统计两者时间之间（含两端）的消息，数量不计起点本身。缓冲无法保证结果正确时返回None。
+        """
+        if chat_id not in self._floors:
+            await self._warm(chat_id)
+        floor = self._floors[chat_id]
+        times = self._times.get(chat_id, [])
+        length_sums = self._length_sums.get(chat_id, [0])
+
+        start_index = bisect.bisect_right(times, start_time) - 1
+        end_index = bisect.bisect_right(times, end_time) - 1
+        if start_index < 0 or times[start_index] <= floor:
+            # 起点消息不在缓冲中，没有被淘汰过的聊天流说明起点之前确实没有消息
+            return (0, 0) if floor == float("-inf") and start_index < 0 else None
+        if times[end_index] == times[start_index]:
+            return 0, 0
+
+        low = bisect.bisect_left(times, times[start_index])
+        high = end_index + 1
+        return high - low - 1, length_sums[high] - length_sums[low]
+
+
+# 每个聊天流最近消息的内存缓冲，读取最近消息时优先使用
+recent_message_cache = RecentMessageCache(message_write_buffer)
@@ -1,9 +1,11 @@
 import re
 from typing import Union
 
-from ...common.database import db
+from ...common.database import async_db
 from ..chat.message import MessageSending, MessageRecv
 from ..chat.chat_stream import ChatStream
+from .recent_messages import recent_message_cache
+from .write_buffer import message_write_buffer
 from src.common.logger import get_module_logger
 
 logger = get_module_logger("message_storage")
@@ -11,7 +13,7 @@ logger = get_module_logger("message_storage")
 
 class MessageStorage:
     async def store_message(self, message: Union[MessageSending, MessageRecv], chat_stream: ChatStream) -> None:
-        """存储消息到数据库"""
+        """存储消息到数据库，消息先进入写缓冲，由 message_write_buffer 批量写入，同时加入最近消息缓冲"""
         try:
             # 莫越权 救世啊
             pattern = r"<MainRule>.*?</MainRule>|<schedule>.*?</schedule>|<UserMessage>.*?</UserMessage>"
@@ -39,14 +41,15 @@ class MessageStorage:
                 "detailed_plain_text": filtered_detailed_plain_text,
                 "memorized_times": message.memorized_times,
             }
-            db.messages.insert_one(message_data)
+            message_write_buffer.add(message_data)
+            recent_message_cache.add(message_data)
         except Exception:
             logger.exception("存储消息失败")
 
     async def store_recalled_message(self, message_id: str, time: str, chat_stream: ChatStream) -> None:
         """存储撤回消息到数据库"""
-        if "recalled_messages" not in db.list_collection_names():
-            db.create_collection("recalled_messages")
+        if "recalled_messages" not in await async_db.list_collection_names():
+            await async_db.create_collection("recalled_messages")
         else:
             try:
                 message_data = {
@@ -54,14 +57,14 @@ class MessageStorage:
                     "time": time,
                     "stream_id": chat_stream.stream_id,
                 }
-                db.recalled_messages.insert_one(message_data)
+                await async_db.recalled_messages.insert_one(message_data)
             except Exception:
                 logger.exception("存储撤回消息失败")
 
     async def remove_recalled_message(self, time: str) -> None:
         """删除撤回消息"""
         try:
-            db.recalled_messages.delete_many({"time": {"$lt": time - 300}})
+            await async_db.recalled_messages.delete_many({"time": {"$lt": time - 300}})
         except Exception:
             logger.exception("删除撤回消息失败")
 
@@ -0,0 +1,85 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from bson import ObjectId
+
+from src.plugins.storage import write_buffer
+from src.plugins.storage.write_buffer import MessageWriteBuffer, match_time, project_message
+
+
+class FakeCursor:
+    def __init__(self, rows, projection):
+        self.rows = rows
+        self.projection = projection
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.rows.sort(key=lambda row: row[key], reverse=direction == -1)
+        return self
+
+    def limit(self, limit):
+        self.rows = self.rows[:limit]
+        return self
+
+    async def to_list(self):
+        # 与 Mongo 一样先排序再按投影返回字段
+        return [project_message(row, self.projection) for row in self.rows]
+
+
+class FakeMessages:
+    def __init__(self):
+        self.rows = []
+
+    async def insert_many(self, rows, ordered=True):
+        self.rows.extend(dict(row) for row in rows)
+
+    def find(self, query, projection=None):
+        rows = [
+            row
+            for row in self.rows
+            if row["chat_id"] == query["chat_id"] and match_time(row["time"], query.get("time"))
+        ]
+        return FakeCursor(rows, projection)
+
+
+class TestMessageWriteBufferFind(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.messages = FakeMessages()
+        patcher = mock.patch.object(write_buffer, "async_db", SimpleNamespace(messages=self.messages))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = MessageWriteBuffer()
+        self.addAsyncCleanup(self.buffer.close)
+
+        # 一条已写入数据库的消息和两条仍在写缓冲中的消息
+        self.messages.rows.append(
+            {"_id": ObjectId(), "chat_id": "chat", "time": 1.0, "processed_plain_text": "a", "user_info": {"id": 1}}
+        )
+        for msg_time, text in ((3.0, "c"), (2.0, "b")):
+            self.buffer.add({"chat_id": "chat", "time": msg_time, "processed_plain_text": text, "user_info": {"id": 2}})
+
+    async def test_find_with_projection_merges_pending_rows(self):
+        rows = await self.buffer.find("chat", projection={"processed_plain_text": 1})
+
+        self.assertEqual([row["processed_plain_text"] for row in rows], ["a", "b", "c"])
+        for row in rows:
+            self.assertEqual(set(row), {"_id", "processed_plain_text"})
+
+    async def test_find_with_id_projection_newest_first(self):
+        rows = await self.buffer.find("chat", {"$gt": 1.0}, projection={"_id": 1}, newest_first=True, limit=1)
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(set(rows[0]), {"_id"})
+        self.assertEqual(rows[0]["_id"], self.buffer._unflushed["chat"][0]["_id"])
+
+    async def test_find_without_projection_returns_copies(self):
+        rows = await self.buffer.find("chat")
+
+        self.assertEqual([row["time"] for row in rows], [1.0, 2.0, 3.0])
+        rows[1]["processed_plain_text"] = "changed"
+        self.assertEqual(self.buffer._unflushed["chat"][1]["processed_plain_text"], "b")
+
+
+if __name__ == "__main__":
+    unittest.main()
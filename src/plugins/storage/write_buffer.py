@@ -0,0 +1,192 @@
+import asyncio
+import operator
+import time
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from src.common.logger import get_module_logger
+from ...common.database import async_db
+
+logger = get_module_logger("message_write_buffer")
+
+_TIME_OPERATORS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def match_time(value: float, time_range: Optional[dict]) -> bool:
+    """判断时间戳是否满足 {"$gt": t} 形式的条件"""
+    if not time_range:
+        return True
+    return all(_TIME_OPERATORS[op](value, bound) for op, bound in time_range.items())
+
+
+def project_message(row: dict, projection: Optional[dict]) -> dict:
+    """按数据库投影的规则复制消息中的字段"""
+    if not projection:
+        return dict(row)
+    return {key: value for key, value in row.items() if key == "_id" or projection.get(key)}
+
+
+class MessageWriteBuffer:
+    """messages 集合的写缓冲
+
+    消息先进入内存队列，攒够 FLUSH_BATCH_SIZE 条或等待 FLUSH_INTERVAL 秒后用一次 insert_many 写入。
+    _id 在入队时生成，与直接插入时一样保持写入顺序；写入确认前消息按聊天流保存在内存中，
+    读取消息时通过 find 把数据库结果与尚未写入的消息合并，不会漏掉刚收到的消息。
+    """
+
+    FLUSH_BATCH_SIZE = 64
+    FLUSH_INTERVAL = 1.0  # 最早一条未写入消息的最长等待时间（秒）
+    LATENCY_WINDOW = 100  # 统计最近多少次写入的耗时
+    CLOSE_RETRIES = 3  # 关闭时写入失败的重试次数
+
+    def __init__(self):
+        self._queue: List[dict] = []
+        self._unflushed: Dict[str, List[dict]] = {}  # 聊天流ID -> 尚未确认写入的消息
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._timer_task: Optional[asyncio.Task] = None
+        self.max_queue_depth = 0
+        self.flushed_messages = 0
+        self.failed_flushes = 0
+        self._flush_latencies: List[float] = []
+
+    def add(self, message_data: dict):
+        """把一条消息加入写队列，必须在事件循环中调用"""
+        message_data.setdefault("_id", ObjectId())
+        self._queue.append(message_data)
+        self._unflushed.setdefault(message_data["chat_id"], []).append(message_data)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+
+        if len(self._queue) >= self.FLUSH_BATCH_SIZE:
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self.flush())
+        elif self._timer_task is None or self._timer_task.done():
+            self._timer_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        """把队列中的消息全部写入数据库，写入失败的消息留在队列中等待下次重试"""
+        async with self._flush_lock:
+            while self._queue:
+                batch = self._queue[: self.FLUSH_BATCH_SIZE]
+                del self._queue[: len(batch)]
+                start = time.perf_counter()
+                failed = []
+                try:
+                    await async_db.messages.insert_many(batch, ordered=False)
+                except asyncio.CancelledError:
+                    # 被取消时这一批可能没有写入，放回队列由 close 或下次写入重试
+                    self._queue[:0] = batch
+                    raise
+                except BulkWriteError as e:
+                    # 重复的 _id 说明上次重试时已经写入，其余错误的消息放回队列
+                    failed = [
+                        batch[error["index"]]
+                        for error in e.details.get("writeErrors", [])
+                        if error.get("code") != 11000
+                    ]
+                except PyMongoError as e:
+                    logger.error(f"批量写入消息失败: {e}")
+                    failed = batch
+                self._record_flush(len(batch) - len(failed), time.perf_counter() - start)
+                failed_ids = {id(row) for row in failed}
+                self._forget([row for row in batch if id(row) not in failed_ids])
+
+                if failed:
+                    self.failed_flushes += 1
+                    self._queue[:0] = failed
+                    if self._timer_task is None or self._timer_task.done():
+                        self._timer_task = asyncio.create_task(self._flush_later())
+                    break
+
+    async def close(self):
+        """关闭前调用，保证队列中的消息全部写入"""
+        for task in (self._timer_task, self._flush_task):
+            if task is not None and task is not asyncio.current_task() and not task.done():
+                task.cancel()
+        for _ in range(self.CLOSE_RETRIES):
+            await self.flush()
+            if not self._queue:
+                break
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+        if self._timer_task is not None and not self._timer_task.done():
+            self._timer_task.cancel()
+        if self._queue:
+            logger.error(f"关闭时仍有{len(self._queue)}条消息未能写入数据库")
+
+    def _forget(self, rows: List[dict]):
+        """写入成功后从未写入列表中移除"""
+        written = {id(row) for row in rows}
+        for chat_id in {row["chat_id"] for row in rows}:
+            remaining = [row for row in self._unflushed.get(chat_id, []) if id(row) not in written]
+            if remaining:
+                self._unflushed[chat_id] = remaining
+            else:
+                self._unflushed.pop(chat_id, None)
+
+    def _record_flush(self, count: int, elapsed: float):
+        self.flushed_messages += count
+        self._flush_latencies.append(elapsed * 1000)
+        if len(self._flush_latencies) > self.LATENCY_WINDOW:
+            del self._flush_latencies[0]
+
+    async def find(
+        self,
+        chat_id: str,
+        time_range: Optional[dict] = None,
+        projection: Optional[dict] = None,
+        newest_first: bool = False,
+        limit: int = 0,
+    ) -> List[dict]:
+        """查询一个聊天流的消息，包含尚未写入数据库的消息
+
+        Args:
+            chat_id: 聊天流ID
+            time_range: time 字段的条件，如 {"$gt": t}，支持 $gt/$gte/$lt/$lte
+            projection: 需要返回的字段
+            newest_first: 是否按时间倒序排列，否则按时间正序
+            limit: 最多返回多少条，0 表示不限制
+
+        Returns:
+            List[dict]: 按时间（相同时按写入顺序）排列的消息
+        """
+        query = {"chat_id": chat_id}
+        if time_range:
+            query["time"] = time_range
+        # 合并排序需要 time 和 _id，查询时总是带上，最后再按调用方的投影裁剪
+        query_projection = {**projection, "time": 1, "_id": 1} if projection else None
+        direction = -1 if newest_first else 1
+        cursor = async_db.messages.find(query, query_projection).sort([("time", direction), ("_id", direction)])
+        if limit:
+            cursor = cursor.limit(limit)
+        messages = await cursor.to_list()
+
+        pending = [row for row in self._unflushed.get(chat_id, []) if match_time(row["time"], time_range)]
+        if pending:
+            # 正在写入的消息可能已经出现在查询结果中
+            seen = {msg["_id"] for msg in messages}
+            messages.extend(row for row in pending if row["_id"] not in seen)
+            messages.sort(key=lambda msg: (msg["time"], msg["_id"]), reverse=newest_first)
+            if limit:
+                messages = messages[:limit]
+        return [project_message(msg, projection) for msg in messages]
+
+    def stats(self) -> dict:
+        latencies = self._flush_latencies
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_queue_depth,
+            "flushed_messages": self.flushed_messages,
+            "failed_flushes": self.failed_flushes,
+            "avg_flush_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+            "max_flush_ms": max(latencies, default=0.0),
+        }
+
+
+# 全局消息写缓冲
+message_write_buffer = MessageWriteBuffer()
@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from src.common.logger import get_module_logger
+from .timer_calculater import Timer
+
+logger = get_module_logger("pipeline")
+
+
+class StageGraph:
+    """
+    按依赖关系并发执行的阶段图
+
+    每个阶段声明依赖的阶段，依赖的结果按声明顺序作为参数传入，互不依赖的阶段同时运行。
+    阶段只能依赖已添加的阶段，因此不会出现环。每个阶段的耗时（不含等待依赖的时间）记录到 timing_results 中。
+    任一阶段抛出异常时取消其余阶段并向上抛出，需要容错的阶段应自行捕获异常并返回默认值。
+
+    使用方式：
+    graph = StageGraph(timing_results)
+    graph.add("观察", observe)
+    graph.add("工具", use_tool)
+    graph.add("思考", think, requires=("观察", "工具"))  # think(observe_result, tool_result)
+    results = await graph.run()
+    """
+
+    def __init__(self, timing_results: Optional[Dict[str, float]] = None):
+        self.timing_results = timing_results
+        self._stages: Dict[str, tuple] = {}  # 阶段名 -> (协程函数, 依赖的阶段名)
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], requires: Iterable[str] = ()) -> None:
+        """添加一个阶段"""
+        if name in self._stages:
+            raise ValueError(f"阶段 {name} 已存在")
+        requires = tuple(requires)
+        for dependency in requires:
+            if dependency not in self._stages:
+                raise ValueError(f"阶段 {name} 依赖的阶段 {dependency} 尚未添加")
+        self._stages[name] = (func, requires)
+
+    async def run(self) -> Dict[str, Any]:
+        """运行所有阶段，返回 阶段名 -> 结果"""
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str, func: Callable[..., Awaitable[Any]], requires: tuple):
+            args = [await tasks[dependency] for dependency in requires]
+            with Timer(name, self.timing_results):
+                return await func(*args)
+
+        for name, (func, requires) in self._stages.items():
+            tasks[name] = asyncio.create_task(run_stage(name, func, requires))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+
+class BackgroundTaskQueue:
+    """
+    后台任务队列
+
+    同一个键（如聊天流ID）的任务按提交顺序依次执行，不同键之间并发执行，
+    用于把不影响本次回复的收尾工作移出回复的关键路径。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tails: Dict[str, asyncio.Task] = {}  # 键 -> 该键最后提交的任务
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, key: str, job: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """提交一个任务，在同一个键之前提交的任务完成后执行"""
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._run(key, previous, job))
+        self._tails[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, key: str, previous: Optional[asyncio.Task], job: Callable[[], Awaitable[Any]]):
+        try:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"{self.name}任务执行失败")
+        finally:
+            if self._tails.get(key) is asyncio.current_task():
+                del self._tails[key]
+
+    def pending_count(self) -> int:
+        """尚未完成的任务数"""
+        return len(self._tasks)
+
+    async def close(self, timeout: float = 30):
+        """等待已提交的任务完成，超时后取消剩余任务"""
+        if not self._tasks:
+            return
+        logger.info(f"等待{len(self._tasks)}个{self.name}任务完成")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)}个{self.name}任务未能在{timeout}秒内完成，已取消")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+# 回复后的收尾工作（回复后脑内状态更新、表情包、思考日志记录），按聊天流依次执行
+post_reply_queue = BackgroundTaskQueue("回复后处理")
+
+# 不影响调用方结果的数据库写入（token使用记录、embedding缓存），按集合依次执行
+db_write_queue = BackgroundTaskQueue("后台数据库写入")
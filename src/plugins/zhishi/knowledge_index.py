@@ -0,0 +1,341 @@
+import asyncio
+import json
+import os
+import threading
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from bson import ObjectId
+
+from src.common.database import db
+from src.common.logger import get_module_logger
+
+logger = get_module_logger("knowledge_index")
+
+
+class _Snapshot(NamedTuple):
+    """查询使用的只读索引快照，同步线程每追加一批知识或重新训练后整体替换"""
+
+    matrix: Optional[np.ndarray]
+    ids: List[ObjectId]
+    dim: int
+    centroids: Optional[np.ndarray]
+    ivf_lists: List[np.ndarray]
+
+
+_EMPTY_SNAPSHOT = _Snapshot(None, [], 0, None, [])
+
+
+class KnowledgeIndex:
+    """knowledges 集合的本地向量索引
+
+    所有知识的embedding按行归一化后以 float32 追加写入 data/knowledge_index/vectors.f32，
+    查询时通过内存映射读取，余弦相似度即为矩阵与查询向量的点积。
+    知识库只会追加或整体清空，索引按 _id 顺序增量同步新知识，数量对不上时整体重建。
+    知识较多时可以开启 IVF 近似检索，只计算与查询最接近的若干个聚类中的向量。
+
+    与数据库同步、重建和 IVF 训练都在后台线程中进行并由锁串行化，
+    查询只读取最近一次发布的快照，不会阻塞事件循环。
+    """
+
+    INDEX_DIR = os.path.join("data", "knowledge_index")
+    ID_SIZE = 12  # ObjectId 的字节数
+    SYNC_INTERVAL = 30  # 后台与数据库同步的间隔（秒）
+    SYNC_BATCH = 1024
+    IVF_MIN_SIZE = 4096  # 知识数量少于此值时总是精确检索
+    IVF_TRAIN_SAMPLE = 50000
+    IVF_TRAIN_ITER = 10
+
+    def __init__(self):
+        self.dim = 0
+        self.count = 0
+        self.skipped = 0  # 数据库中维度不符、未被索引的知识数
+        self.matrix: Optional[np.ndarray] = None
+        self.ids: List[ObjectId] = []
+        self.persist = False
+        self.use_ivf = False
+        self.nprobe = 8
+        self.centroids: Optional[np.ndarray] = None
+        self.ivf_lists: List[np.ndarray] = []
+        self.ivf_trained_count = 0
+        self._loaded = False
+        self._snapshot = _EMPTY_SNAPSHOT
+        self._sync_lock = threading.Lock()
+
+    @property
+    def _vector_path(self):
+        return os.path.join(self.INDEX_DIR, "vectors.f32")
+
+    @property
+    def _id_path(self):
+        return os.path.join(self.INDEX_DIR, "ids.bin")
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.INDEX_DIR, "meta.json")
+
+    def initialize(self, use_ivf: bool = False, nprobe: int = 8):
+        """在主程序启动时调用：加载磁盘上的索引并与数据库同步，之后的增量会写回磁盘"""
+        with self._sync_lock:
+            self.persist = True
+            self.use_ivf = use_ivf
+            self.nprobe = nprobe
+            os.makedirs(self.INDEX_DIR, exist_ok=True)
+            self._load()
+        self.sync()
+        logger.success(f"知识库向量索引加载完成，共{self.count}条知识")
+
+    async def start_periodic_sync(self):
+        """定期在线程中与数据库同步，追加新导入的知识"""
+        while True:
+            await asyncio.sleep(self.SYNC_INTERVAL)
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception:
+                logger.exception("知识库向量索引同步失败")
+
+    def _load(self):
+        """从磁盘加载索引，只读取元数据中记录的行数，忽略未写完的尾部"""
+        self._loaded = True
+        self.matrix = None
+        self.ids = []
+        self.dim = self.count = self.skipped = 0
+        self._reset_ivf()
+        if not os.path.exists(self._meta_path):
+            return
+
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            dim, count = meta["dim"], meta["count"]
+            if count > 0:
+                with open(self._id_path, "rb") as f:
+                    id_bytes = f.read(count * self.ID_SIZE)
+                self.matrix = np.memmap(self._vector_path, dtype=np.float32, mode="r", shape=(count, dim))
+                self.ids = [ObjectId(id_bytes[i : i + self.ID_SIZE]) for i in range(0, len(id_bytes), self.ID_SIZE)]
+            self.dim, self.count, self.skipped = dim, count, meta.get("skipped", 0)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"知识库向量索引损坏，将重新构建: {e}")
+            self.matrix = None
+            self.ids = []
+            self.dim = self.count = self.skipped = 0
+        self._publish()
+
+    def _publish(self):
+        """把当前索引发布为查询使用的快照"""
+        self._snapshot = _Snapshot(self.matrix, self.ids, self.dim, self.centroids, list(self.ivf_lists))
+
+    def _write_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": self.count, "skipped": self.skipped}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _append(self, docs: list):
+        """把一批知识追加到索引末尾"""
+        ids, rows = [], []
+        for doc in docs:
+            embedding = doc.get("embedding")
+            if not embedding:
+                self.skipped += 1
+                continue
+            if not self.dim:
+                self.dim = len(embedding)
+            if len(embedding) != self.dim:
+                self.skipped += 1
+                continue
+            ids.append(doc["_id"])
+            rows.append(embedding)
+        if not rows:
+            return
+
+        vectors = np.asarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        vectors /= norms
+
+        start = self.count
+        if self.persist:
+            # 先释放内存映射再追加写入，写完后以新的行数重新映射
+            self.matrix = None
+            with open(self._vector_path, "ab") as f:
+                f.truncate(start * self.dim * 4)
+                f.write(vectors.tobytes())
+            with open(self._id_path, "ab") as f:
+                f.truncate(start * self.ID_SIZE)
+                f.write(b"".join(oid.binary for oid in ids))
+            self.count += len(ids)
+            self._write_meta()
+            self.matrix = np.memmap(self._vector_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        else:
+            self.matrix = vectors if self.matrix is None else np.vstack([self.matrix, vectors])
+            self.count += len(ids)
+        self.ids.extend(ids)
+
+        if self.centroids is not None:
+            self._assign_ivf(start)
+        self._publish()
+
+    def rebuild(self):
+        """丢弃现有索引，从数据库重新构建，需持有同步锁"""
+        # 重建期间查询返回空结果，并释放快照对旧文件的引用
+        self._snapshot = _EMPTY_SNAPSHOT
+        self.matrix = None
+        self.ids = []
+        self.dim = self.count = self.skipped = 0
+        self._reset_ivf()
+        if self.persist:
+            for path in (self._vector_path, self._id_path, self._meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        batch = []
+        for doc in db.knowledges.find({}, {"embedding": 1}).sort("_id", 1):
+            batch.append(doc)
+            if len(batch) >= self.SYNC_BATCH:
+                self._append(batch)
+                batch = []
+        self._append(batch)
+        if self.persist:
+            self._write_meta()
+        logger.info(f"知识库向量索引已重建，共{self.count}条知识，跳过{self.skipped}条")
+
+    def sync(self):
+        """与数据库同步，追加新导入的知识；知识被删除或无法增量对齐时整体重建
+
+        会读取数据库并进行矩阵运算，在事件循环中应通过 asyncio.to_thread 调用
+        """
+        with self._sync_lock:
+            if not self._loaded:
+                self._load()
+            self._sync()
+            self._maybe_train_ivf()
+
+    def _sync(self):
+        db_count = db.knowledges.estimated_document_count()
+        if db_count == self.count + self.skipped:
+            return
+        if db_count < self.count + self.skipped:
+            self.rebuild()
+            return
+
+        query = {"_id": {"$gt": self.ids[-1]}} if self.ids else {}
+        batch = []
+        for doc in db.knowledges.find(query, {"embedding": 1}).sort("_id", 1):
+            batch.append(doc)
+            if len(batch) >= self.SYNC_BATCH:
+                self._append(batch)
+                batch = []
+        self._append(batch)
+        if self.persist:
+            self._write_meta()
+
+        if db_count != self.count + self.skipped:
+            self.rebuild()
+        else:
+            logger.debug(f"知识库向量索引已同步，共{self.count}条知识")
+
+    def _maybe_train_ivf(self):
+        """知识数量达到阈值时训练聚类，数量翻倍后重新训练，保证聚类仍然均衡"""
+        if not self.use_ivf or self.count < self.IVF_MIN_SIZE:
+            return
+        if self.centroids is None or self.count > 2 * self.ivf_trained_count:
+            self._train_ivf()
+            self._publish()
+
+    def _reset_ivf(self):
+        self.centroids = None
+        self.ivf_lists = []
+        self.ivf_trained_count = 0
+
+    def _train_ivf(self):
+        """用球面 k-means 训练聚类中心，并把所有向量分配到最近的中心"""
+        nlist = max(1, int(np.sqrt(self.count)))
+        rng = np.random.default_rng(0)
+        sample_size = min(self.count, self.IVF_TRAIN_SAMPLE)
+        sample = np.asarray(self.matrix[np.sort(rng.choice(self.count, sample_size, replace=False))])
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.IVF_TRAIN_ITER):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    center = members.sum(axis=0)
+                    norm = np.linalg.norm(center)
+                    if norm > 0:
+                        centroids[c] = center / norm
+
+        self.centroids = centroids
+        self.ivf_lists = [np.zeros(0, dtype=np.int64) for _ in range(nlist)]
+        self._assign_ivf(0)
+        self.ivf_trained_count = self.count
+        logger.debug(f"知识库向量索引 IVF 训练完成，{nlist}个聚类")
+
+    def _assign_ivf(self, start: int):
+        """把第 start 行之后的向量分配到最近的聚类"""
+        for chunk_start in range(start, self.count, self.SYNC_BATCH * 16):
+            chunk_end = min(self.count, chunk_start + self.SYNC_BATCH * 16)
+            assignment = np.argmax(np.asarray(self.matrix[chunk_start:chunk_end]) @ self.centroids.T, axis=1)
+            for c in np.unique(assignment):
+                rows = chunk_start + np.flatnonzero(assignment == c)
+                self.ivf_lists[c] = np.concatenate([self.ivf_lists[c], rows])
+
+    def _candidate_rows(self, snapshot: _Snapshot, query: np.ndarray) -> Optional[np.ndarray]:
+        """IVF 模式下返回需要计算的行号，精确模式或聚类尚未训练时返回None"""
+        if not self.use_ivf or snapshot.centroids is None or len(snapshot.matrix) < self.IVF_MIN_SIZE:
+            return None
+        probe = np.argsort(-(snapshot.centroids @ query))[: self.nprobe]
+        return np.sort(np.concatenate([snapshot.ivf_lists[c] for c in probe]))
+
+    def search(self, query_embedding: list, limit: int = 5, threshold: float = 0.0, projection: dict = None) -> list:
+        """查询与向量最相似的知识
+
+        Args:
+            query_embedding: 查询的嵌入向量
+            limit: 最大返回结果数
+            threshold: 相似度阈值
+            projection: 需要从数据库读取的字段，默认只读取 content
+
+        Returns:
+            list: 知识文档列表，带有 similarity 字段，按相似度从高到低排列
+        """
+        if not self._loaded:
+            # 未经 initialize 加载（如单独运行的脚本）时先同步一次
+            self.sync()
+        snapshot = self._snapshot
+        if snapshot.matrix is None or not len(snapshot.matrix) or not query_embedding:
+            return []
+        if len(query_embedding) != snapshot.dim:
+            logger.warning(f"查询向量维度{len(query_embedding)}与知识库向量维度{snapshot.dim}不一致")
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query /= norm
+
+        rows = self._candidate_rows(snapshot, query)
+        scores = (snapshot.matrix if rows is None else snapshot.matrix[rows]) @ query
+        matched = np.flatnonzero(scores >= threshold)
+        if matched.size > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        scores = scores[matched]
+        if rows is not None:
+            matched = rows[matched]
+
+        top_ids = [snapshot.ids[i] for i in matched]
+        docs = {doc["_id"]: doc for doc in db.knowledges.find({"_id": {"$in": top_ids}}, projection or {"content": 1})}
+        results = []
+        for oid, score in zip(top_ids, scores.tolist(), strict=True):
+            doc = docs.get(oid)
+            if doc is not None:
+                doc["similarity"] = score
+                results.append(doc)
+        return results
+
+
+# 全局知识库向量索引
+knowledge_index = KnowledgeIndex()
@@ -80,6 +80,26 @@ class KnowledgeLibrary:
 
         return response.json()["data"][0]["embedding"]
 
+    def get_embeddings(self, texts: list, batch_size: int = 32) -> list:
+        """批量获取多条文本的embedding向量，返回值与texts一一对应，失败的位置为None"""
+        url = "https://api.siliconflow.cn/v1/embeddings"
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        embeddings = [None] * len(texts)
+
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start : start + batch_size]
+            payload = {"model": "BAAI/bge-m3", "input": batch, "encoding_format": "float"}
+            response = requests.post(url, json=payload, headers=headers)
+            if response.status_code != 200:
+                print(f"批量获取embedding失败({start}-{start + len(batch) - 1}): {response.text}")
+                continue
+
+            # 按返回的 index 还原顺序
+            for k, item in enumerate(response.json()["data"]):
+                embeddings[start + item.get("index", k)] = item["embedding"]
+
+        return embeddings
+
     def process_files(self, knowledge_length: int = 512):
         """处理raw_info目录下的所有txt文件"""
         txt_files = [f for f in os.listdir(self.raw_info_dir) if f.endswith(".txt")]
@@ -117,18 +137,21 @@ class KnowledgeLibrary:
             content = self.read_file(file_path)
             chunks = self.split_content(content, knowledge_length)
 
-            for chunk in tqdm(chunks, desc=f"处理 {os.path.basename(file_path)} 的文本块", leave=False):
-                embedding = self.get_embedding(chunk)
-                if embedding:
-                    knowledge = {
-                        "content": chunk,
-                        "embedding": embedding,
-                        "source_file": file_path,
-                        "split_length": knowledge_length,
-                        "created_at": datetime.now(),
-                    }
-                    db.knowledges.insert_one(knowledge)
-                    result["chunks_processed"] += 1
+            embeddings = self.get_embeddings(chunks)
+            knowledges = [
+                {
+                    "content": chunk,
+                    "embedding": embedding,
+                    "source_file": file_path,
+                    "split_length": knowledge_length,
+                    "created_at": datetime.now(),
+                }
+                for chunk, embedding in zip(chunks, embeddings, strict=True)
+                if embedding
+            ]
+            if knowledges:
+                db.knowledges.insert_many(knowledges)
+                result["chunks_processed"] += len(knowledges)
 
             split_by = processed_record.get("split_by", []) if processed_record else []
             if knowledge_length not in split_by:
@@ -195,54 +218,12 @@ class KnowledgeLibrary:
         if not query_embedding:
             return []
 
-        # 使用余弦相似度计算
-        pipeline = [
-            {
-                "$addFields": {
-                    "dotProduct": {
-                        "$reduce": {
-                            "input": {"$range": [0, {"$size": "$embedding"}]},
-                            "initialValue": 0,
-                            "in": {
-                                "$add": [
-                                    "$$value",
-                                    {
-                                        "$multiply": [
-                                            {"$arrayElemAt": ["$embedding", "$$this"]},
-                                            {"$arrayElemAt": [query_embedding, "$$this"]},
-                                        ]
-                                    },
-                                ]
-                            },
-                        }
-                    },
-                    "magnitude1": {
-                        "$sqrt": {
-                            "$reduce": {
-                                "input": "$embedding",
-                                "initialValue": 0,
-                                "in": {"$add": ["$$value", {"$multiply": ["$$this", "$$this"]}]},
-                            }
-                        }
-                    },
-                    "magnitude2": {
-                        "$sqrt": {
-                            "$reduce": {
-                                "input": query_embedding,
-                                "initialValue": 0,
-                                "in": {"$add": ["$$value", {"$multiply": ["$$this", "$$this"]}]},
-                            }
-                        }
-                    },
-                }
-            },
-            {"$addFields": {"similarity": {"$divide": ["$dotProduct", {"$multiply": ["$magnitude1", "$magnitude2"]}]}}},
-            {"$sort": {"similarity": -1}},
-            {"$limit": limit},
-            {"$project": {"content": 1, "similarity": 1, "file_path": 1}},
-        ]
-
-        results = list(db.knowledges.aggregate(pipeline))
+        # 使用本地向量索引计算余弦相似度，在这里导入以免导入脚本时加载整个插件包
+        from src.plugins.zhishi.knowledge_index import knowledge_index
+
+        results = knowledge_index.search(
+            query_embedding, limit=limit, threshold=-1.0, projection={"content": 1, "source_file": 1}
+        )
         return results
 
 